@@ -52,6 +52,7 @@ EXCLUDES=(
   --exclude 'build/'                     # frontend build outputs (rebuilt on VPS)
   --exclude 'dist/'
   --exclude 'ielts-practice-backend/static/'   # uploaded media — prod owns this
+  --exclude 'ielts-practice-backend/media/listening_audio/'   # private listening audio — prod owns this
   --exclude 'mysql/'                     # DB data dir
   --exclude 'dump.rdb'
   --exclude 'nginx/'                     # live SSL certs + prod nginx config — VPS owns this
@@ -0,0 +1,34 @@
+"""writing answer updated_at microseconds
+
+Revision ID: a7b8c9d0e1f2
+Revises: f6a7b8c9d0e1
+Create Date: 2026-10-19 20:00:00.000000
+
+The writing draft flusher (app/utils/writing_drafts.py) only overwrites a
+writing_answers row whose updated_at is older than the draft it is writing,
+so a submit that commits while a flush is in flight keeps the final essay.
+With whole seconds a submit in the same second as the last draft would
+compare as older than it; DATETIME(6) keeps the order exact.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7b8c9d0e1f2'
+down_revision: Union[str, None] = 'f6a7b8c9d0e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.alter_column('writing_answers', 'updated_at',
+                    existing_type=sa.DateTime(), type_=mysql.DATETIME(fsp=6), existing_nullable=True)
+
+
+def downgrade() -> None:
+    op.alter_column('writing_answers', 'updated_at',
+                    existing_type=mysql.DATETIME(fsp=6), type_=sa.DateTime(), existing_nullable=True)
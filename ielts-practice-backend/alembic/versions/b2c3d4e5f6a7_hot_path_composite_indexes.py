@@ -0,0 +1,61 @@
+"""hot path composite indexes
+
+Revision ID: b2c3d4e5f6a7
+Revises: a1b2c3d4e5f6
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b2c3d4e5f6a7'
+down_revision: Union[str, None] = 'a1b2c3d4e5f6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDEXES = [
+    ('ix_exam_results_user_exam_forecast', 'exam_results', ['user_id', 'exam_id', 'is_forecast', 'forecast_part'], {}),
+    ('ix_listening_answers_result_question', 'listening_answers', ['result_id', 'question_id'], {}),
+    ('ix_listening_answers_exam_user', 'listening_answers', ['exam_id', 'user_id'], {}),
+    ('ix_student_answers_result_question', 'student_answers', ['result_id', 'question_id'], {}),
+    ('ix_writing_answers_task_user', 'writing_answers', ['task_id', 'user_id'], {}),
+    ('ix_user_sessions_user_active', 'user_sessions', ['user_id', 'is_active'], {}),
+    ('ix_user_sessions_token_active', 'user_sessions', ['session_token', 'is_active'], {}),
+    ('ix_login_cooldowns_user_end', 'login_cooldowns', ['user_id', 'cooldown_end'], {}),
+    ('ix_login_cooldowns_end', 'login_cooldowns', ['cooldown_end'], {}),
+    ('ix_exam_sections_exam_type_order', 'exam_sections', ['exam_id', 'section_type', 'order_number'], {}),
+    # question_type is TEXT: index a prefix of it
+    ('ix_questions_section_type', 'questions', ['section_id', 'question_type'], {'mysql_length': {'question_type': 64}}),
+]
+
+# (table, column) pairs where the new index starts with a foreign key column
+# that has no other index of its own
+FK_LEADING = {
+    ('listening_answers', 'result_id'),
+    ('listening_answers', 'exam_id'),
+    ('student_answers', 'result_id'),
+    ('writing_answers', 'task_id'),
+    ('user_sessions', 'user_id'),
+    ('login_cooldowns', 'user_id'),
+    ('exam_sections', 'exam_id'),
+    ('questions', 'section_id'),
+}
+
+
+def upgrade() -> None:
+    for name, table, columns, kwargs in INDEXES:
+        op.create_index(name, table, columns, **kwargs)
+
+
+def downgrade() -> None:
+    # MySQL drops the implicit index of a foreign key once a composite index
+    # starting with that column exists, and then refuses to drop the composite.
+    # Give those FK columns a plain index back before dropping.
+    for name, table, columns, _kwargs in reversed(INDEXES):
+        if (table, columns[0]) in FK_LEADING:
+            op.create_index(f'ix_{table}_{columns[0]}_fk', table, [columns[0]])
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,31 @@
+"""email broadcast checkpoint + heartbeat
+
+Revision ID: b6c7d8e9f0a1
+Revises: a5b6c7d8e9f0
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6c7d8e9f0a1'
+down_revision: Union[str, None] = 'a5b6c7d8e9f0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('email_broadcasts', sa.Column('checkpoint_user_id', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('email_broadcasts', sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+    # Broadcasts left mid-flight by the old thread-based sender have no
+    # checkpoint; don't let the new watchdog restart them from the first user.
+    op.execute("UPDATE email_broadcasts SET status = 'failed' WHERE status IN ('pending', 'sending')")
+
+
+def downgrade() -> None:
+    op.drop_column('email_broadcasts', 'heartbeat_at')
+    op.drop_column('email_broadcasts', 'checkpoint_user_id')
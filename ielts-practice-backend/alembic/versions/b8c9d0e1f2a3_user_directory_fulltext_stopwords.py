@@ -0,0 +1,46 @@
+"""user directory fulltext without stopwords
+
+Revision ID: b8c9d0e1f2a3
+Revises: a7b8c9d0e1f2
+Create Date: 2026-10-19 21:00:00.000000
+
+ft_users_username_email (d4e5f6a7b8c9) was built with InnoDB's default
+stopword list. With the ngram parser every bigram that is a stopword ("a",
+"i", "in", "on", "at", "is", ...) is left out of the index, so contains-search
+for "maria", "an" or "ai" found nothing even though LIKE would match.
+
+InnoDB binds the stopword setting to a FULLTEXT index when the index is
+created, so the index is rebuilt with innodb_ft_enable_stopword=OFF for this
+session. No server setting changes, and later writes to users keep using the
+index's (empty) stopword list.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8c9d0e1f2a3'
+down_revision: Union[str, None] = 'a7b8c9d0e1f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _rebuild(enable_stopword: str) -> None:
+    op.execute(f"SET SESSION innodb_ft_enable_stopword = {enable_stopword}")
+    op.drop_index('ft_users_username_email', table_name='users')
+    op.create_index(
+        'ft_users_username_email', 'users', ['username', 'email'],
+        mysql_prefix='FULLTEXT', mysql_with_parser='ngram',
+    )
+    op.execute("SET SESSION innodb_ft_enable_stopword = DEFAULT")
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'mysql':
+        _rebuild('OFF')
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'mysql':
+        _rebuild('ON')
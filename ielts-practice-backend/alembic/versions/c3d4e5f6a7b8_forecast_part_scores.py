@@ -0,0 +1,57 @@
+"""forecast part scores on exam_results
+
+Revision ID: c3d4e5f6a7b8
+Revises: b2c3d4e5f6a7
+Create Date: 2026-10-19 16:00:00.000000
+
+Forecast history used to re-sum each attempt's answers per request and keep a
+copy of the list in Redis. The earned/total marks of the forecast part are now
+stored on the result at submit time; existing forecast results are filled in
+from their answers, the same way the history endpoints computed them.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3d4e5f6a7b8'
+down_revision: Union[str, None] = 'b2c3d4e5f6a7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('exam_results', sa.Column('forecast_score_earned', sa.Float(), nullable=True))
+    op.add_column('exam_results', sa.Column('forecast_score_total', sa.Float(), nullable=True))
+    # A result has listening_answers or student_answers, never both, so the
+    # two sums add up to whichever one it has
+    op.execute(
+        """
+        UPDATE exam_results r
+        JOIN exam_sections s
+          ON s.exam_id = r.exam_id
+         AND s.order_number = r.forecast_part
+         AND s.section_type IN ('listening', 'reading')
+        SET r.forecast_score_total = (
+                SELECT COALESCE(SUM(q.marks), 0) FROM questions q
+                WHERE q.section_id = s.section_id AND q.question_type != 'main_text'
+            ),
+            r.forecast_score_earned = (
+                SELECT COALESCE(SUM(a.score), 0) FROM listening_answers a
+                JOIN questions q ON q.question_id = a.question_id
+                WHERE a.result_id = r.result_id AND q.section_id = s.section_id
+            ) + (
+                SELECT COALESCE(SUM(a.score), 0) FROM student_answers a
+                JOIN questions q ON q.question_id = a.question_id
+                WHERE a.result_id = r.result_id AND q.section_id = s.section_id
+            )
+        WHERE r.is_forecast = 1
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('exam_results', 'forecast_score_total')
+    op.drop_column('exam_results', 'forecast_score_earned')
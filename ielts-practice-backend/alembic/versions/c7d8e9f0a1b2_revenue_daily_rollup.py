@@ -0,0 +1,50 @@
+"""revenue_daily rollup table
+
+Revision ID: c7d8e9f0a1b2
+Revises: b6c7d8e9f0a1
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7d8e9f0a1b2'
+down_revision: Union[str, None] = 'b6c7d8e9f0a1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'revenue_daily',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('source', sa.Enum('package', 'center_deposit', 'center_vip_purchase', name='revenue_sources'), nullable=False),
+        sa.Column('amount', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('txn_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('day', 'source'),
+    )
+    # Backfill from history (same aggregation as scripts/rebuild_revenue_rollup.py).
+    op.execute("""
+        INSERT INTO revenue_daily (day, source, amount, txn_count)
+        SELECT DATE(created_at), 'package', ROUND(SUM(amount)), COUNT(*)
+        FROM package_transactions
+        WHERE status = 'completed' AND created_at IS NOT NULL
+        GROUP BY DATE(created_at)
+    """)
+    op.execute("""
+        INSERT INTO revenue_daily (day, source, amount, txn_count)
+        SELECT DATE(created_at),
+               IF(type = 'deposit', 'center_deposit', 'center_vip_purchase'),
+               ROUND(SUM(amount)), COUNT(*)
+        FROM center_wallet_transactions
+        WHERE status = 'completed' AND created_at IS NOT NULL
+        GROUP BY DATE(created_at), type
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('revenue_daily')
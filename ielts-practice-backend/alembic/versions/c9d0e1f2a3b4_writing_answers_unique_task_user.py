@@ -0,0 +1,48 @@
+"""writing answers unique per task and user
+
+Revision ID: c9d0e1f2a3b4
+Revises: b8c9d0e1f2a3
+Create Date: 2026-10-19 22:00:00.000000
+
+The writing draft flusher (app/utils/writing_drafts.py) inserts the first
+draft of an answer with INSERT ... ON DUPLICATE KEY UPDATE, which needs a
+unique key on (task_id, user_id); with only the plain index, a submit that
+inserted the row while a flush was in flight ended up with two rows.
+
+Existing duplicates are removed first, keeping per (task_id, user_id) the
+AI-evaluated row if there is one, else the most recently updated, else the
+newest. The unique key replaces ix_writing_answers_task_user (same columns).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c9d0e1f2a3b4'
+down_revision: Union[str, None] = 'b8c9d0e1f2a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("""
+        DELETE FROM writing_answers WHERE answer_id IN (
+            SELECT answer_id FROM (
+                SELECT answer_id, ROW_NUMBER() OVER (
+                    PARTITION BY task_id, user_id
+                    ORDER BY COALESCE(is_ai_evaluated, 0) DESC, updated_at IS NULL, updated_at DESC, answer_id DESC
+                ) AS position
+                FROM writing_answers
+            ) ranked WHERE position > 1
+        )
+    """)
+    # Create the unique key before dropping the index: task_id's foreign key
+    # needs an index that starts with it at all times
+    op.create_unique_constraint('uq_writing_answers_task_user', 'writing_answers', ['task_id', 'user_id'])
+    op.drop_index('ix_writing_answers_task_user', table_name='writing_answers')
+
+
+def downgrade() -> None:
+    op.create_index('ix_writing_answers_task_user', 'writing_answers', ['task_id', 'user_id'])
+    op.drop_constraint('uq_writing_answers_task_user', 'writing_answers', type_='unique')
@@ -0,0 +1,35 @@
+"""user directory indexes
+
+Revision ID: d4e5f6a7b8c9
+Revises: c3d4e5f6a7b8
+Create Date: 2026-10-19 17:00:00.000000
+
+(role, user_id) for keyset pages of one role, and an ngram FULLTEXT index on
+username/email for substring search (MySQL only; other databases fall back to
+LIKE in app/utils/user_directory.py).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4e5f6a7b8c9'
+down_revision: Union[str, None] = 'c3d4e5f6a7b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_users_role_user', 'users', ['role', 'user_id'])
+    if op.get_bind().dialect.name == 'mysql':
+        op.create_index(
+            'ft_users_username_email', 'users', ['username', 'email'],
+            mysql_prefix='FULLTEXT', mysql_with_parser='ngram',
+        )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'mysql':
+        op.drop_index('ft_users_username_email', table_name='users')
+    op.drop_index('ix_users_role_user', table_name='users')
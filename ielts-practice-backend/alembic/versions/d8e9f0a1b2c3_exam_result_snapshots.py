@@ -0,0 +1,37 @@
+"""exam result review snapshots
+
+Revision ID: d8e9f0a1b2c3
+Revises: c7d8e9f0a1b2
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8e9f0a1b2c3'
+down_revision: Union[str, None] = 'c7d8e9f0a1b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('exams', sa.Column('content_version', sa.Integer(), nullable=False, server_default='1'))
+    op.create_table(
+        'exam_result_snapshots',
+        sa.Column('result_id', sa.Integer(), nullable=False),
+        sa.Column('content_version', sa.Integer(), nullable=False),
+        sa.Column('payload', mysql.LONGBLOB(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['result_id'], ['exam_results.result_id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('result_id'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('exam_result_snapshots')
+    op.drop_column('exams', 'content_version')
@@ -0,0 +1,30 @@
+"""listening audio digest
+
+Revision ID: e5f6a7b8c9d0
+Revises: d4e5f6a7b8c9
+Create Date: 2026-10-19 18:00:00.000000
+
+SHA-256 of each listening part's audio, set once its loudness-normalized
+MP3/HLS renditions have been written under static/audio/ (see
+app/utils/audio_renditions.py). NULL means the original upload is served.
+Fill it for existing audio with: python -m scripts.transcode_listening_audio
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5f6a7b8c9d0'
+down_revision: Union[str, None] = 'd4e5f6a7b8c9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('listening_media', sa.Column('audio_digest', sa.String(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('listening_media', 'audio_digest')
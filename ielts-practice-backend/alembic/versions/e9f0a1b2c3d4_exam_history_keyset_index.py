@@ -0,0 +1,25 @@
+"""exam history keyset index
+
+Revision ID: e9f0a1b2c3d4
+Revises: d8e9f0a1b2c3
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e9f0a1b2c3d4'
+down_revision: Union[str, None] = 'd8e9f0a1b2c3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_exam_results_user_completion', 'exam_results', ['user_id', 'completion_date', 'result_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_exam_results_user_completion', table_name='exam_results')
@@ -0,0 +1,28 @@
+"""writing task thumbnail url
+
+Revision ID: f0a1b2c3d4e5
+Revises: e9f0a1b2c3d4
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f0a1b2c3d4e5'
+down_revision: Union[str, None] = 'e9f0a1b2c3d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Filled by `python -m scripts.extract_inline_images` (needs the static dir,
+    # so it is not done here) and on every admin save afterwards.
+    op.add_column('writing_tasks', sa.Column('thumbnail_url', sa.String(length=500), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('writing_tasks', 'thumbnail_url')
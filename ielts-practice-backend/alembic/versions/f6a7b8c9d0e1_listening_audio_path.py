@@ -0,0 +1,30 @@
+"""listening audio path
+
+Revision ID: f6a7b8c9d0e1
+Revises: e5f6a7b8c9d0
+Create Date: 2026-10-19 19:00:00.000000
+
+Listening part audio uploaded from now on is streamed to a content-addressed
+file under media/listening_audio/ (app/utils/uploads.py) and the row keeps
+only its path; audio_file stays NULL for those rows. Existing rows keep their
+blob in audio_file, and readers fall back to it when audio_path is NULL.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f6a7b8c9d0e1'
+down_revision: Union[str, None] = 'e5f6a7b8c9d0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('listening_media', sa.Column('audio_path', sa.String(length=255), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('listening_media', 'audio_path')
@@ -2,6 +2,7 @@ from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import QueuePool
+from app.utils.metrics import TimedQueuePool
 import time
 import logging
 from sqlalchemy import text  # Add this import at the top
@@ -18,6 +19,7 @@ DATABASE_URL = os.getenv(
 
 engine = create_engine(
     DATABASE_URL,
+    poolclass=TimedQueuePool,  # QueuePool + checkout wait metrics
     pool_size=200,         # Increased for high-spec VPS (12 CPU, 24GB RAM)
     max_overflow=300,      # Increased overflow for peak loads
     pool_timeout=30,       # Keep fast failure detection
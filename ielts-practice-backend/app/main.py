@@ -9,6 +9,16 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.routes import router as api_router
 from fastapi.staticfiles import StaticFiles
 from app.utils.redis_cache import cache
+from app.routes.admin.email_broadcast import broadcast_watchdog, stop_broadcasts
+from app.utils.email_outbox import start_outbox_workers, stop_outbox_workers
+from app.utils.writing_drafts import start_draft_flusher, stop_draft_flusher
+from app.utils.lifecycle import register_lifecycle_jobs
+from app.utils.presence import register_presence_jobs
+from app.utils.counters import register_counter_jobs
+from app.utils.scheduler import start_scheduler, stop_scheduler
+from app.utils.sql_profiling import SqlProfilingMiddleware
+from app.utils.metrics import MetricsMiddleware, mark_worker_dead
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -19,12 +29,29 @@ app = FastAPI()
 async def startup_event():
     """Initialize Redis connection on startup"""
     await cache.connect()
+    # Picks up email broadcasts interrupted by a restart/crash.
+    app.state.broadcast_watchdog = asyncio.create_task(broadcast_watchdog())
+    # Sends transactional email queued by the request handlers.
+    start_outbox_workers()
+    # Writes autosaved writing drafts from Redis to MySQL.
+    start_draft_flusher()
+    # Expiry/cleanup sweeps; only the elected worker runs them.
+    register_lifecycle_jobs()
+    register_presence_jobs()
+    register_counter_jobs()
+    start_scheduler()
     logger.info("Application startup completed")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Close Redis connection on shutdown"""
+    app.state.broadcast_watchdog.cancel()
+    await stop_broadcasts()
+    await stop_outbox_workers()
+    await stop_draft_flusher()
+    await stop_scheduler()
     await cache.disconnect()
+    mark_worker_dead()
     logger.info("Application shutdown completed")
 
 # Configure CORS
@@ -34,8 +61,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
+# Samples requests for query count / DB time (Server-Timing + logs); off unless
+# SQL_PROFILE_SAMPLE_RATE is set.
+app.add_middleware(SqlProfilingMiddleware)
+# Route latency / in-flight requests for /internal/metrics
+app.add_middleware(MetricsMiddleware)
+
 # Include all routes
 app.include_router(api_router)
 app.mount("/static", StaticFiles(directory="static"), name="static")
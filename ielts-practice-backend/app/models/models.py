@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Enum, JSON, ForeignKey, Boolean, Text, BigInteger
-from sqlalchemy.dialects.mysql import LONGBLOB, LONGTEXT
+from sqlalchemy import Column, Integer, String, Float, DateTime, Date, Enum, JSON, ForeignKey, Boolean, Text, BigInteger, Index, UniqueConstraint
+from sqlalchemy.dialects.mysql import DATETIME, LONGBLOB, LONGTEXT
 from sqlalchemy.orm import relationship, deferred
 from app.database import Base
 from datetime import datetime
@@ -38,6 +38,14 @@ class User(Base):
     exam_results = relationship("ExamResult", back_populates="user")
     user_sessions = relationship("UserSession", back_populates="user")
 
+    __table_args__ = (
+        # Admin user directory: role filter walked in user_id order (keyset)
+        Index('ix_users_role_user', 'role', 'user_id'),
+        # Substring search on username/email (MySQL ngram parser); must be built
+        # with innodb_ft_enable_stopword=OFF, see migration b8c9d0e1f2a3
+        Index('ft_users_username_email', 'username', 'email', mysql_prefix='FULLTEXT', mysql_with_parser='ngram'),
+    )
+
 class UserSession(Base):
     __tablename__ = 'user_sessions'
     
@@ -55,6 +63,13 @@ class UserSession(Base):
     
     user = relationship("User", back_populates="user_sessions")
 
+    __table_args__ = (
+        # Active-session checks at login / logout-all
+        Index('ix_user_sessions_user_active', 'user_id', 'is_active'),
+        # Current-session lookup and activity touch on every authenticated request
+        Index('ix_user_sessions_token_active', 'session_token', 'is_active'),
+    )
+
 class DeviceViolation(Base):
     __tablename__ = 'device_violations'
     
@@ -85,6 +100,13 @@ class LoginCooldown(Base):
     
     user = relationship("User")
 
+    __table_args__ = (
+        # "Is this user in cooldown?" (user_id, cooldown_end > now) at login
+        Index('ix_login_cooldowns_user_end', 'user_id', 'cooldown_end'),
+        # Expired-cooldown cleanup (cooldown_end <= now)
+        Index('ix_login_cooldowns_end', 'cooldown_end'),
+    )
+
 class UserNotification(Base):
     __tablename__ = 'user_notifications'
     
@@ -182,10 +204,19 @@ class ExamResult(Base):
     attempt_number = Column(Integer, nullable=False, default=1)
     is_forecast = Column(Boolean, default=False)  # True if this is a forecast (single part) result
     forecast_part = Column(Integer, nullable=True)  # Which part (1-4 for listening, 1-3 for reading) if forecast
+    forecast_score_earned = Column(Float, nullable=True)  # Forecast only: marks earned in that part, stored at submit
+    forecast_score_total = Column(Float, nullable=True)  # Forecast only: marks available in that part
     user = relationship("User", back_populates="exam_results")
     exam = relationship("Exam", back_populates="exam_results")
     answers = relationship("StudentAnswer", back_populates="exam_result")
 
+    __table_args__ = (
+        # Keyset pagination of a user's history, newest first
+        Index('ix_exam_results_user_completion', 'user_id', 'completion_date', 'result_id'),
+        # Attempt counting and forecast history per (user, exam[, part])
+        Index('ix_exam_results_user_exam_forecast', 'user_id', 'exam_id', 'is_forecast', 'forecast_part'),
+    )
+
 class StudentAnswer(Base):
     __tablename__ = 'student_answers'
     
@@ -198,6 +229,10 @@ class StudentAnswer(Base):
     exam_result = relationship("ExamResult", back_populates="answers")
     question = relationship("Question", back_populates="student_answers")
 
+    __table_args__ = (
+        Index('ix_student_answers_result_question', 'result_id', 'question_id'),
+    )
+
 class ListeningAnswer(Base):
     __tablename__ = 'listening_answers'
     
@@ -215,6 +250,22 @@ class ListeningAnswer(Base):
     exam_result = relationship("ExamResult")
     question = relationship("Question", back_populates="listening_answers")
 
+    __table_args__ = (
+        Index('ix_listening_answers_result_question', 'result_id', 'question_id'),
+        Index('ix_listening_answers_exam_user', 'exam_id', 'user_id'),
+    )
+
+
+class ExamResultSnapshot(Base):
+    """Compressed, immutable review payload for one ExamResult, built on first
+    view. Stale once Exam.content_version moves past content_version."""
+    __tablename__ = 'exam_result_snapshots'
+
+    result_id = Column(Integer, ForeignKey('exam_results.result_id', ondelete='CASCADE'), primary_key=True)
+    content_version = Column(Integer, nullable=False)
+    payload = deferred(Column(LONGBLOB, nullable=False))  # zlib-compressed JSON
+    created_at = Column(DateTime, default=lambda: get_vietnam_time().replace(tzinfo=None))
+
 class Exam(Base):
     __tablename__ = 'exams'
     
@@ -224,6 +275,7 @@ class Exam(Base):
     description = Column(LONGTEXT, nullable=True)
     is_active = Column(Boolean, default=True)
     created_by = Column(Integer, ForeignKey('users.user_id'))
+    content_version = Column(Integer, default=1, nullable=False)  # bumped on question/answer-key edits (app/utils/exam_content.py)
     access_types = relationship("ExamAccessType", back_populates="exam")
     exam_results = relationship("ExamResult", back_populates="exam")
     exam_sections = relationship("ExamSection", back_populates="exam")
@@ -246,6 +298,10 @@ class ExamSection(Base):
     exam = relationship("Exam", back_populates="exam_sections")
     questions = relationship("Question", back_populates="section")
 
+    __table_args__ = (
+        Index('ix_exam_sections_exam_type_order', 'exam_id', 'section_type', 'order_number'),
+    )
+
 class QuestionGroup(Base):
     __tablename__ = 'question_groups'
     
@@ -285,6 +341,11 @@ class Question(Base):
     options = relationship("QuestionOption", back_populates="question")
     student_answers = relationship("StudentAnswer", back_populates="question")
     listening_answers = relationship("ListeningAnswer", back_populates="question")  # Add this line
+
+    __table_args__ = (
+        # question_type is TEXT, so MySQL indexes a prefix of it
+        Index('ix_questions_section_type', 'section_id', 'question_type', mysql_length={'question_type': 64}),
+    )
     
 class QuestionOption(Base):
     __tablename__ = 'question_options'
@@ -317,6 +378,7 @@ class WritingTask(Base):
     is_recommended = Column(Boolean, default=False)  # Starred/recommended forecast
     question_type_tags = Column(JSON, nullable=True)
     sample_essay = Column(LONGTEXT, nullable=True)
+    thumbnail_url = Column(String(500), nullable=True)  # WebP of the first instructions image (app/utils/inline_images.py)
 
     exam = relationship("Exam", backref="writing_tasks")
     student_answers = relationship("WritingAnswer", back_populates="task")
@@ -331,7 +393,8 @@ class WritingAnswer(Base):
     score = Column(Float, nullable=True)
     is_ai_evaluated = Column(Boolean, default=False)
     created_at = Column(DateTime)
-    updated_at = Column(DateTime)
+    # Microseconds: the draft flusher only overwrites rows written before its draft
+    updated_at = Column(DateTime().with_variant(DATETIME(fsp=6), "mysql"))
     
     # Scores for each criterion
     task_achievement_score = Column(Float, nullable=True)
@@ -347,6 +410,12 @@ class WritingAnswer(Base):
     task = relationship("WritingTask", back_populates="student_answers")
     user = relationship("User")
 
+    __table_args__ = (
+        # One answer per student and task: the draft flusher upserts on it, and
+        # per-student lookups for a set of tasks use it (migration c9d0e1f2a3b4)
+        UniqueConstraint('task_id', 'user_id', name='uq_writing_answers_task_user'),
+    )
+
 
 class ListeningMedia(Base):
     __tablename__ = "listening_media"
@@ -354,9 +423,13 @@ class ListeningMedia(Base):
     media_id = Column(Integer, primary_key=True, index=True)
     section_id = Column(Integer, ForeignKey("exam_sections.section_id"))
     audio_file = deferred(Column(LONGBLOB))  # Deferred to avoid loading large blobs by default
+    # Stored upload (app/utils/uploads.py); rows uploaded before it keep audio_file instead
+    audio_path = Column(String(255), nullable=True)
     audio_filename = Column(String(255))
     transcript = Column(LONGTEXT)
     duration = Column(Integer)
+    # SHA-256 of the audio once its static renditions exist (app/utils/audio_renditions.py)
+    audio_digest = Column(String(64), nullable=True)
 
 
 
@@ -471,6 +544,35 @@ class EmailBroadcast(Base):
     created_by = Column(Integer, ForeignKey('users.user_id'), nullable=True)
     created_at = Column(DateTime, default=lambda: get_vietnam_time().replace(tzinfo=None))
     completed_at = Column(DateTime, nullable=True)
+    # Resume point for the broadcast engine: recipients are walked in user_id
+    # order, so everything <= checkpoint_user_id has been handled. heartbeat_at
+    # is refreshed by the worker sending it; a stale heartbeat means it died.
+    checkpoint_user_id = Column(Integer, default=0, nullable=False)
+    heartbeat_at = Column(DateTime, nullable=True)
+
+
+class EmailOutbox(Base):
+    """Transactional emails (OTP, password reset, welcome, admin notices) waiting
+    to be sent by the outbox workers in app/utils/email_outbox.py."""
+    __tablename__ = 'email_outbox'
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    to_email = Column(String(255), nullable=False)
+    subject = Column(String(500), nullable=False)
+    body_html = Column(LONGTEXT, nullable=False)
+    category = Column(String(50), nullable=False, default='transactional')  # otp, password_reset, welcome, ...
+    status = Column(Enum('pending', 'sending', 'sent', 'failed', name='email_outbox_status'), nullable=False, default='pending')
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=lambda: get_vietnam_time().replace(tzinfo=None))
+    claimed_at = Column(DateTime, nullable=True)  # set while a worker holds the row ('sending')
+    claim_token = Column(String(32), nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=lambda: get_vietnam_time().replace(tzinfo=None))
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -569,6 +671,18 @@ class CenterWalletTransaction(Base):
     center = relationship("Center")
 
 
+class RevenueDaily(Base):
+    """Per-day revenue rollup for the admin revenue dashboards, one row per
+    (day, source). Maintained incrementally by app/utils/revenue_rollup.py when
+    a transaction enters/leaves 'completed'; amounts are whole VND."""
+    __tablename__ = 'revenue_daily'
+
+    day = Column(Date, primary_key=True)
+    source = Column(Enum('package', 'center_deposit', 'center_vip_purchase', name='revenue_sources'), primary_key=True)
+    amount = Column(BigInteger, default=0, nullable=False)
+    txn_count = Column(Integer, default=0, nullable=False)
+
+
 class ChatMessage(Base):
     """Teacher<->student direct messages and teacher->class messages.
     is_pinned marks an important/homework message that shouldn't scroll away."""
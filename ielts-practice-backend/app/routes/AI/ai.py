@@ -7,6 +7,8 @@ from typing import Dict
 from bs4 import BeautifulSoup
 from datetime import datetime
 from app.utils.datetime_utils import get_vietnam_time
+from app.utils.metrics import timed_groq_call
+from app.utils import writing_drafts
 import groq
 import os
 import json  # Add this import
@@ -231,7 +233,8 @@ Do not include any explanatory text before or after the JSON. Ensure all strings
 
         # First model for evaluation (llama3-70b-8192)
         try:
-            evaluation_completion = client_evaluation.chat.completions.create(
+            evaluation_completion = timed_groq_call(
+                "essay_evaluation", client_evaluation.chat.completions.create,
                 model="llama-3.3-70b-versatile",  # Using llama3 for evaluation
                 messages=[
                     {"role": "system", "content": "You are an expert IELTS examiner with 15+ years of experience. You must identify ALL mistakes in student essays and provide accurate band scores according to official IELTS criteria. Always respond in the exact JSON format specified."},
@@ -251,7 +254,8 @@ Do not include any explanatory text before or after the JSON. Ensure all strings
         
         # Second model for essay rewriting (claude-3-opus-20240229)
         try:
-            rewriting_completion = client_rewriting.chat.completions.create(
+            rewriting_completion = timed_groq_call(
+                "essay_rewriting", client_rewriting.chat.completions.create,
                 model="llama-3.3-70b-versatile",  # Using Claude for rewriting
                 messages=[
                     {"role": "system", "content": "You are an expert IELTS examiner with 15+ years of experience. Your task is to rewrite student essays to demonstrate Band 8.0+ standard. Always respond in the exact JSON format specified."},
@@ -498,6 +502,8 @@ async def evaluate_and_save_essay(
 
     db.commit()
     db.refresh(writing_answer)
+    # The evaluated essay is final: a pending autosave must not replace it
+    await writing_drafts.discard_drafts(current_student.user_id, [task_id])
 
     return {
         "task_id": task_id,
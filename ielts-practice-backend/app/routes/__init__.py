@@ -6,6 +6,7 @@ from .admin.vip_management import router as admin_vip_router
 from .admin.dictation_admin import router as dictation_admin_router
 from .admin.email_broadcast import router as email_broadcast_router
 from .student.reading import router as student_reading_router
+from .student.catalog import router as student_catalog_router
 from .student.student_actions import router as student_actions_router
 from .customer.vip_packages import router as customer_vip_router
 from .customer.payos_webhook import router as payos_webhook_router
@@ -22,6 +23,9 @@ from .admin.announcement_admin import router as announcement_admin_router
 from .customer.announcements import router as announcements_router
 from .customer.affiliate import router as affiliate_router
 from .admin.affiliate_admin import router as affiliate_admin_router
+from .admin.presence_admin import router as presence_admin_router
+from .admin.user_directory import router as user_directory_router
+from .internal import router as internal_router
 
 router = APIRouter()
 
@@ -34,6 +38,7 @@ router.include_router(dictation_admin_router, prefix="/admin", tags=["admin-dict
 router.include_router(email_broadcast_router, prefix="/admin", tags=["admin-email"])
 router.include_router(student_actions_router, prefix="/student", tags=["student"])
 router.include_router(student_reading_router, prefix="/student/reading", tags=["student-reading"])
+router.include_router(student_catalog_router, prefix="/student", tags=["student-catalog"])
 router.include_router(customer_vip_router, prefix="/customer/vip", tags=["customer-vip"])
 router.include_router(payos_webhook_router, prefix="/customer/vip", tags=["payos-webhook"])
 router.include_router(student_multiple_actions_router, prefix="/student/action", tags=["student-actions"])
@@ -55,4 +60,9 @@ router.include_router(announcements_router, tags=["announcements"])
 # Affiliate: customer self-service + admin management.
 router.include_router(affiliate_router, prefix="/customer/affiliate", tags=["affiliate"])
 router.include_router(affiliate_admin_router, prefix="/admin", tags=["admin-affiliate"])
-
+# Online users and activity counters (Redis presence).
+router.include_router(presence_admin_router, prefix="/admin", tags=["admin-presence"])
+# Paginated user directory and streaming export.
+router.include_router(user_directory_router, prefix="/admin", tags=["admin-users"])
+# Prometheus scrape target; nginx denies /internal/ on the public api vhost.
+router.include_router(internal_router, prefix="/internal", tags=["internal"])
@@ -11,10 +11,17 @@ import shutil
 from bs4 import BeautifulSoup
 import re
 import os
-from uuid import uuid4
 from sqlalchemy.sql import func
 from sqlalchemy import and_, distinct, or_
 from app.utils.datetime_utils import get_vietnam_time
+from app.utils.exam_content import mark_exam_content_changed
+from app.utils.inline_images import externalize_inline_images
+from app.utils.user_directory import search_condition
+from app.utils.counters import get_counters, user_total
+from app.utils.exam_lifecycle import clone_exam, delete_exam, get_delete_progress, spawn_exam_delete
+from app.utils.exam_payloads import load_exam_tree, sorted_options
+from app.utils.audio_renditions import renditions_exist, spawn_transcode
+from app.utils.uploads import LISTENING_AUDIO, UploadRejected, ingest_upload, pdf_policy
 
 router = APIRouter()
 class ExamDescriptionUpdate(BaseModel):
@@ -82,6 +89,23 @@ class IELTSExamCreate(BaseModel):
     sections: List[ExamSectionCreate]
 
 SPEAKING_PDF_DIR = "static/speaking_pdfs"
+SPEAKING_PDFS = pdf_policy(SPEAKING_PDF_DIR, "/static/speaking_pdfs")
+
+
+def _remove_unused_pdf(db: Session, pdf_url: Optional[str], material_id: int):
+    """Delete a material's PDF file unless another material shares it (identical
+    uploads are stored once)."""
+    if not pdf_url or db.query(SpeakingMaterial).filter(
+        SpeakingMaterial.pdf_url == pdf_url, SpeakingMaterial.material_id != material_id
+    ).first():
+        return
+    try:
+        path = pdf_url.lstrip('/')
+        if os.path.exists(path):
+            os.remove(path)
+    except Exception:
+        pass
+
 VALID_SPEAKING_PARTS = {"part1", "part2_3"}
 
 @router.post("/speaking/materials", response_model=dict)
@@ -94,17 +118,13 @@ async def create_speaking_material(
 ):
     if part_type not in VALID_SPEAKING_PARTS:
         raise HTTPException(status_code=400, detail="Invalid part_type. Use 'part1' or 'part2_3'")
-    if pdf_file.content_type != "application/pdf":
-        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
-
-    os.makedirs(SPEAKING_PDF_DIR, exist_ok=True)
-    unique_filename = f"{uuid4()}.pdf"
-    file_path = os.path.join(SPEAKING_PDF_DIR, unique_filename)
-    with open(file_path, "wb") as buffer:
-        content = await pdf_file.read()
-        buffer.write(content)
+    # Streamed to a content-addressed file; the type is checked from the bytes
+    try:
+        stored = await ingest_upload(pdf_file, SPEAKING_PDFS)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
 
-    pdf_url = f"/static/speaking_pdfs/{unique_filename}"
+    pdf_url = stored.url
 
     material = SpeakingMaterial(
         title=title,
@@ -176,22 +196,14 @@ async def update_speaking_material(
         m.title = title
 
     if pdf_file:
-        if pdf_file.content_type != "application/pdf":
-            raise HTTPException(status_code=400, detail="Only PDF files are allowed")
-        os.makedirs(SPEAKING_PDF_DIR, exist_ok=True)
-        unique_filename = f"{uuid4()}.pdf"
-        file_path = os.path.join(SPEAKING_PDF_DIR, unique_filename)
-        with open(file_path, "wb") as buffer:
-            content = await pdf_file.read()
-            buffer.write(content)
-        # delete old file if exists
         try:
-            old_path = m.pdf_url.lstrip('/') if m.pdf_url else None
-            if old_path and os.path.exists(old_path):
-                os.remove(old_path)
-        except Exception:
-            pass
-        m.pdf_url = f"/static/speaking_pdfs/{unique_filename}"
+            stored = await ingest_upload(pdf_file, SPEAKING_PDFS)
+        except UploadRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
+        # delete old file unless it is the same one or another material uses it
+        if m.pdf_url != stored.url:
+            _remove_unused_pdf(db, m.pdf_url, m.material_id)
+        m.pdf_url = stored.url
 
     db.add(m)
     db.commit()
@@ -215,12 +227,7 @@ async def delete_speaking_material(
     if not m:
         raise HTTPException(status_code=404, detail="Material not found")
     # delete file
-    try:
-        old_path = m.pdf_url.lstrip('/') if m.pdf_url else None
-        if old_path and os.path.exists(old_path):
-            os.remove(old_path)
-    except Exception:
-        pass
+    _remove_unused_pdf(db, m.pdf_url, m.material_id)
     db.delete(m)
     db.commit()
     return {"message": "Deleted"}
@@ -484,6 +491,8 @@ async def update_listening_test_title(
     
     # Update the title
     exam.title = title_data.title
+    # Student-facing exam payloads are keyed on the content version
+    mark_exam_content_changed(db, exam_id)
     db.commit()
     
     return {
@@ -586,6 +595,8 @@ async def update_listening_test_descriptions(
             section.part_title = part_descriptions[i]
             db.add(section)
     
+    # Student-facing exam payloads are keyed on the content version
+    mark_exam_content_changed(db, exam_id)
     db.commit()
     
     return {
@@ -607,16 +618,10 @@ async def get_listening_test_details(
     if not exam:
         raise HTTPException(status_code=404, detail="Listening test not found")
     
-    # Get all sections for this exam
-    sections = db.query(ExamSection)\
-        .filter(
-            ExamSection.exam_id == exam_id,
-            ExamSection.section_type == 'listening'
-        )\
-        .order_by(ExamSection.order_number)\
-        .all()
+    # Sections, media, questions and options in a fixed number of queries
+    tree = load_exam_tree(db, exam_id, section_type='listening')
     
-    if not sections:
+    if not tree.sections:
         raise HTTPException(status_code=404, detail="No listening sections found for this test")
     
     # Prepare response with test metadata
@@ -630,28 +635,16 @@ async def get_listening_test_details(
     }
     
     # Get details for each part
-    for section in sections:
-        # Get listening media for this section
-        media = db.query(ListeningMedia)\
-            .filter(ListeningMedia.section_id == section.section_id)\
-            .first()
-        
-        # Get questions for this section
-        questions = db.query(Question)\
-            .filter(Question.section_id == section.section_id)\
-            .order_by(Question.question_id)\
-            .all()
+    for section in tree.sections:
+        media = tree.media.get(section.section_id)
         
         # Skip the main text question which just holds the transcript
-        questions = [q for q in questions if q.question_type != 'main_text']
+        questions = [q for q in tree.questions[section.section_id] if q.question_type != 'main_text']
         
         # Format questions with their options
         formatted_questions = []
         for question in questions:
-            # Get options for this question
-            options = db.query(QuestionOption)\
-                .filter(QuestionOption.question_id == question.question_id)\
-                .all()
+            options = sorted_options(question)
             
             # Format question data
             question_data = {
@@ -746,36 +739,21 @@ async def get_listening_part(
     if not 1 <= part_number <= 4:
         raise HTTPException(status_code=400, detail="Part number must be between 1 and 4")
     
-    # Get the section for this part
-    section = db.query(ExamSection).filter(
-        ExamSection.exam_id == exam_id,
-        ExamSection.order_number == part_number,
-        ExamSection.section_type == 'listening'
-    ).first()
+    # Get the section for this part, with its media, questions and options
+    tree = load_exam_tree(db, exam_id, section_type='listening', order_number=part_number)
     
-    if not section:
+    if not tree.sections:
         raise HTTPException(status_code=404, detail="Section not found")
-    
-    # Get listening media for this section
-    media = db.query(ListeningMedia)\
-        .filter(ListeningMedia.section_id == section.section_id)\
-        .first()
-    
-    # Get questions for this section
-    questions = db.query(Question)\
-        .filter(Question.section_id == section.section_id)\
-        .all()
+    section = tree.sections[0]
+    media = tree.media.get(section.section_id)
     
     # Skip the main text question which just holds the transcript
-    questions = [q for q in questions if q.question_type != 'main_text']
+    questions = [q for q in tree.questions[section.section_id] if q.question_type != 'main_text']
     
     # Format questions with their options
     formatted_questions = []
     for question in questions:
-        # Get options for this question
-        options = db.query(QuestionOption)\
-            .filter(QuestionOption.question_id == question.question_id)\
-            .all()
+        options = sorted_options(question)
         
         # Format question data based on question type
         question_data = {
@@ -844,6 +822,8 @@ async def update_listening_part_description(
 
     section.description = payload.description
     db.add(section)
+    # Student-facing exam payloads are keyed on the content version
+    mark_exam_content_changed(db, exam_id)
     db.commit()
 
     return {
@@ -869,26 +849,18 @@ async def get_users_count(
     Returns:
     - Dictionary with total count and filtered parameters
     """
-    query = db.query(User)
-    
-    # Apply filters if provided
-    if role:
-        query = query.filter(User.role == role)
-    
-    if is_active is not None:
-        query = query.filter(User.is_active == is_active)
-    
-    # Get the count
-    total_count = query.count()
+    # Maintained counters (app/utils/counters.py) instead of six COUNT(*) scans
+    counts = await get_counters(db)
+    total_count = user_total(counts, role, is_active)
     
     # Get role-specific counts
-    admin_count = db.query(User).filter(User.role == 'admin').count()
-    student_count = db.query(User).filter(User.role == 'student').count()
-    customer_count = db.query(User).filter(User.role == 'customer').count()
+    admin_count = user_total(counts, 'admin')
+    student_count = user_total(counts, 'student')
+    customer_count = user_total(counts, 'customer')
     
     # Get active/inactive counts
-    active_count = db.query(User).filter(User.is_active == True).count()
-    inactive_count = db.query(User).filter(User.is_active == False).count()
+    active_count = user_total(counts, is_active=True)
+    inactive_count = user_total(counts, is_active=False)
     
     return {
         "total_users": total_count,
@@ -1090,6 +1062,10 @@ async def update_listening_part_without_audio(
                     )
                     db.add(option)
     
+    # Move pasted base64 images to the static content store
+    externalize_inline_images(db)
+    # Questions/answer key rewritten: stale any derived review snapshots
+    mark_exam_content_changed(db, exam_id)
     db.commit()
     
     return {
@@ -1130,8 +1106,11 @@ async def update_listening_part_with_audio(
     if not section:
         raise HTTPException(status_code=404, detail="Section not found")
 
-    # Handle audio file
-    audio_content = await audio_file.read()
+    # Stream the audio to its file before touching the part; the row only references it
+    try:
+        stored_audio = await ingest_upload(audio_file, LISTENING_AUDIO)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     audio_filename = audio_file.filename
 
     # Delete existing media and questions
@@ -1181,13 +1160,15 @@ async def update_listening_part_with_audio(
     formatted_transcript = transcript.strip().replace('\r\n', '\n') if transcript else None
     listening_media = ListeningMedia(
         section_id=section.section_id,
-        audio_file=audio_content,
+        audio_path=stored_audio.path,
         audio_filename=audio_filename,
+        audio_digest=stored_audio.sha256 if renditions_exist(stored_audio.sha256) else None,
         transcript=formatted_transcript,
         duration=section.duration
     )
     db.add(listening_media)
     db.flush()
+    media_id = listening_media.media_id
 
     # Create main text question for the transcript
     main_question = Question(
@@ -1235,7 +1216,13 @@ async def update_listening_part_with_audio(
                 )
                 db.add(option)
 
+    # Move pasted base64 images to the static content store
+    externalize_inline_images(db)
+    # Questions/answer key rewritten: stale any derived review snapshots
+    mark_exam_content_changed(db, exam_id)
     db.commit()
+    # Low-bitrate/HLS renditions for students, built off the request
+    spawn_transcode(media_id)
     
     return {
         "message": f"Part {part_number} updated successfully with new audio",
@@ -1274,8 +1261,11 @@ async def update_listening_part(
     if not section:
         raise HTTPException(status_code=404, detail="Section not found")
 
-    # Handle audio file
-    audio_content = await audio_file.read()
+    # Stream the audio to its file before touching the part; the row only references it
+    try:
+        stored_audio = await ingest_upload(audio_file, LISTENING_AUDIO)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     audio_filename = audio_file.filename
 
     # Delete existing media and questions
@@ -1328,13 +1318,15 @@ async def update_listening_part(
     formatted_transcript = transcript.strip().replace('\r\n', '\n') if transcript else None
     listening_media = ListeningMedia(
         section_id=section.section_id,
-        audio_file=audio_content,
+        audio_path=stored_audio.path,
         audio_filename=audio_filename,
+        audio_digest=stored_audio.sha256 if renditions_exist(stored_audio.sha256) else None,
         transcript=formatted_transcript,
         duration=section.duration
     )
     db.add(listening_media)
     db.flush()
+    media_id = listening_media.media_id
 
     # Create main text question for the transcript
     main_question = Question(
@@ -1392,7 +1384,13 @@ async def update_listening_part(
         exam.is_active = True
         db.add(exam)
 
+    # Move pasted base64 images to the static content store
+    externalize_inline_images(db)
+    # Questions/answer key rewritten: stale any derived review snapshots
+    mark_exam_content_changed(db, exam_id)
     db.commit()
+    # Low-bitrate/HLS renditions for students, built off the request
+    spawn_transcode(media_id)
     
     return {
         "message": f"Part {part_number} updated successfully",
@@ -1554,6 +1552,10 @@ async def add_writing_task(
         db.add(exam)
         db.add(section)
 
+    # Move pasted base64 images to the static content store
+    externalize_inline_images(db)
+    # Student-facing exam payloads are keyed on the content version
+    mark_exam_content_changed(db, exam_id)
     db.commit()
 
     return {
@@ -1577,6 +1579,8 @@ async def update_writing_test(
     # Update exam title
     exam.title = test_data.title
     db.add(exam)
+    # Student-facing exam payloads are keyed on the content version
+    mark_exam_content_changed(db, exam_id)
     db.commit()
 
     return {
@@ -1641,6 +1645,10 @@ async def update_writing_task(
 
     db.add(existing_task)
     db.add(section)
+    # Move pasted base64 images to the static content store
+    externalize_inline_images(db)
+    # Student-facing exam payloads are keyed on the content version
+    mark_exam_content_changed(db, exam_id)
     db.commit()
 
     return {
@@ -1818,62 +1826,86 @@ async def get_ielts_exams(
 @router.delete("/delete-test/{exam_id}", response_model=dict)
 async def delete_test(
     exam_id: int,
+    background: bool = False,
     current_admin = Depends(get_current_admin),
     db: Session = Depends(get_db)
 ):
     exam = db.query(Exam).filter(Exam.exam_id == exam_id).first()
     if not exam:
         raise HTTPException(status_code=404, detail="Test not found")
+    # Release the request's read before the batches start deleting
+    db.rollback()
 
-    # Delete all related records
-    
-    # First delete exam access types
-    db.query(ExamAccessType).filter(ExamAccessType.exam_id == exam_id).delete()
-    
-    # Delete writing tasks
-    db.query(WritingTask).filter(WritingTask.test_id == exam_id).delete()
-    
-    # Delete exam results and their related student answers
-    exam_results = db.query(ExamResult).filter(ExamResult.exam_id == exam_id).all()
-    for result in exam_results:
-        # Delete student answers associated with this result
-        db.query(StudentAnswer).filter(StudentAnswer.result_id == result.result_id).delete()
-    
-    # Now delete the exam results
-    db.query(ExamResult).filter(ExamResult.exam_id == exam_id).delete()
-    
-    sections = db.query(ExamSection).filter(ExamSection.exam_id == exam_id).all()
-    for section in sections:
-        # First get all questions for this section
-        questions = db.query(Question).filter(Question.section_id == section.section_id).all()
-        
-        # Delete question options first (child records)
-        for question in questions:
-            db.query(QuestionOption).filter(QuestionOption.question_id == question.question_id).delete()
-        
-        # Now it's safe to delete questions
-        db.query(Question).filter(Question.section_id == section.section_id).delete()
-        
-        # Delete question groups
-        db.query(QuestionGroup).filter(QuestionGroup.section_id == section.section_id).delete()
-        
-        # Delete any media or passages related to this section
-        db.query(ListeningMedia).filter(ListeningMedia.section_id == section.section_id).delete()
-        db.query(ReadingPassage).filter(ReadingPassage.section_id == section.section_id).delete()
-    
-    # Now it's safe to delete the sections
-    db.query(ExamSection).filter(ExamSection.exam_id == exam_id).delete()
-
-    # Finally delete the exam
-    db.query(Exam).filter(Exam.exam_id == exam_id).delete()
+    # Set-based batched delete of the exam and everything referencing it
+    # (app/utils/exam_lifecycle.py); large tests can run in the background
+    if background:
+        spawn_exam_delete(exam_id)
+        return {
+            "message": "Test deletion started",
+            "exam_id": exam_id,
+            "status_url": f"/admin/delete-test/{exam_id}/status"
+        }
 
-    db.commit()
+    progress = await delete_exam(exam_id)
+    if progress["status"] != "done":
+        raise HTTPException(status_code=500, detail=f"Test deletion failed at {progress['step']}; retry to continue")
     
     return {
         "message": "Test deleted successfully",
-        "exam_id": exam_id
+        "exam_id": exam_id,
+        "deleted": progress["deleted"]
     }
 
+@router.get("/delete-test/{exam_id}/status", response_model=dict)
+async def get_delete_test_status(
+    exam_id: int,
+    current_admin = Depends(get_current_admin)
+):
+    progress = await get_delete_progress(exam_id)
+    if not progress:
+        raise HTTPException(status_code=404, detail="No deletion found for this test")
+    return progress
+
+class ExamCloneRequest(BaseModel):
+    title: Optional[str] = None
+    section_ids: Optional[List[int]] = None  # clone only these parts (forecast variants)
+    is_active: bool = False
+
+@router.post("/exams/{exam_id}/clone", response_model=dict)
+async def clone_test(
+    exam_id: int,
+    request: ExamCloneRequest,
+    current_admin = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """Copy a test's sections, questions, options, passages, audio and writing tasks into a new test"""
+    exam = db.query(Exam).filter(Exam.exam_id == exam_id).first()
+    if not exam:
+        raise HTTPException(status_code=404, detail="Test not found")
+
+    if request.section_ids:
+        found = db.query(ExamSection.section_id).filter(
+            ExamSection.exam_id == exam_id,
+            ExamSection.section_id.in_(request.section_ids)
+        ).count()
+        if found != len(set(request.section_ids)):
+            raise HTTPException(status_code=400, detail="Some sections do not belong to this test")
+
+    try:
+        result = clone_exam(
+            db, exam_id,
+            title=request.title or f"{exam.title} (copy)"[:100],
+            created_by=current_admin.user_id,
+            section_ids=request.section_ids,
+            is_active=request.is_active
+        )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error cloning test: {str(e)}")
+
+    return {"message": "Test cloned successfully", **result}
+
 @router.get("/ielts-exam/{exam_id}", response_model=dict)
 async def get_ielts_exam_detail(
     exam_id: int,
@@ -1884,12 +1916,13 @@ async def get_ielts_exam_detail(
     if not exam:
         raise HTTPException(status_code=404, detail="Exam not found")
 
+    tree = load_exam_tree(db, exam_id)
     sections = []
-    for section in exam.exam_sections:
+    for section in tree.sections:
         questions = []
-        for question in section.questions:
+        for question in tree.questions[section.section_id]:
             options = [{"option_id": opt.option_id, "text": opt.option_text} 
-                      for opt in question.options]
+                      for opt in sorted_options(question)]
             questions.append({
                 "question_id": question.question_id,
                 "text": question.question_text,
@@ -2040,21 +2073,19 @@ async def get_dashboard_statistics(
 ):
     """Get overall system statistics for the admin dashboard"""
     
+    counts = await get_counters(db)
+    
     # Count total students
-    total_students = db.query(func.count(User.user_id)).filter(User.role == 'student').scalar()
+    total_students = user_total(counts, 'student')
     
     # Count total exams
-    total_exams = db.query(func.count(Exam.exam_id)).scalar()
+    total_exams = counts.get("exams", 0)
     
     # Count active students (with is_active=True)
-    active_students = db.query(func.count(User.user_id))\
-        .filter(
-            User.role == 'student',
-            User.is_active == True
-        ).scalar()
+    active_students = user_total(counts, 'student', is_active=True)
     
     # Count total exam attempts
-    total_attempts = db.query(func.count(ExamResult.result_id)).scalar()
+    total_attempts = counts.get("exam_results", 0)
     
     # Count exams by type
     exam_types = db.query(
@@ -2092,20 +2123,15 @@ async def get_all_students(
     current_admin = Depends(get_current_admin),
     db: Session = Depends(get_db)
 ):
-    """Get all students with pagination and search"""
+    """Get all students with search (paginated: /admin/users/directory?role=student)"""
     
     query = db.query(User).filter(User.role == 'student')
     
+    search = (search or "").strip()
     if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            or_(
-                User.username.ilike(search_term),
-                User.email.ilike(search_term)
-            )
-        )
+        # ngram FULLTEXT on MySQL instead of a '%term%' scan
+        query = query.filter(search_condition(db.get_bind().dialect.name, search))
     
-    total = query.count()
     students = query.order_by(User.user_id).all()
     
     return [{
@@ -5,6 +5,7 @@ from typing import Optional, List
 from app.database import get_db
 from app.models.models import Announcement, User
 from app.routes.admin.auth import get_current_admin
+from app.utils.inline_images import externalize_inline_images
 
 router = APIRouter()
 
@@ -98,6 +99,8 @@ async def create_announcement(
         is_active=payload.is_active if payload.is_active is not None else True,
     )
     db.add(item)
+    # Move pasted base64 images to the static content store
+    externalize_inline_images(db)
     db.commit()
     db.refresh(item)
     return _serialize(item)
@@ -132,6 +135,8 @@ async def update_announcement(
         item.display_order = payload.display_order
     if payload.is_active is not None:
         item.is_active = payload.is_active
+    # Move pasted base64 images to the static content store
+    externalize_inline_images(db)
     db.commit()
     db.refresh(item)
     return _serialize(item)
@@ -1,6 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Form, File, UploadFile
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response, Form, File, UploadFile
 from fastapi.responses import RedirectResponse
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 from app.database import get_db
 from app.models.models import ExamSection, VIPSubscription, VIPPackage, ExamAccessType, User, UserSession, DeviceViolation, LoginCooldown, CenterMembership
 from sqlalchemy import or_, and_
@@ -10,7 +11,6 @@ import random
 import os
 import secrets
 import requests
-from uuid import uuid4
 import string
 from passlib.context import CryptContext
 from pydantic import BaseModel, EmailStr
@@ -18,6 +18,10 @@ from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
 from typing import Optional, List
 from app.utils.datetime_utils import get_vietnam_time
+from app.utils.lifecycle import student_course_expired
+from app.utils import presence
+from app.utils.user_directory import directory_page, directory_query
+from app.utils.uploads import UploadRejected, image_policy, ingest_upload
 from datetime import timedelta
 from urllib.parse import urlencode, quote_plus
 import hashlib
@@ -68,6 +72,7 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
 UPLOAD_DIR = "static/student_images"
+PROFILE_IMAGES = image_policy(UPLOAD_DIR, "/static/student_images")
 DEFAULT_STUDENT_IMAGE = "static/student_images/default-img.png" 
 SECRET_KEY = os.getenv("SECRET_KEY", "latest-secret-key-here-30-Oct")
 ALGORITHM = "HS256"
@@ -81,6 +86,12 @@ GOOGLE_AUTH_URL = "https://accounts.google.com/o/oauth2/auth"
 GOOGLE_TOKEN_URL = "https://oauth2.googleapis.com/token"
 GOOGLE_USER_INFO_URL = "https://www.googleapis.com/oauth2/v3/userinfo"
 
+
+def _student_image_path(image_url: str) -> str:
+    """The image's path under static/student_images/ (uploads sit in hash subdirectories)."""
+    return image_url.split(f"{UPLOAD_DIR}/")[-1]
+
+
 # Device Management Functions
 def generate_device_id(user_agent: str, ip_address: str, additional_headers: dict = None) -> str:
     """Generate a deterministic device ID with enhanced fingerprinting for similar devices"""
@@ -297,19 +308,6 @@ def get_cooldown_remaining_time(db: Session, user_id: int, device_id: str) -> Op
     
     return None
 
-def cleanup_expired_cooldowns(db: Session) -> None:
-    """Clean up expired user cooldown records"""
-    from app.utils.datetime_utils import get_vietnam_time
-    current_time = get_vietnam_time().replace(tzinfo=None)
-    
-    deleted_count = db.query(LoginCooldown).filter(
-        LoginCooldown.cooldown_end <= current_time
-    ).delete()
-    
-    if deleted_count > 0:
-        db.commit()
-        print(f"CLEANUP - Removed {deleted_count} expired user cooldown records")
-
 def get_active_sessions(db: Session, user_id: int) -> List[UserSession]:
     """Get all active sessions for a user, automatically expiring old sessions"""
     vietnam_tz = pytz.timezone('Asia/Ho_Chi_Minh')
@@ -637,7 +635,9 @@ async def check_exam_access(user: User, exam_id: int, db: Session) -> bool:
     # alone — it can be stale when a subscription expires). The access-type
     # check below is the single source of truth for allow/deny.
     has_active_skill_subscription = False
-    if user.role == "customer" and user.is_vip:
+    # is_vip is cleared by the lifecycle sweep; vip_expiry covers the minutes in between
+    vip_current = user.is_vip and (user.vip_expiry is None or user.vip_expiry > get_vietnam_time().replace(tzinfo=None))
+    if user.role == "customer" and vip_current:
         active_subscription = db.query(VIPSubscription).join(VIPPackage).filter(
             VIPSubscription.user_id == user.user_id,
             VIPSubscription.end_date > get_vietnam_time().replace(tzinfo=None),
@@ -715,22 +715,16 @@ async def get_current_student(
             detail="Only students and customers can perform this action"
         )
     
-    # Check if account has expired (only for student accounts) - do this BEFORE is_active check
-    # Anchor the 90-day course window on account_activated_at when present, else
-    # fall back to created_at. The fallback is essential: account_activated_at is
-    # only set by /activate-account, but students are also activated by an admin
-    # toggling is_active_student via PUT /students/{id}, which never sets it — so
-    # without the fallback the window never starts and they stay 'student' forever.
-    if user.role == "student":
-        course_start = user.account_activated_at or user.created_at
-        if course_start is not None:
-            expiry_date = course_start + timedelta(days=90)
-            if get_vietnam_time().replace(tzinfo=None) > expiry_date:
-                # Convert student to customer and reactivate
-                user.role = "customer"
-                user.is_active = True  # Reactivate the account
-                db.commit()
-                # User continues as customer with VIP restrictions
+    # Check if account has expired (only for student accounts) - do this BEFORE is_active check.
+    # The conversion to customer is written by the lifecycle sweep
+    # (app/utils/lifecycle.py); until it runs, treat the student as the
+    # reactivated customer it is about to become. set_committed_value gives the
+    # instance those values as if loaded, so the endpoint's own db.commit()
+    # does not write them (its other changes to the user still are).
+    if user.role == "student" and student_course_expired(user, get_vietnam_time().replace(tzinfo=None)):
+        set_committed_value(user, "role", "customer")
+        set_committed_value(user, "is_active", True)
+        # User continues as customer with VIP restrictions
     
     # Check if account is active (skip for converted customers)
     if not user.is_active:
@@ -884,6 +878,7 @@ async def logout(
     """Logout endpoint that updates user status to offline and sets last_active to current Vietnam time"""
     # Update the user's status to offline
     current_user.status = "offline"
+    await presence.mark_offline(current_user.user_id)
     
     # Update last_active with Vietnam time
     vietnam_time = get_vietnam_time()
@@ -978,9 +973,6 @@ async def google_callback(
         print(f"GOOGLE LOGIN - User Agent: {user_agent}")
         print(f"GOOGLE LOGIN - IP Address: {ip_address}")
         
-        # Clean up expired cooldowns
-        cleanup_expired_cooldowns(db)
-        
         # Check if device is in cooldown
         if is_device_in_cooldown(db, student.user_id, device_id):
             remaining_time = get_cooldown_remaining_time(db, student.user_id, device_id)
@@ -1068,7 +1060,7 @@ async def register_student(student_data: StudentCreate, db: Session = Depends(ge
     if existing_user:
         # If the email is already registered, send a notification email
         try:
-            from app.utils.email_utils import send_email
+            from app.utils.email_outbox import enqueue_email
             
             # Create email content
             subject = "thiieltstrenmay.com - Email đã được sử dụng"
@@ -1087,11 +1079,12 @@ async def register_student(student_data: StudentCreate, db: Session = Depends(ge
             </html>
             """
             
-            # Send the email silently (don't raise exceptions if it fails)
+            # Queue the email silently (don't raise exceptions if it fails)
             try:
-                send_email(student_data.email, subject, html_content)
+                enqueue_email(db, student_data.email, subject, html_content, category="account_exists")
             except Exception as e:
-                print(f"Failed to send 'account exists' email: {str(e)}")
+                db.rollback()
+                print(f"Failed to queue 'account exists' email: {str(e)}")
                 # Don't block the response, just log the error
                 
         except ImportError:
@@ -1112,23 +1105,16 @@ async def register_student(student_data: StudentCreate, db: Session = Depends(ge
             detail="Username already registered"
         )
     
-    # Validate if the email domain is real
-    try:
-        from app.utils.email_utils import is_valid_email
-
-        if not is_valid_email(student_data.email):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid email address. Please provide a valid email."
-            )
-    except ImportError:
-        # If email validation isn't available, continue with registration
-        pass
-
-    # Reject disposable / temporary email providers (defense in depth; the FE
-    # and /send-verification-code also check this).
-    from app.utils.email_blocklist import is_disposable_email
-    if is_disposable_email(student_data.email):
+    # Validate that the email domain is real and not a disposable provider
+    # (defense in depth; the FE and /send-verification-code also check this).
+    from app.utils.email_domains import check_domain
+    domain_verdict = await check_domain(student_data.email)
+    if not domain_verdict["domain_exists"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid email address. Please provide a valid email."
+        )
+    if domain_verdict["disposable"]:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Vui lòng dùng email cá nhân thật (không dùng email tạm thời)"
@@ -1181,11 +1167,14 @@ async def register_student(student_data: StudentCreate, db: Session = Depends(ge
     
     # Send welcome email using the shared branded template (don't block on failure)
     try:
-        from app.utils.email_utils import send_account_created_email
+        from app.utils.email_utils import build_account_created_email
+        from app.utils.email_outbox import enqueue_email
         frontend_url = os.getenv("FRONTEND_URL", "http://localhost:5173")
-        send_account_created_email(new_student.email, new_student.username, frontend_url)
+        subject, html_content = build_account_created_email(new_student.username, frontend_url)
+        enqueue_email(db, new_student.email, subject, html_content, category="welcome")
     except Exception as e:
-        print(f"Failed to send welcome email: {str(e)}")
+        db.rollback()
+        print(f"Failed to queue welcome email: {str(e)}")
         # Don't block the registration if email fails
     
     return {
@@ -1268,9 +1257,6 @@ async def admin_login(
     print(f"LOGIN - User Agent: {user_agent}")
     print(f"LOGIN - IP Address: {ip_address}")
     
-    # Clean up expired cooldowns
-    cleanup_expired_cooldowns(db)
-    
     # No permanent banning - only temporary 10-second cooldowns for account sharing
     
     # Check if device is in cooldown period
@@ -1438,15 +1424,13 @@ async def update_admin_profile(
         current_admin.username = username
     
     if image:
-        file_extension = os.path.splitext(image.filename)[1]
-        unique_filename = f"{uuid4()}{file_extension}"
-        file_path = os.path.join(UPLOAD_DIR, unique_filename)
-        
-        with open(file_path, "wb") as buffer:
-            content = await image.read()
-            buffer.write(content)
+        # Streamed to a content-addressed file; the type is checked from the bytes
+        try:
+            stored = await ingest_upload(image, PROFILE_IMAGES)
+        except UploadRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
         
-        current_admin.image_url = file_path
+        current_admin.image_url = stored.path
 
     db.commit()
     db.refresh(current_admin)
@@ -1497,24 +1481,50 @@ def create_student(
 @router.get("/students", response_model=List[dict])
 async def get_students(
     request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Page size; omit for every user"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
     current_admin: User = Depends(get_current_admin),
     db: Session = Depends(get_db)
 ):
     vietnam_tz = pytz.timezone('Asia/Ho_Chi_Minh')
-    students = db.query(User).all()
+    if limit:
+        # Newest first, keyset-paginated (see app/utils/user_directory.py)
+        try:
+            students, next_cursor = directory_page(directory_query(db), limit, cursor)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+    else:
+        students = db.query(User).all()
     
     # Define the threshold for considering a user offline (15 minutes)
     offline_threshold = get_vietnam_time().replace(tzinfo=None) - timedelta(minutes=15)
+
+    # Presence (Redis) knows who is online and has last-seen times newer than
+    # users.last_active; None when Redis is down -> derive from the row as before
+    seen = await presence.last_seen(student.user_id for student in students)
+
+    def last_active(student):
+        if seen and student.user_id in seen:
+            return presence.to_db_time(seen[student.user_id])
+        return student.last_active
+
+    def status_of(student):
+        if seen is not None:
+            return "online" if presence.is_online(seen.get(student.user_id)) else "offline"
+        # Determine status based on last_active timestamp - ensure both times are in UTC for comparison
+        return "offline" if student.status == "offline" or (student.last_active and student.last_active < offline_threshold) else "online"
     
     return [{
         "user_id": student.user_id, 
         "username": student.username, 
         "created_at": student.created_at.astimezone(vietnam_tz), 
         "email": student.email,
-        "last_active": student.last_active.astimezone(vietnam_tz) if student.last_active else None,
-        "image_url": f"http://localhost:8000/static/student_images/{student.image_url.split('/')[-1]}" if student.image_url else None,
-        # Determine status based on last_active timestamp - ensure both times are in UTC for comparison
-        "status": "offline" if student.status == "offline" or (student.last_active and student.last_active < offline_threshold) else "online",
+        "last_active": last_active(student).astimezone(vietnam_tz) if last_active(student) else None,
+        "image_url": f"http://localhost:8000/static/student_images/{_student_image_path(student.image_url)}" if student.image_url else None,
+        "status": status_of(student),
         "is_active": student.is_active,
         "is_active_student": getattr(student, 'is_active_student', False)
     } for student in students]
@@ -1559,7 +1569,7 @@ async def get_student(
         "username": user.username, 
         "created_at": user.created_at.astimezone(vietnam_tz), 
         "email": user.email,
-       "image_url": f"http://localhost:8000/static/student_images/{user.image_url.split('/')[-1]}" if user.image_url else None,
+       "image_url": f"http://localhost:8000/static/student_images/{_student_image_path(user.image_url)}" if user.image_url else None,
         "status": user.status,
         "is_active": user.is_active,
         "is_active_student": user.is_active_student
@@ -1579,7 +1589,7 @@ async def get_student(
         "username": student.username, 
         "created_at": student.created_at.astimezone(vietnam_tz), 
         "email": student.email,
-       "image_url": f"http://localhost:8000/static/student_images/{student.image_url.split('/')[-1]}" if student.image_url else None,
+       "image_url": f"http://localhost:8000/static/student_images/{_student_image_path(student.image_url)}" if student.image_url else None,
         "status": student.status,
         "is_active": student.is_active,
         "is_active_student": student.is_active_student
@@ -2,23 +2,23 @@
 Admin Email Broadcast API endpoints.
 Allows admin to compose and send bulk emails to non-VIP users.
 """
-import threading
-import time
+import asyncio
 import logging
 import re
 import os
-import shutil
-from uuid import uuid4
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import or_
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional, Tuple
+from datetime import timedelta
 from app.database import get_db, SessionLocal
 from app.models.models import User, EmailBroadcast
 from app.routes.admin.auth import get_current_admin
 from app.utils.email_service import send_single_email
+from app.utils.broadcast_sender import BroadcastSender, build_transport
 from app.utils.datetime_utils import get_vietnam_time
+from app.utils.uploads import UploadRejected, image_policy, ingest_upload
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -37,89 +37,192 @@ class BroadcastRequest(BaseModel):
     target_filter: str = "non_vip"  # non_vip, all, vip
 
 
-def _run_broadcast(broadcast_id: int):
-    """Background thread to send emails in batches."""
+def _apply_target_filter(query, target_filter: str):
+    """Restrict a User query to active accounts with an email in the target group."""
+    query = query.filter(User.is_active == True, User.email.isnot(None), User.email != '')
+    if target_filter == 'non_vip':
+        query = query.filter(User.is_vip == False)
+    elif target_filter == 'vip':
+        query = query.filter(User.is_vip == True)
+    return query
+
+
+# ── Broadcast engine ─────────────────────────────────────────────────────────
+# Recipients are read in keyset pages on user_id (never the whole list at once)
+# and every finished page is checkpointed on the broadcast row. The worker that
+# owns a broadcast refreshes heartbeat_at on each checkpoint; if it dies, the
+# heartbeat goes stale and any worker's watchdog re-claims the broadcast and
+# resumes after checkpoint_user_id. Claiming is a conditional UPDATE, so with
+# 8 uvicorn workers exactly one of them wins.
+BROADCAST_PAGE_SIZE = int(os.getenv("BROADCAST_PAGE_SIZE", "500"))
+HEARTBEAT_STALE_AFTER = timedelta(minutes=5)
+WATCHDOG_INTERVAL_SECONDS = 60
+
+_broadcast_tasks = set()
+
+
+def _now():
+    return get_vietnam_time().replace(tzinfo=None)
+
+
+def _claim_broadcast(broadcast_id: int) -> bool:
+    db = SessionLocal()
+    try:
+        now = _now()
+        claimed = db.query(EmailBroadcast).filter(
+            EmailBroadcast.id == broadcast_id,
+            EmailBroadcast.status.in_(('pending', 'sending')),
+            or_(EmailBroadcast.heartbeat_at.is_(None), EmailBroadcast.heartbeat_at < now - HEARTBEAT_STALE_AFTER),
+        ).update({EmailBroadcast.status: 'sending', EmailBroadcast.heartbeat_at: now}, synchronize_session=False)
+        db.commit()
+        return claimed == 1
+    finally:
+        db.close()
+
+
+def _load_broadcast(broadcast_id: int) -> Optional[dict]:
+    db = SessionLocal()
+    try:
+        b = db.query(EmailBroadcast).filter(EmailBroadcast.id == broadcast_id).first()
+        if not b:
+            return None
+        return {
+            "subject": b.subject,
+            "body_html": b.body_html,
+            "target_filter": b.target_filter,
+            "checkpoint_user_id": b.checkpoint_user_id or 0,
+            "sent_count": b.sent_count or 0,
+            "failed_count": b.failed_count or 0,
+        }
+    finally:
+        db.close()
+
+
+def _fetch_recipient_page(target_filter: str, after_user_id: int) -> List[Tuple[int, str]]:
     db = SessionLocal()
     try:
-        broadcast = db.query(EmailBroadcast).filter(EmailBroadcast.id == broadcast_id).first()
-        if not broadcast:
-            logger.error(f"Broadcast {broadcast_id} not found")
-            return
-
-        # Build user query based on target filter
-        query = db.query(User.email).filter(User.is_active == True)
-        if broadcast.target_filter == 'non_vip':
-            query = query.filter(and_(
-                User.is_vip == False,
-                User.email.isnot(None),
-                User.email != ''
-            ))
-        elif broadcast.target_filter == 'vip':
-            query = query.filter(and_(
-                User.is_vip == True,
-                User.email.isnot(None),
-                User.email != ''
-            ))
-        else:  # all
-            query = query.filter(and_(
-                User.email.isnot(None),
-                User.email != ''
-            ))
-
-        emails = [row[0] for row in query.all() if row[0] and EMAIL_REGEX.match(row[0])]
-
-        broadcast.total_recipients = len(emails)
-        broadcast.status = 'sending'
+        query = _apply_target_filter(db.query(User.user_id, User.email), target_filter)
+        return [
+            (row.user_id, row.email)
+            for row in query.filter(User.user_id > after_user_id)
+                            .order_by(User.user_id)
+                            .limit(BROADCAST_PAGE_SIZE)
+        ]
+    finally:
+        db.close()
+
+
+def _checkpoint(broadcast_id: int, last_user_id: int, sent: int, failed: int, done: bool = False):
+    db = SessionLocal()
+    try:
+        now = _now()
+        values = {
+            EmailBroadcast.checkpoint_user_id: last_user_id,
+            EmailBroadcast.sent_count: sent,
+            EmailBroadcast.failed_count: failed,
+            EmailBroadcast.heartbeat_at: now,
+        }
+        if done:
+            values.update({EmailBroadcast.status: 'completed', EmailBroadcast.completed_at: now})
+        db.query(EmailBroadcast).filter(EmailBroadcast.id == broadcast_id).update(values, synchronize_session=False)
         db.commit()
+    finally:
+        db.close()
 
-        sent = 0
-        failed = 0
-        batch_size = 40  # send 40 at a time, then pause
-        delay_between_batches = 3  # seconds between batches
-
-        for i, email in enumerate(emails):
-            try:
-                success = send_single_email(email, broadcast.subject, broadcast.body_html)
-                if success:
-                    sent += 1
-                else:
-                    failed += 1
-            except Exception as e:
-                logger.error(f"Error sending to {email}: {e}")
-                failed += 1
-
-            # Update progress every 10 emails
-            if (i + 1) % 10 == 0:
-                broadcast.sent_count = sent
-                broadcast.failed_count = failed
-                db.commit()
-
-            # Pause between batches to avoid rate limiting
-            if (i + 1) % batch_size == 0:
-                time.sleep(delay_between_batches)
-
-        # Final update
-        broadcast.sent_count = sent
-        broadcast.failed_count = failed
-        broadcast.status = 'completed'
-        broadcast.completed_at = get_vietnam_time().replace(tzinfo=None)
+
+def _set_broadcast_state(broadcast_id: int, values: dict):
+    db = SessionLocal()
+    try:
+        db.query(EmailBroadcast).filter(EmailBroadcast.id == broadcast_id).update(values, synchronize_session=False)
         db.commit()
+    except Exception as e:
+        logger.error(f"Could not update broadcast {broadcast_id} state: {e}")
+    finally:
+        db.close()
+
+
+async def _run_broadcast(broadcast_id: int):
+    """Send a broadcast from its last checkpoint to the end of the recipient list."""
+    if not await asyncio.to_thread(_claim_broadcast, broadcast_id):
+        return
+    state = await asyncio.to_thread(_load_broadcast, broadcast_id)
+    if not state:
+        logger.error(f"Broadcast {broadcast_id} not found")
+        return
 
-        logger.info(f"Broadcast {broadcast_id} completed: {sent} sent, {failed} failed out of {len(emails)}")
+    subject, body_html, target = state["subject"], state["body_html"], state["target_filter"]
+    cursor, sent, failed = state["checkpoint_user_id"], state["sent_count"], state["failed_count"]
+    if cursor:
+        logger.info(f"Resuming broadcast {broadcast_id} after user {cursor} ({sent} sent, {failed} failed)")
 
+    sender = BroadcastSender(build_transport())
+    try:
+        page = await asyncio.to_thread(_fetch_recipient_page, target, cursor)
+        while page:
+            # Read the next page while this one is being sent.
+            next_page = asyncio.create_task(asyncio.to_thread(_fetch_recipient_page, target, page[-1][0]))
+            emails = [email for _, email in page if EMAIL_REGEX.match(email)]
+            failed += len(page) - len(emails)  # malformed addresses count as failed so progress reaches 100%
+            if emails:
+                ok, bad = await sender.send(emails, subject, body_html)
+                sent += ok
+                failed += bad
+            cursor = page[-1][0]
+            await asyncio.to_thread(_checkpoint, broadcast_id, cursor, sent, failed)
+            page = await next_page
+
+        await asyncio.to_thread(_checkpoint, broadcast_id, cursor, sent, failed, True)
+        logger.info(f"Broadcast {broadcast_id} completed: {sent} sent, {failed} failed")
+    except asyncio.CancelledError:
+        # Worker shutting down: drop the heartbeat so the next worker resumes
+        # right away instead of waiting for it to go stale.
+        await asyncio.to_thread(_set_broadcast_state, broadcast_id, {EmailBroadcast.heartbeat_at: None})
+        raise
     except Exception as e:
         logger.error(f"Broadcast {broadcast_id} failed: {e}")
-        try:
-            broadcast = db.query(EmailBroadcast).filter(EmailBroadcast.id == broadcast_id).first()
-            if broadcast:
-                broadcast.status = 'failed'
-                db.commit()
-        except:
-            pass
+        await asyncio.to_thread(_set_broadcast_state, broadcast_id, {EmailBroadcast.status: 'failed'})
+    finally:
+        await sender.aclose()
+
+
+def _spawn_broadcast(broadcast_id: int):
+    task = asyncio.get_running_loop().create_task(_run_broadcast(broadcast_id))
+    _broadcast_tasks.add(task)
+    task.add_done_callback(_broadcast_tasks.discard)
+
+
+def _find_orphaned_broadcasts() -> List[int]:
+    db = SessionLocal()
+    try:
+        stale_before = _now() - HEARTBEAT_STALE_AFTER
+        rows = db.query(EmailBroadcast.id).filter(
+            EmailBroadcast.status.in_(('pending', 'sending')),
+            or_(EmailBroadcast.heartbeat_at.is_(None), EmailBroadcast.heartbeat_at < stale_before),
+        ).all()
+        return [row.id for row in rows]
     finally:
         db.close()
 
 
+async def broadcast_watchdog():
+    """Resume broadcasts whose worker died (called once per worker at startup)."""
+    while True:
+        try:
+            for broadcast_id in await asyncio.to_thread(_find_orphaned_broadcasts):
+                _spawn_broadcast(broadcast_id)
+        except Exception as e:
+            logger.error(f"Broadcast watchdog error: {e}")
+        await asyncio.sleep(WATCHDOG_INTERVAL_SECONDS)
+
+
+async def stop_broadcasts():
+    """Cancel in-flight broadcasts on shutdown; each releases its claim."""
+    tasks = list(_broadcast_tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
 @router.get("/email/recipients-count")
 async def get_recipients_count(
     target_filter: str = "non_vip",
@@ -127,15 +230,7 @@ async def get_recipients_count(
     db: Session = Depends(get_db)
 ):
     """Get the count of recipients that would receive the email."""
-    query = db.query(User).filter(User.is_active == True)
-    if target_filter == 'non_vip':
-        query = query.filter(and_(User.is_vip == False, User.email.isnot(None), User.email != ''))
-    elif target_filter == 'vip':
-        query = query.filter(and_(User.is_vip == True, User.email.isnot(None), User.email != ''))
-    else:
-        query = query.filter(and_(User.email.isnot(None), User.email != ''))
-
-    count = query.count()
+    count = _apply_target_filter(db.query(User), target_filter).count()
     return {"count": count, "target_filter": target_filter}
 
 
@@ -156,14 +251,7 @@ async def create_broadcast(
 
     # Enforce recipient cap before allocating any work or fetching email rows.
     # Uses .count() so we don't pull the full address list into memory just to size it.
-    count_query = db.query(User).filter(User.is_active == True)
-    if req.target_filter == 'non_vip':
-        count_query = count_query.filter(and_(User.is_vip == False, User.email.isnot(None), User.email != ''))
-    elif req.target_filter == 'vip':
-        count_query = count_query.filter(and_(User.is_vip == True, User.email.isnot(None), User.email != ''))
-    else:
-        count_query = count_query.filter(and_(User.email.isnot(None), User.email != ''))
-    recipient_count = count_query.count()
+    recipient_count = _apply_target_filter(db.query(User), req.target_filter).count()
     if recipient_count > MAX_RECIPIENTS_PER_BROADCAST:
         raise HTTPException(
             status_code=400,
@@ -180,15 +268,15 @@ async def create_broadcast(
         body_html=req.body_html,
         target_filter=req.target_filter,
         status='pending',
+        total_recipients=recipient_count,
         created_by=current_admin.user_id
     )
     db.add(broadcast)
     db.commit()
     db.refresh(broadcast)
 
-    # Start background thread
-    thread = threading.Thread(target=_run_broadcast, args=(broadcast.id,), daemon=True)
-    thread.start()
+    # Runs on this worker's event loop; DB work inside goes through to_thread.
+    _spawn_broadcast(broadcast.id)
 
     return {
         "message": "Broadcast started",
@@ -269,18 +357,11 @@ async def upload_email_image(
     current_admin=Depends(get_current_admin),
 ):
     """Upload an image for use in broadcast emails. Returns the public URL."""
-    allowed_types = {"image/jpeg", "image/png", "image/gif", "image/webp"}
-    if file.content_type not in allowed_types:
-        raise HTTPException(status_code=400, detail="Only JPEG, PNG, GIF, WEBP images are allowed")
-
-    ext = file.filename.rsplit(".", 1)[-1] if "." in file.filename else "png"
-    filename = f"{uuid4().hex}.{ext}"
-    filepath = os.path.join(UPLOAD_DIR, filename)
-
-    with open(filepath, "wb") as f:
-        shutil.copyfileobj(file.file, f)
+    try:
+        stored = await ingest_upload(file, image_policy(UPLOAD_DIR, "/static/email-images"))
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
 
-    # Return relative URL that can be served via /static/
-    image_url = f"/static/email-images/{filename}"
-    return {"url": image_url, "filename": filename}
+    # Relative URL served via /static/; filename is relative to email-images/
+    return {"url": stored.url, "filename": stored.url[len("/static/email-images/"):]}
 
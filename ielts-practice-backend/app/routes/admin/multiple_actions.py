@@ -4,11 +4,10 @@ from app.database import get_db
 from app.models.models import UserNotification, UpdateKey
 from app.routes.admin.auth import get_current_admin
 from pydantic import BaseModel
-import os
-from uuid import uuid4
 from typing import Optional, List
 from datetime import datetime
 from app.enums.enums import NotificationTypeEnum, KeyTypeEnum
+from app.utils.uploads import UploadRejected, image_policy, ingest_upload
 
 router = APIRouter()
 
@@ -318,33 +317,15 @@ async def upload_notification_image(
 ):
     """Upload an image for notifications and return the URL"""
     
-    # Validate file type (only allow images)
-    content_type = image.content_type
-    if not content_type.startswith('image/'):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Only image files are allowed"
-        )
-    
-    # Create directory if it doesn't exist
-    os.makedirs(NOTIFICATION_IMAGES_DIR, exist_ok=True)
-    
-    # Generate a unique filename
-    file_extension = os.path.splitext(image.filename)[1]
-    unique_filename = f"{uuid4()}{file_extension}"
-    file_path = os.path.join(NOTIFICATION_IMAGES_DIR, unique_filename)
-    
-    # Save the file
-    with open(file_path, "wb") as buffer:
-        content = await image.read()
-        buffer.write(content)
-    
-    # Return the URL path that can be used to access the image
-    image_url = f"/static/notification_images/{unique_filename}"
+    # Streamed to a content-addressed file; the type is checked from the bytes
+    try:
+        stored = await ingest_upload(image, image_policy(NOTIFICATION_IMAGES_DIR, "/static/notification_images"))
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     
     return {
         "message": "Image uploaded successfully",
-        "image_url": image_url
+        "image_url": stored.url
     }
 # Add these imports if not already present
 from app.models.models import Feedback
@@ -377,33 +358,15 @@ async def upload_feedback_image(
 ):
     """Upload an image for feedback and return the URL"""
     
-    # Validate file type (only allow images)
-    content_type = image.content_type
-    if not content_type.startswith('image/'):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Only image files are allowed"
-        )
-    
-    # Create directory if it doesn't exist
-    os.makedirs(FEEDBACK_IMAGES_DIR, exist_ok=True)
-    
-    # Generate a unique filename
-    file_extension = os.path.splitext(image.filename)[1]
-    unique_filename = f"{uuid4()}{file_extension}"
-    file_path = os.path.join(FEEDBACK_IMAGES_DIR, unique_filename)
-    
-    # Save the file
-    with open(file_path, "wb") as buffer:
-        content = await image.read()
-        buffer.write(content)
-    
-    # Return the URL path that can be used to access the image
-    image_url = f"/static/feedback_images/{unique_filename}"
+    # Streamed to a content-addressed file; the type is checked from the bytes
+    try:
+        stored = await ingest_upload(image, image_policy(FEEDBACK_IMAGES_DIR, "/static/feedback_images"))
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     
     return {
         "message": "Image uploaded successfully",
-        "image_url": image_url
+        "image_url": stored.url
     }
 
 # GET endpoints for Feedback
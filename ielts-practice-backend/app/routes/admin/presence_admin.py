@@ -0,0 +1,63 @@
+from datetime import timedelta
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from app.database import get_db
+from app.models.models import User
+from app.routes.admin.auth import get_current_admin
+from app.utils import presence
+from app.utils.datetime_utils import get_vietnam_time
+
+router = APIRouter()
+
+
+@router.get("/presence/online", response_model=dict)
+async def get_online_users(
+    page: int = Query(1, ge=1),
+    page_size: int = Query(50, ge=1, le=200),
+    current_admin: User = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """Who is online now, most recently seen first (app/utils/presence.py)."""
+    total = await presence.online_count()
+    rows = await presence.online_users(page, page_size)
+    if rows is None:
+        # Redis unavailable: fall back to users.last_active
+        threshold = get_vietnam_time().replace(tzinfo=None) - timedelta(seconds=presence.ONLINE_WINDOW)
+        query = db.query(User).filter(User.last_active >= threshold, User.status != 'offline')
+        total = query.count()
+        users = query.order_by(User.last_active.desc()).offset((page - 1) * page_size).limit(page_size).all()
+        items = [(user, user.last_active) for user in users]
+    else:
+        users = {user.user_id: user for user in db.query(User).filter(User.user_id.in_([uid for uid, _ in rows]))}
+        items = [(users[uid], presence.to_db_time(ts)) for uid, ts in rows if uid in users]
+
+    return {
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "users": [{
+            "user_id": user.user_id,
+            "username": user.username,
+            "email": user.email,
+            "role": user.role,
+            "image_url": user.image_url,
+            "last_active": seen,
+        } for user, seen in items]
+    }
+
+
+@router.get("/presence/activity", response_model=dict)
+async def get_activity(
+    minutes: int = Query(60, ge=1, le=1440),
+    days: int = Query(30, ge=1, le=40),
+    current_admin: User = Depends(get_current_admin)
+):
+    """Active users per minute and per day, plus this month's active users."""
+    data = await presence.activity(minutes, days)
+    if data is None:
+        raise HTTPException(status_code=503, detail="Activity counters are unavailable")
+    data["online"] = await presence.online_count()
+    return data
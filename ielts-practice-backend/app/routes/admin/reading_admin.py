@@ -10,6 +10,10 @@ from typing import List, Optional, Dict
 from pydantic import BaseModel
 from sqlalchemy.sql import func
 from app.utils.datetime_utils import get_vietnam_time
+from app.utils.exam_content import mark_exam_content_changed
+from app.utils.exam_lifecycle import delete_exam
+from app.utils.exam_payloads import group_questions, load_exam_tree, sorted_options
+from app.utils.inline_images import externalize_inline_images
 
 router = APIRouter()
 
@@ -82,6 +86,8 @@ async def update_reading_test_title(
     
     exam.title = title_data.title
     db.add(exam)
+    # Student-facing exam payloads are keyed on the content version
+    mark_exam_content_changed(db, exam_id)
     db.commit()
     db.refresh(exam)
     
@@ -204,6 +210,42 @@ async def get_reading_tests(
     
     return result
 
+def _group_details(tree, section) -> List[Dict]:
+    """Question groups of a loaded reading section with their questions and options"""
+    group_details = []
+    for group in tree.groups.get(section.section_id, []):
+        question_details = []
+        for question in group_questions(tree, section.section_id, group.group_id):
+            options = sorted_options(question)
+            
+            question_details.append({
+                "question_id": question.question_id,
+                "question_number": question.question_number,
+                "text": question.question_text,
+                "type": question.question_type,
+                "marks": question.marks,
+                "correct_answer": question.correct_answer,
+                "explanation": question.explanation,
+                "locate": question.locate,
+                "options": [
+                    {
+                        "option_id": option.option_id,
+                        "text": option.option_text,
+                        "is_correct": option.is_correct
+                    } for option in options
+                ] if options else []
+            })
+        
+        group_details.append({
+            "group_id": group.group_id,
+            "instruction": group.instruction,
+            "question_range": group.question_range,
+            "group_type": group.group_type,
+            "order_number": group.order_number,
+            "questions": question_details
+        })
+    return group_details
+
 # Get a specific reading test
 @router.get("/reading-test/{exam_id}", response_model=dict)
 async def get_reading_test(
@@ -217,65 +259,13 @@ async def get_reading_test(
     if not exam:
         raise HTTPException(status_code=404, detail="Reading test not found")
     
-    sections = db.query(ExamSection)\
-        .filter(
-            ExamSection.exam_id == exam_id,
-            ExamSection.section_type == 'reading'
-        )\
-        .order_by(ExamSection.order_number)\
-        .all()
+    # Sections, passages, groups, questions and options in a fixed number of queries
+    tree = load_exam_tree(db, exam_id, section_type='reading', with_groups=True)
     
     section_details = []
-    for section in sections:
-        passage = db.query(ReadingPassage)\
-            .filter(ReadingPassage.section_id == section.section_id)\
-            .first()
-        
-        # Get question groups
-        question_groups = db.query(QuestionGroup)\
-            .filter(QuestionGroup.section_id == section.section_id)\
-            .order_by(QuestionGroup.order_number)\
-            .all()
-        
-        group_details = []
-        for group in question_groups:
-            questions = db.query(Question)\
-                .filter(Question.group_id == group.group_id)\
-                .order_by(Question.question_number)\
-                .all()
-            
-            question_details = []
-            for question in questions:
-                options = db.query(QuestionOption)\
-                    .filter(QuestionOption.question_id == question.question_id)\
-                    .all()
-                
-                question_details.append({
-                    "question_id": question.question_id,
-                    "question_number": question.question_number,
-                    "text": question.question_text,
-                    "type": question.question_type,
-                    "marks": question.marks,
-                    "correct_answer": question.correct_answer,
-                    "explanation": question.explanation,
-                    "locate": question.locate,
-                    "options": [
-                        {
-                            "option_id": option.option_id,
-                            "text": option.option_text,
-                            "is_correct": option.is_correct
-                        } for option in options
-                    ] if options else []
-                })
-            
-            group_details.append({
-                "group_id": group.group_id,
-                "instruction": group.instruction,
-                "question_range": group.question_range,
-                "group_type": group.group_type,
-                "order_number": group.order_number,
-                "questions": question_details
-            })
+    for section in tree.sections:
+        passage = next(iter(tree.passages.get(section.section_id, [])), None)
+        group_details = _group_details(tree, section)
         
         # Expected question count based on part number
         expected_count = 13 if section.order_number < 3 else 14
@@ -418,6 +408,8 @@ async def update_reading_test_descriptions(
             section.part_title = part_descriptions[idx]
             db.add(section)
     
+    # Student-facing exam payloads are keyed on the content version
+    mark_exam_content_changed(db, exam_id)
     db.commit()
     return {
         "message": "Reading test descriptions updated successfully",
@@ -758,6 +750,10 @@ async def update_reading_part(
         exam.is_active = True
         db.add(exam)
     
+    # Move pasted base64 images to the static content store
+    externalize_inline_images(db)
+    # Questions/answer key rewritten: stale any derived review snapshots
+    mark_exam_content_changed(db, exam_id)
     db.commit()
     
     return {
@@ -792,76 +788,21 @@ async def get_reading_test_part(
     if not exam:
         raise HTTPException(status_code=404, detail="Reading test not found")
     
-    # Get the section
-    section = db.query(ExamSection)\
-        .filter(
-            ExamSection.exam_id == exam_id,
-            ExamSection.section_type == 'reading',
-            ExamSection.order_number == part_number
-        )\
-        .first()
+    # Get the section with its passage, groups, questions and options
+    tree = load_exam_tree(db, exam_id, section_type='reading', order_number=part_number, with_groups=True)
     
-    if not section:
+    if not tree.sections:
         raise HTTPException(status_code=404, detail="Reading section not found")
+    section = tree.sections[0]
     
-    # Get passage
-    passage = db.query(ReadingPassage)\
-        .filter(ReadingPassage.section_id == section.section_id)\
-        .first()
-    
-    # Get question groups
-    question_groups = db.query(QuestionGroup)\
-        .filter(QuestionGroup.section_id == section.section_id)\
-        .order_by(QuestionGroup.order_number)\
-        .all()
+    passage = next(iter(tree.passages.get(section.section_id, [])), None)
     
     # Get main text question
-    main_text_question = db.query(Question)\
-        .filter(
-            Question.section_id == section.section_id,
-            Question.question_type == 'main_text'
-        )\
-        .first()
+    main_text_question = next(
+        (q for q in tree.questions[section.section_id] if q.question_type == 'main_text'), None
+    )
     
-    group_details = []
-    for group in question_groups:
-        questions = db.query(Question)\
-            .filter(Question.group_id == group.group_id)\
-            .order_by(Question.question_number)\
-            .all()
-        
-        question_details = []
-        for question in questions:
-            options = db.query(QuestionOption)\
-                .filter(QuestionOption.question_id == question.question_id)\
-                .all()
-            
-            question_details.append({
-                "question_id": question.question_id,
-                "question_number": question.question_number,
-                "text": question.question_text,
-                "type": question.question_type,
-                "marks": question.marks,
-                "correct_answer": question.correct_answer,
-                "explanation": question.explanation,
-                "locate": question.locate,
-                "options": [
-                    {
-                        "option_id": option.option_id,
-                        "text": option.option_text,
-                        "is_correct": option.is_correct
-                    } for option in options
-                ] if options else []
-            })
-        
-        group_details.append({
-            "group_id": group.group_id,
-            "instruction": group.instruction,
-            "question_range": group.question_range,
-            "group_type": group.group_type,
-            "order_number": group.order_number,
-            "questions": question_details
-        })
+    group_details = _group_details(tree, section)
     
     return {
         "exam_id": exam.exam_id,
@@ -890,46 +831,13 @@ async def delete_reading_test(
     exam = db.query(Exam).filter(Exam.exam_id == exam_id).first()
     if not exam:
         raise HTTPException(status_code=404, detail="Reading test not found")
+    # Release the request's read before the batches start deleting
+    db.rollback()
     
-    # Get all sections
-    sections = db.query(ExamSection)\
-        .filter(
-            ExamSection.exam_id == exam_id,
-            ExamSection.section_type == 'reading'
-        )\
-        .all()
-    
-    for section in sections:
-        # Delete passages
-        db.query(ReadingPassage)\
-            .filter(ReadingPassage.section_id == section.section_id)\
-            .delete()
-        
-        # Delete question groups and questions
-        groups = db.query(QuestionGroup)\
-            .filter(QuestionGroup.section_id == section.section_id)\
-            .all()
-        
-        for group in groups:
-            questions = db.query(Question)\
-                .filter(Question.group_id == group.group_id)\
-                .all()
-            
-            for question in questions:
-                db.query(QuestionOption)\
-                    .filter(QuestionOption.question_id == question.question_id)\
-                    .delete()
-                
-                db.delete(question)
-            
-            db.delete(group)
-        
-        # Delete section
-        db.delete(section)
-    
-    # Delete exam
-    db.delete(exam)
-    db.commit()
+    # Batched delete of the test, its content and all answers/results
+    progress = await delete_exam(exam_id)
+    if progress["status"] != "done":
+        raise HTTPException(status_code=500, detail=f"Reading test deletion failed at {progress['step']}; retry to continue")
     
     return {
         "message": "Reading test deleted successfully",
@@ -0,0 +1,67 @@
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal, get_db
+from app.models.models import User
+from app.routes.admin.auth import get_current_admin
+from app.utils.datetime_utils import get_vietnam_time
+from app.utils.user_directory import directory_page, directory_query, directory_row, export_rows
+
+router = APIRouter()
+
+RoleFilter = Optional[Literal['admin', 'student', 'customer', 'center', 'teacher']]
+SearchMode = Literal['contains', 'prefix']
+
+
+@router.get("/users/directory", response_model=List[dict])
+async def get_user_directory(
+    response: Response,
+    role: RoleFilter = None,
+    is_active: Optional[bool] = None,
+    is_vip: Optional[bool] = None,
+    search: Optional[str] = Query(None, max_length=100),
+    search_mode: SearchMode = 'contains',
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    current_admin: User = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """Users newest first, keyset-paginated; the next page cursor is in X-Next-Cursor."""
+    query = directory_query(db, role, is_active, is_vip, search, search_mode)
+    try:
+        users, next_cursor = directory_page(query, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [directory_row(user) for user in users]
+
+
+@router.get("/users/export")
+async def export_user_directory(
+    format: Literal['csv', 'ndjson'] = 'csv',
+    role: RoleFilter = None,
+    is_active: Optional[bool] = None,
+    is_vip: Optional[bool] = None,
+    search: Optional[str] = Query(None, max_length=100),
+    search_mode: SearchMode = 'contains',
+    current_admin: User = Depends(get_current_admin)
+):
+    """Stream the filtered directory as CSV or NDJSON."""
+    def stream():
+        # Own session: the request's session is closed before the body is sent
+        db = SessionLocal()
+        try:
+            yield from export_rows(directory_query(db, role, is_active, is_vip, search, search_mode), format)
+        finally:
+            db.close()
+
+    filename = f"users_{get_vietnam_time():%Y%m%d_%H%M}.{'csv' if format == 'csv' else 'ndjson'}"
+    return StreamingResponse(
+        stream(),
+        media_type="text/csv; charset=utf-8" if format == 'csv' else "application/x-ndjson",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
@@ -9,6 +9,7 @@ from sqlalchemy.orm import joinedload
 from sqlalchemy import func, case
 from pydantic import BaseModel
 from app.utils.datetime_utils import get_vietnam_time
+from app.utils.revenue_rollup import on_package_transaction_status, load_daily_revenue, sum_between
 
 router = APIRouter()
 class TransactionUpdate(BaseModel):
@@ -230,8 +231,11 @@ async def update_transaction_status(
             detail="Transaction not found"
         )
     
+    old_status = transaction.status
     transaction.status = transaction_status
     transaction.admin_note = admin_note
+    # Keep the dashboard rollup in step (adds on ->completed, removes on completed->other).
+    on_package_transaction_status(db, transaction, old_status)
     
     if transaction_status == "completed":
         # Update subscription status
@@ -343,106 +347,57 @@ async def get_total_revenue(
 ):
     """Get total revenue from completed transactions"""
     from datetime import timedelta
+    from collections import defaultdict
     now = get_vietnam_time().replace(tzinfo=None)
+    today = now.date()
 
-    # Calculate total revenue
-    total_revenue = db.query(func.sum(PackageTransaction.amount)).filter(
-        PackageTransaction.status == "completed"
-    ).scalar() or 0
-
-    # Today's revenue
-    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    today_revenue = db.query(func.sum(PackageTransaction.amount)).filter(
-        PackageTransaction.status == "completed",
-        PackageTransaction.created_at >= today_start
-    ).scalar() or 0
-
-    # This month's revenue
-    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    month_revenue = db.query(func.sum(PackageTransaction.amount)).filter(
-        PackageTransaction.status == "completed",
-        PackageTransaction.created_at >= month_start
-    ).scalar() or 0
-
-    # This year's revenue
-    year_start = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
-    year_revenue = db.query(func.sum(PackageTransaction.amount)).filter(
-        PackageTransaction.status == "completed",
-        PackageTransaction.created_at >= year_start
-    ).scalar() or 0
-
-    # Weekly revenue for the last 12 weeks
-    twelve_weeks_ago = now - timedelta(weeks=12)
-    weekly_revenue_raw = db.query(
-        func.date(PackageTransaction.created_at).label('date'),
-        func.sum(PackageTransaction.amount).label('revenue')
-    ).filter(
-        PackageTransaction.status == "completed",
-        PackageTransaction.created_at >= twelve_weeks_ago
-    ).group_by(
-        func.date(PackageTransaction.created_at)
-    ).order_by(
-        func.date(PackageTransaction.created_at)
-    ).all()
+    # One read of the pre-aggregated day rows; everything below is in memory.
+    daily = load_daily_revenue(db, ("package",))
 
-    # Group daily data into weeks
-    from collections import defaultdict
-    weekly_buckets = defaultdict(float)
-    for date_val, revenue in weekly_revenue_raw:
-        from datetime import date as date_type
-        if isinstance(date_val, str):
-            d = datetime.strptime(date_val, "%Y-%m-%d").date()
-        else:
-            d = date_val
-        # Get the Monday of that week
-        week_start = d - timedelta(days=d.weekday())
-        weekly_buckets[week_start] += float(revenue)
-
-    weekly_revenue_list = [
-        {"week_start": str(k), "revenue": v}
-        for k, v in sorted(weekly_buckets.items())
-    ]
+    total_revenue = sum_between(daily)
+    today_revenue = sum_between(daily, today)
+    month_revenue = sum_between(daily, today.replace(day=1))
+    year_revenue = sum_between(daily, today.replace(month=1, day=1))
 
-    # Monthly revenue for current year
-    current_year = now.year
-    monthly_revenue = db.query(
-        func.extract('month', PackageTransaction.created_at).label('month'),
-        func.sum(PackageTransaction.amount).label('revenue')
-    ).filter(
-        PackageTransaction.status == "completed",
-        func.extract('year', PackageTransaction.created_at) == current_year
-    ).group_by(
-        func.extract('month', PackageTransaction.created_at)
-    ).order_by(
-        func.extract('month', PackageTransaction.created_at)
-    ).all()
+    # Weekly revenue for the last 12 weeks, bucketed by the Monday of each week
+    twelve_weeks_ago = (now - timedelta(weeks=12)).date()
+    weekly_buckets = defaultdict(float)
+    monthly_buckets = defaultdict(float)
+    yearly_buckets = defaultdict(float)
+    for d, revenue in daily.items():
+        if d >= twelve_weeks_ago:
+            weekly_buckets[d - timedelta(days=d.weekday())] += revenue
+        if d.year == now.year:
+            monthly_buckets[d.month] += revenue
+        yearly_buckets[d.year] += revenue
+
+    # Center wallet top-ups are tracked separately (VIP bought from the wallet
+    # is spend of money already counted here, not new revenue).
+    center_daily = load_daily_revenue(db, ("center_deposit",))
 
-    # Yearly revenue
-    yearly_revenue = db.query(
-        func.extract('year', PackageTransaction.created_at).label('year'),
-        func.sum(PackageTransaction.amount).label('revenue')
-    ).filter(
-        PackageTransaction.status == "completed"
-    ).group_by(
-        func.extract('year', PackageTransaction.created_at)
-    ).order_by(
-        func.extract('year', PackageTransaction.created_at)
-    ).all()
-    
     return {
         "total_revenue": float(total_revenue),
         "today_revenue": float(today_revenue),
         "month_revenue": float(month_revenue),
         "year_revenue": float(year_revenue),
-        "weekly_revenue": weekly_revenue_list,
+        "weekly_revenue": [
+            {"week_start": str(k), "revenue": v}
+            for k, v in sorted(weekly_buckets.items())
+        ],
         "monthly_revenue": [{
-            "month": int(month),
-            "revenue": float(revenue)
-        } for month, revenue in monthly_revenue],
+            "month": month,
+            "revenue": revenue
+        } for month, revenue in sorted(monthly_buckets.items())],
         "yearly_revenue": [{
-            "year": int(year),
-            "revenue": float(revenue)
-        } for year, revenue in yearly_revenue]
+            "year": year,
+            "revenue": revenue
+        } for year, revenue in sorted(yearly_buckets.items())],
+        "center_deposit_revenue": {
+            "total": sum_between(center_daily),
+            "today": sum_between(center_daily, today),
+            "month": sum_between(center_daily, today.replace(day=1)),
+            "year": sum_between(center_daily, today.replace(month=1, day=1)),
+        }
     }
 
 
@@ -453,43 +408,28 @@ async def get_revenue_detail(
 ):
     """Detailed revenue analytics: daily, monthly, quarterly, yearly with comparisons"""
     from datetime import timedelta
-    from calendar import monthrange
+    from collections import defaultdict
     now = get_vietnam_time().replace(tzinfo=None)
+    daily = load_daily_revenue(db, ("package",))
 
     # ── DAILY ──
-    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    today_start = now.date()
     yesterday_start = today_start - timedelta(days=1)
 
-    today_rev = float(db.query(func.coalesce(func.sum(PackageTransaction.amount), 0)).filter(
-        PackageTransaction.status == "completed",
-        PackageTransaction.created_at >= today_start
-    ).scalar())
-
-    yesterday_rev = float(db.query(func.coalesce(func.sum(PackageTransaction.amount), 0)).filter(
-        PackageTransaction.status == "completed",
-        PackageTransaction.created_at >= yesterday_start,
-        PackageTransaction.created_at < today_start
-    ).scalar())
+    today_rev = sum_between(daily, today_start)
+    yesterday_rev = sum_between(daily, yesterday_start, today_start)
 
     daily_change = round(((today_rev - yesterday_rev) / yesterday_rev) * 100, 1) if yesterday_rev > 0 else None
 
     # ── MONTHLY ──
-    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    month_start = today_start.replace(day=1)
     if now.month == 1:
-        prev_month_start = now.replace(year=now.year - 1, month=12, day=1, hour=0, minute=0, second=0, microsecond=0)
+        prev_month_start = month_start.replace(year=now.year - 1, month=12)
     else:
-        prev_month_start = now.replace(month=now.month - 1, day=1, hour=0, minute=0, second=0, microsecond=0)
+        prev_month_start = month_start.replace(month=now.month - 1)
 
-    current_month_rev = float(db.query(func.coalesce(func.sum(PackageTransaction.amount), 0)).filter(
-        PackageTransaction.status == "completed",
-        PackageTransaction.created_at >= month_start
-    ).scalar())
-
-    prev_month_rev = float(db.query(func.coalesce(func.sum(PackageTransaction.amount), 0)).filter(
-        PackageTransaction.status == "completed",
-        PackageTransaction.created_at >= prev_month_start,
-        PackageTransaction.created_at < month_start
-    ).scalar())
+    current_month_rev = sum_between(daily, month_start)
+    prev_month_rev = sum_between(daily, prev_month_start, month_start)
 
     monthly_change = round(((current_month_rev - prev_month_rev) / prev_month_rev) * 100, 1) if prev_month_rev > 0 else None
 
@@ -501,7 +441,7 @@ async def get_revenue_detail(
         return (q - 1) * 3 + 1
 
     current_q = get_quarter(now.month)
-    current_q_start = now.replace(month=quarter_start_month(current_q), day=1, hour=0, minute=0, second=0, microsecond=0)
+    current_q_start = today_start.replace(month=quarter_start_month(current_q), day=1)
 
     # Previous quarter
     if current_q == 1:
@@ -511,41 +451,18 @@ async def get_revenue_detail(
         prev_q = current_q - 1
         prev_q_year = now.year
 
-    prev_q_start = datetime(prev_q_year, quarter_start_month(prev_q), 1, 0, 0, 0)
+    prev_q_start = current_q_start.replace(year=prev_q_year, month=quarter_start_month(prev_q))
     prev_q_end = current_q_start
 
-    current_q_rev = float(db.query(func.coalesce(func.sum(PackageTransaction.amount), 0)).filter(
-        PackageTransaction.status == "completed",
-        PackageTransaction.created_at >= current_q_start
-    ).scalar())
-
-    prev_q_rev = float(db.query(func.coalesce(func.sum(PackageTransaction.amount), 0)).filter(
-        PackageTransaction.status == "completed",
-        PackageTransaction.created_at >= prev_q_start,
-        PackageTransaction.created_at < prev_q_end
-    ).scalar())
+    current_q_rev = sum_between(daily, current_q_start)
+    prev_q_rev = sum_between(daily, prev_q_start, prev_q_end)
 
     quarterly_change = round(((current_q_rev - prev_q_rev) / prev_q_rev) * 100, 1) if prev_q_rev > 0 else None
 
     # Full quarterly breakdown across ALL years
-    quarter_breakdown_raw = db.query(
-        func.extract('year', PackageTransaction.created_at).label('year'),
-        func.extract('month', PackageTransaction.created_at).label('month'),
-        func.sum(PackageTransaction.amount).label('revenue')
-    ).filter(
-        PackageTransaction.status == "completed"
-    ).group_by(
-        func.extract('year', PackageTransaction.created_at),
-        func.extract('month', PackageTransaction.created_at)
-    ).all()
-
-    # Group monthly data into quarters
-    from collections import defaultdict
     quarter_buckets = defaultdict(float)
-    for year_val, month_val, revenue in quarter_breakdown_raw:
-        y = int(year_val)
-        q = get_quarter(int(month_val))
-        quarter_buckets[(y, q)] += float(revenue)
+    for d, revenue in daily.items():
+        quarter_buckets[(d.year, get_quarter(d.month))] += revenue
 
     quarter_breakdown = sorted([
         {
@@ -559,19 +476,11 @@ async def get_revenue_detail(
     ], key=lambda x: (x["year"], x["quarter_number"]))
 
     # ── YEARLY ──
-    year_start = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
-    prev_year_start = datetime(now.year - 1, 1, 1, 0, 0, 0)
-
-    current_year_rev = float(db.query(func.coalesce(func.sum(PackageTransaction.amount), 0)).filter(
-        PackageTransaction.status == "completed",
-        PackageTransaction.created_at >= year_start
-    ).scalar())
-
-    prev_year_rev = float(db.query(func.coalesce(func.sum(PackageTransaction.amount), 0)).filter(
-        PackageTransaction.status == "completed",
-        PackageTransaction.created_at >= prev_year_start,
-        PackageTransaction.created_at < year_start
-    ).scalar())
+    year_start = today_start.replace(month=1, day=1)
+    prev_year_start = year_start.replace(year=now.year - 1)
+
+    current_year_rev = sum_between(daily, year_start)
+    prev_year_rev = sum_between(daily, prev_year_start, year_start)
 
     yearly_change = round(((current_year_rev - prev_year_rev) / prev_year_rev) * 100, 1) if prev_year_rev > 0 else None
 
@@ -3,12 +3,11 @@ from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models.models import User
 from pydantic import BaseModel, EmailStr
-import dns.resolver
 import re
 import os
 import secrets
-from app.utils.email_utils import send_email
-from app.utils.email_blocklist import is_disposable_email
+from app.utils.email_outbox import enqueue_email
+from app.utils.email_domains import check_domain
 from app.utils.redis_cache import cache
 from typing import Dict
 
@@ -29,27 +28,15 @@ def is_valid_email_format(email: str) -> bool:
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
     return bool(re.match(pattern, email))
 
-def verify_email_domain(email: str) -> Dict[str, bool]:
-    """Verify if the email domain exists and has MX records"""
+async def verify_email_domain(email: str) -> Dict[str, bool]:
+    """Verify the email format, that its domain can receive mail (MX, else A) and
+    that it is not a disposable provider. The domain part is a cached verdict
+    shared across workers (see app/utils/email_domains.py)."""
     if not is_valid_email_format(email):
-        return {"valid_format": False, "domain_exists": False}
+        return {"valid_format": False, "domain_exists": False, "disposable": False}
     
-    domain = email.split('@')[-1]
-    
-    try:
-        # Check if the domain has MX records
-        dns.resolver.resolve(domain, 'MX')
-        return {"valid_format": True, "domain_exists": True}
-    except (dns.resolver.NoAnswer, dns.resolver.NXDOMAIN, dns.resolver.NoNameservers, dns.exception.Timeout):
-        try:
-            # Fallback to A records if no MX records
-            dns.resolver.resolve(domain, 'A')
-            return {"valid_format": True, "domain_exists": True}
-        except:
-            return {"valid_format": True, "domain_exists": False}
-    except Exception:
-        return {"valid_format": True, "domain_exists": False}
-
+    verdict = await check_domain(email.split('@')[-1])
+    return {"valid_format": True, **verdict}
  
 @router.post("/verify-email", response_model=Dict)
 async def verify_email(
@@ -63,7 +50,7 @@ async def verify_email(
     email = request.email
     
     # Step 1: Verify email format and domain
-    verification_result = verify_email_domain(email)
+    verification_result = await verify_email_domain(email)
     
     if not verification_result["valid_format"]:
         return {
@@ -80,7 +67,7 @@ async def verify_email(
         }
 
     # Reject disposable / temporary email providers
-    if is_disposable_email(email):
+    if verification_result["disposable"]:
         return {
             "valid": False,
             "exists": False,
@@ -140,14 +127,14 @@ async def send_verification_code(
     email = request.email.strip().lower()
 
     # Format + domain (MX/A) check
-    domain_result = verify_email_domain(email)
+    domain_result = await verify_email_domain(email)
     if not domain_result["valid_format"]:
         raise HTTPException(status_code=400, detail="Email không đúng định dạng")
     if not domain_result["domain_exists"]:
         raise HTTPException(status_code=400, detail="Tên miền email không tồn tại hoặc không nhận được email")
 
     # Block disposable providers
-    if is_disposable_email(email):
+    if domain_result["disposable"]:
         raise HTTPException(status_code=400, detail="Vui lòng dùng email cá nhân thật (không dùng email tạm thời)")
 
     # Don't send codes to emails that are already registered
@@ -166,11 +153,11 @@ async def send_verification_code(
         raise HTTPException(status_code=503, detail="Dịch vụ xác thực tạm thời không khả dụng, vui lòng thử lại sau")
     await cache.set(OTP_COOLDOWN_KEY.format(email=email), "1", ttl=OTP_RESEND_COOLDOWN)
 
-    # Send it (transactional email path)
+    # Queue it (transactional outbox; a worker delivers it in the background)
     try:
-        send_email(email, "thiieltstrenmay.com - Mã xác thực đăng ký", _otp_email_html(code))
+        enqueue_email(db, email, "thiieltstrenmay.com - Mã xác thực đăng ký", _otp_email_html(code), category="otp")
     except Exception as e:
-        print(f"Failed to send OTP email to {email}: {e}")
+        print(f"Failed to queue OTP email to {email}: {e}")
         raise HTTPException(status_code=502, detail="Không gửi được mã xác thực, vui lòng thử lại")
 
     return {"success": True, "message": "Đã gửi mã xác thực tới email của bạn"}
@@ -7,7 +7,8 @@ from datetime import datetime, timedelta
 from jose import jwt, JWTError
 import os
 import secrets
-from app.utils.email_utils import send_password_reset_email, send_email
+from app.utils.email_utils import build_password_reset_email
+from app.utils.email_outbox import enqueue_email
 from app.routes.admin.auth import pwd_context, SECRET_KEY, ALGORITHM, create_access_token, get_current_user
 from app.utils.datetime_utils import get_vietnam_time
 from app.utils.redis_cache import cache
@@ -67,15 +68,16 @@ async def request_password_reset(
         expires_delta=reset_token_expires
     )
     
-    # Send password reset email
-    email_sent = send_password_reset_email(
-        to_email=user.email,
+    # Queue password reset email (transactional outbox)
+    subject, html_content = build_password_reset_email(
         reset_token=reset_token,
         username=user.username,
         frontend_url=FRONTEND_URL
     )
-    
-    if not email_sent:
+    try:
+        enqueue_email(db, user.email, subject, html_content, category="password_reset")
+    except Exception as e:
+        print(f"Failed to queue password reset email to {user.email}: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to send password reset email. Please try again later."
@@ -232,15 +234,17 @@ async def request_change_password_code(
         ttl=CHANGE_PW_OTP_COOLDOWN
     )
 
-    # Send it (transactional email path)
+    # Queue it (transactional outbox; a worker delivers it in the background)
     try:
-        send_email(
+        enqueue_email(
+            db,
             current_user.email,
             "thiieltstrenmay.com - Mã xác thực đổi mật khẩu",
-            _change_pw_otp_email_html(code, current_user.username)
+            _change_pw_otp_email_html(code, current_user.username),
+            category="otp"
         )
     except Exception as e:
-        print(f"Failed to send change-password OTP to {current_user.email}: {e}")
+        print(f"Failed to queue change-password OTP to {current_user.email}: {e}")
         raise HTTPException(
             status_code=status.HTTP_502_BAD_GATEWAY,
             detail="Không gửi được mã xác thực, vui lòng thử lại"
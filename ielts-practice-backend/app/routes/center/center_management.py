@@ -6,8 +6,19 @@ center-students get role='customer' (no 90-day student window — access depends
 purely on VIP the center buys in P2). Membership rows mark who belongs to the
 center; class_members joins them into classrooms (a teacher may teach several
 classes; a student has 0 or 1 class → 'khách lẻ' when none).
+
+The teacher/student lists are built with three queries whatever the center's
+size (memberships, their users, their class assignments) and cached per
+center and member type. Every write here that changes what a list shows
+(member create/update, class rename, class membership) and the wallet VIP
+purchases drop the cache; changes made elsewhere (a member editing their own
+profile or buying VIP themselves) show up within CENTER_MEMBERS_TTL. VIP
+status is derived from the cached vip_expiry on every read.
 """
+from datetime import datetime
+
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List
@@ -19,9 +30,12 @@ from app.models.models import (
 from app.routes.admin.auth import get_current_center, pwd_context
 from app.routes.center.center_actions import _center_of
 from app.utils.datetime_utils import get_vietnam_time
+from app.utils.redis_cache import cache, get_center_members_cache_key
 
 router = APIRouter()
 
+CENTER_MEMBERS_TTL = 300
+
 
 # ── helpers ──────────────────────────────────────────────────────────────────
 
@@ -29,13 +43,17 @@ def _now():
     return get_vietnam_time().replace(tzinfo=None)
 
 
+def _vip_status_at(vip_expiry: Optional[datetime]) -> dict:
+    now = _now()
+    if vip_expiry and vip_expiry > now:
+        return {"is_vip": True, "remaining_days": (vip_expiry - now).days}
+    return {"is_vip": False, "remaining_days": 0}
+
+
 def _vip_status(user: User) -> dict:
     """Derive VIP status from user.vip_expiry (what the center's VIP grant in P2
     will set)."""
-    now = _now()
-    if user.vip_expiry and user.vip_expiry > now:
-        return {"is_vip": True, "remaining_days": (user.vip_expiry - now).days}
-    return {"is_vip": False, "remaining_days": 0}
+    return _vip_status_at(user.vip_expiry)
 
 
 def _membership_or_404(db: Session, center: Center, user_id: int, member_type: Optional[str] = None) -> CenterMembership:
@@ -61,25 +79,81 @@ def _classes_of_user(db: Session, center: Center, user_id: int) -> List[dict]:
     return [{"class_id": c.class_id, "name": c.name} for c in rows]
 
 
+def _classes_by_user(db: Session, center: Center, user_ids: List[int]) -> dict:
+    """user_id -> classes in this center, for many users in one query."""
+    out = {user_id: [] for user_id in user_ids}
+    if not user_ids:
+        return out
+    rows = (
+        db.query(ClassMember.user_id, Classroom.class_id, Classroom.name)
+        .join(Classroom, ClassMember.class_id == Classroom.class_id)
+        .filter(ClassMember.user_id.in_(user_ids), Classroom.center_id == center.center_id)
+        .order_by(Classroom.class_id)
+        .all()
+    )
+    for user_id, class_id, name in rows:
+        out[user_id].append({"class_id": class_id, "name": name})
+    return out
+
+
 def _sync_active(user: User, membership: CenterMembership):
     """A member can log in only when neither paused nor disabled."""
     user.is_active = not (membership.is_paused or membership.is_disabled)
 
 
+def _member_rows(db: Session, center: Center, memberships: List[CenterMembership]) -> List[dict]:
+    """Serialize memberships with one users query and one classes query.
+    Rows carry vip_expiry; _present_member turns it into the vip status."""
+    user_ids = [m.user_id for m in memberships]
+    users = {u.user_id: u for u in db.query(User).filter(User.user_id.in_(user_ids))} if user_ids else {}
+    classes = _classes_by_user(db, center, user_ids)
+    rows = []
+    for m in memberships:
+        u = users.get(m.user_id)
+        if not u:
+            continue
+        rows.append({
+            "user_id": u.user_id,
+            "username": u.username,
+            "email": u.email,
+            "image_url": u.image_url,
+            "member_type": m.member_type,
+            "classes": classes[u.user_id],
+            "vip_expiry": u.vip_expiry,
+            "is_paused": m.is_paused,
+            "is_disabled": m.is_disabled,
+            "created_at": m.created_at,
+        })
+    return jsonable_encoder(rows)
+
+
+def _present_member(row: dict) -> dict:
+    row = dict(row)
+    vip_expiry = row.pop("vip_expiry")
+    row["vip"] = _vip_status_at(datetime.fromisoformat(vip_expiry) if vip_expiry else None)
+    return row
+
+
 def _member_dict(db: Session, center: Center, m: CenterMembership) -> dict:
-    u = m.user
-    return {
-        "user_id": u.user_id,
-        "username": u.username,
-        "email": u.email,
-        "image_url": u.image_url,
-        "member_type": m.member_type,
-        "classes": _classes_of_user(db, center, u.user_id),
-        "vip": _vip_status(u),
-        "is_paused": m.is_paused,
-        "is_disabled": m.is_disabled,
-        "created_at": m.created_at,
-    }
+    return _present_member(_member_rows(db, center, [m])[0])
+
+
+async def _member_list(db: Session, center: Center, member_type: str) -> List[dict]:
+    key = get_center_members_cache_key(center.center_id, member_type)
+    rows = await cache.get(key)
+    if rows is None:
+        members = db.query(CenterMembership).filter(
+            CenterMembership.center_id == center.center_id,
+            CenterMembership.member_type == member_type,
+        ).all()
+        rows = _member_rows(db, center, members)
+        await cache.set(key, rows, CENTER_MEMBERS_TTL)
+    return [_present_member(row) for row in rows]
+
+
+async def invalidate_member_lists(center_id: int):
+    for member_type in ("teacher", "student"):
+        await cache.delete(get_center_members_cache_key(center_id, member_type))
 
 
 # ── schemas ──────────────────────────────────────────────────────────────────
@@ -113,7 +187,7 @@ class ClassMemberRequest(BaseModel):
 
 # ── member creation ──────────────────────────────────────────────────────────
 
-def _create_member(request: CreateMemberRequest, role: str, member_type: str,
+async def _create_member(request: CreateMemberRequest, role: str, member_type: str,
                    center: Center, db: Session) -> dict:
     if db.query(User).filter(User.username == request.username).first():
         raise HTTPException(status_code=400, detail="Tên đăng nhập đã tồn tại")
@@ -150,6 +224,7 @@ def _create_member(request: CreateMemberRequest, role: str, member_type: str,
         db.add(ClassMember(class_id=cls.class_id, user_id=user.user_id))
 
     db.commit()
+    await invalidate_member_lists(center.center_id)
     db.refresh(membership)
     return _member_dict(db, center, membership)
 
@@ -161,7 +236,7 @@ async def create_teacher(request: CreateMemberRequest,
     center = _center_of(current_center, db)
     # Teachers are role='customer' (take tests like a VIP customer); the
     # member_type='teacher' membership is what marks them as a teacher.
-    return _create_member(request, role="customer", member_type="teacher", center=center, db=db)
+    return await _create_member(request, role="customer", member_type="teacher", center=center, db=db)
 
 
 @router.post("/center/students", response_model=dict)
@@ -169,7 +244,7 @@ async def create_student(request: CreateMemberRequest,
                         current_center: User = Depends(get_current_center),
                         db: Session = Depends(get_db)):
     center = _center_of(current_center, db)
-    return _create_member(request, role="customer", member_type="student", center=center, db=db)
+    return await _create_member(request, role="customer", member_type="student", center=center, db=db)
 
 
 # ── member listing ───────────────────────────────────────────────────────────
@@ -178,22 +253,14 @@ async def create_student(request: CreateMemberRequest,
 async def list_teachers(current_center: User = Depends(get_current_center),
                        db: Session = Depends(get_db)):
     center = _center_of(current_center, db)
-    members = db.query(CenterMembership).filter(
-        CenterMembership.center_id == center.center_id,
-        CenterMembership.member_type == "teacher",
-    ).all()
-    return [_member_dict(db, center, m) for m in members]
+    return await _member_list(db, center, "teacher")
 
 
 @router.get("/center/students", response_model=List[dict])
 async def list_students(current_center: User = Depends(get_current_center),
                        db: Session = Depends(get_db)):
     center = _center_of(current_center, db)
-    members = db.query(CenterMembership).filter(
-        CenterMembership.center_id == center.center_id,
-        CenterMembership.member_type == "student",
-    ).all()
-    return [_member_dict(db, center, m) for m in members]
+    return await _member_list(db, center, "student")
 
 
 # ── member update (rename / password / pause / disable) ──────────────────────
@@ -219,6 +286,7 @@ async def update_member(user_id: int, request: UpdateMemberRequest,
 
     _sync_active(user, m)
     db.commit()
+    await invalidate_member_lists(center.center_id)
     db.refresh(m)
     return _member_dict(db, center, m)
 
@@ -297,6 +365,7 @@ async def update_class(class_id: int, request: ClassUpdateRequest,
     if request.is_active is not None:
         cls.is_active = request.is_active
     db.commit()
+    await invalidate_member_lists(center.center_id)
     db.refresh(cls)
     return _class_dict(db, center, cls)
 
@@ -316,6 +385,7 @@ async def add_class_member(class_id: int, request: ClassMemberRequest,
     if not exists:
         db.add(ClassMember(class_id=cls.class_id, user_id=request.user_id))
         db.commit()
+        await invalidate_member_lists(center.center_id)
     return _class_dict(db, center, cls)
 
 
@@ -332,4 +402,5 @@ async def remove_class_member(class_id: int, user_id: int,
     if row:
         db.delete(row)
         db.commit()
+        await invalidate_member_lists(center.center_id)
     return _class_dict(db, center, cls)
@@ -16,7 +16,7 @@ from app.models.models import (
 )
 from app.routes.admin.auth import get_current_center
 from app.routes.center.center_actions import _center_of
-from app.routes.center.center_management import _vip_status, _classes_of_user, _membership_or_404
+from app.routes.center.center_management import _vip_status, _classes_of_user, _classes_by_user, _membership_or_404
 from app.routes.center.teacher_dashboard import _student_accuracy, _result_accuracy
 
 router = APIRouter()
@@ -68,6 +68,7 @@ async def reports_members(
                 CenterMembership.member_type == member_type)
         .all()
     )
+    classes = _classes_by_user(db, center, [m.user_id for m in ms])
     out = []
     for m in ms:
         u = m.user
@@ -80,7 +81,7 @@ async def reports_members(
             "user_id": u.user_id,
             "username": u.username,
             "email": u.email,
-            "classes": _classes_of_user(db, center, u.user_id),
+            "classes": classes[u.user_id],
             "accuracy": acc["accuracy"],
             "answered": acc["answered"],
             "exams_completed": exams_done,
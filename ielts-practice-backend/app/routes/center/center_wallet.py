@@ -5,28 +5,31 @@ Flow:
     pending CenterWalletTransaction + a PayOS checkout link). The shared PayOS
     webhook credits the wallet on success.
   - The center then buys VIP for a teacher/student FROM the wallet
-    (POST /center/vip/purchase), paying a tiered-discounted price and having the
-    VIP granted directly (no second payment). Each purchase increments the
-    center's cumulative count, which drives the 0/5/10% discount tier.
+    (POST /center/vip/purchase), or for many members at once
+    (POST /center/vip/purchase-bulk), paying a tiered-discounted price and
+    having the VIP granted directly (no second payment). Each seat increments
+    the center's cumulative count, which drives the 0/5/10% discount tier.
 """
 import time
 from datetime import timedelta
 from urllib.parse import urlparse
 
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import case, func, insert, or_, update
+from sqlalchemy.orm import Session, joinedload
 from pydantic import BaseModel, Field
 from typing import List, Optional
 
 from app.database import get_db
 from app.models.models import (
-    User, Center, VIPPackage, VIPSubscription, CenterWalletTransaction,
+    User, Center, CenterMembership, VIPPackage, VIPSubscription, CenterWalletTransaction,
 )
 from app.routes.admin.auth import get_current_center
 from app.routes.center.center_actions import _center_of, compute_discount_rate
-from app.routes.center.center_management import _membership_or_404
+from app.routes.center.center_management import _membership_or_404, invalidate_member_lists
 from app.utils.payos_service import create_payment_link
 from app.utils.datetime_utils import get_vietnam_time
+from app.utils.revenue_rollup import on_center_vip_purchases
 
 router = APIRouter()
 
@@ -149,98 +152,195 @@ async def list_packages(current_center: User = Depends(get_current_center),
     } for p in packages]
 
 
-# ── buy VIP for a member, paid from the wallet ───────────────────────────────
+# ── buy VIP for members, paid from the wallet ──────────────────────────────
+#
+# The wallet is debited with one conditional UPDATE
+#   SET wallet_balance = wallet_balance - :total, vip_purchase_count = ... + :n
+#   WHERE center_id = :id AND wallet_balance >= :total AND vip_purchase_count = :count
+# instead of reading the balance into Python and writing it back, so two
+# purchases (or a purchase and a PayOS credit) racing on the same center can
+# neither overspend the wallet nor lose each other's update. The count check
+# keeps the per-seat discount tiers honest: if another purchase advanced the
+# count since we priced the seats, re-price against the fresh row and retry.
+
+MAX_BULK_SEATS = 200
+DEBIT_ATTEMPTS = 3
+
 
 class PurchaseVIPRequest(BaseModel):
     target_user_id: int
     package_id: int
 
 
-def _grant_vip(db: Session, target: User, package: VIPPackage):
-    """Create a completed VIPSubscription (stacking onto any active one) and
-    bump the user's is_vip/vip_expiry — the no-payment grant path."""
-    now = _now()
+class BulkPurchaseVIPRequest(BaseModel):
+    target_user_ids: List[int] = Field(..., min_length=1, max_length=MAX_BULK_SEATS)
+    package_id: int
+
+
+class InsufficientBalance(Exception):
+    pass
+
+
+def price_seats(package: VIPPackage, vip_purchase_count: int, seats: int) -> List[tuple]:
+    """(discount_rate, price) per seat; seat i is the center's (count + i + 1)-th
+    purchase, so a batch that crosses a tier boundary is priced like the same
+    purchases made one by one."""
+    out = []
+    for i in range(seats):
+        rate = compute_discount_rate((vip_purchase_count or 0) + i)
+        out.append((rate, round(package.price * (1 - rate / 100))))
+    return out
+
+
+def _debit_wallet(db: Session, center_id: int, total: int, count: int, seats: int) -> bool:
+    result = db.execute(
+        update(Center)
+        .where(
+            Center.center_id == center_id,
+            Center.wallet_balance >= total,
+            Center.vip_purchase_count == count,
+        )
+        .values(
+            wallet_balance=Center.wallet_balance - total,
+            wallet_used=Center.wallet_used + total,
+            vip_purchase_count=Center.vip_purchase_count + seats,
+            discount_rate=compute_discount_rate(count + seats),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def _stacking_starts(db: Session, user_ids: List[int], package: VIPPackage, now) -> dict:
+    """user_id -> end of the subscription a new one stacks onto (one query)."""
     if package.package_type == "single_skill":
-        active = db.query(VIPSubscription).join(VIPPackage).filter(
-            VIPSubscription.user_id == target.user_id,
-            VIPSubscription.end_date > now,
-            VIPSubscription.payment_status == "completed",
-            ((VIPPackage.package_type == "single_skill") & (VIPPackage.skill_type == package.skill_type)) |
-            (VIPPackage.package_type == "all_skills")
-        ).order_by(VIPSubscription.end_date.desc()).first()
+        covers = ((VIPPackage.package_type == "single_skill") & (VIPPackage.skill_type == package.skill_type)) | \
+                 (VIPPackage.package_type == "all_skills")
     else:
-        active = db.query(VIPSubscription).join(VIPPackage).filter(
-            VIPSubscription.user_id == target.user_id,
+        covers = VIPPackage.package_type == "all_skills"
+    rows = (
+        db.query(VIPSubscription.user_id, func.max(VIPSubscription.end_date))
+        .join(VIPPackage)
+        .filter(
+            VIPSubscription.user_id.in_(user_ids),
             VIPSubscription.end_date > now,
             VIPSubscription.payment_status == "completed",
-            VIPPackage.package_type == "all_skills"
-        ).order_by(VIPSubscription.end_date.desc()).first()
-
-    start = active.end_date if active else now
-    end = start + timedelta(days=package.duration_months * 30)
-    sub = VIPSubscription(
-        user_id=target.user_id,
-        package_id=package.package_id,
-        start_date=start,
-        end_date=end,
-        payment_status="completed",
-        created_at=now,
+            covers,
+        )
+        .group_by(VIPSubscription.user_id)
+        .all()
+    )
+    return dict(rows)
+
+
+def purchase_vip_seats(db: Session, center: Center, package: VIPPackage, targets: List[User]) -> dict:
+    """Buy `package` for each of `targets` (distinct members of `center`) from
+    the wallet, in the caller's transaction: one conditional wallet UPDATE, one
+    stacking query, then multi-row inserts of the subscriptions and ledger
+    entries and one UPDATE of the users. Raises InsufficientBalance; does not
+    commit."""
+    seats = len(targets)
+    count = center.vip_purchase_count or 0
+    for _ in range(DEBIT_ATTEMPTS):
+        prices = price_seats(package, count, seats)
+        total = sum(price for _, price in prices)
+        if _debit_wallet(db, center.center_id, total, count, seats):
+            break
+        # Balance too low, or a concurrent purchase moved the tier: locking
+        # read of the current row (a plain SELECT could return this
+        # transaction's stale snapshot)
+        balance, count = (
+            db.query(Center.wallet_balance, Center.vip_purchase_count)
+            .filter(Center.center_id == center.center_id)
+            .with_for_update()
+            .one()
+        )
+        if balance < sum(price for _, price in price_seats(package, count, seats)):
+            raise InsufficientBalance()
+    else:
+        raise InsufficientBalance()
+
+    now = _now()
+    user_ids = [target.user_id for target in targets]
+    stack_on = _stacking_starts(db, user_ids, package, now)
+    duration = timedelta(days=package.duration_months * 30)
+    ends = {user_id: stack_on.get(user_id, now) + duration for user_id in user_ids}
+
+    db.execute(insert(VIPSubscription), [{
+        "user_id": user_id,
+        "package_id": package.package_id,
+        "start_date": stack_on.get(user_id, now),
+        "end_date": ends[user_id],
+        "payment_status": "completed",
+        "created_at": now,
+    } for user_id in user_ids])
+    new_end = case(ends, value=User.user_id)
+    db.execute(
+        update(User)
+        .where(User.user_id.in_(user_ids))
+        .values(
+            is_vip=True,
+            vip_expiry=case(
+                (or_(User.vip_expiry.is_(None), User.vip_expiry < new_end), new_end),
+                else_=User.vip_expiry,
+            ),
+        )
+        .execution_options(synchronize_session=False)
     )
-    db.add(sub)
-    db.flush()
-    target.is_vip = True
-    if target.vip_expiry is None or end > target.vip_expiry:
-        target.vip_expiry = end
-    return sub, end
+    db.execute(insert(CenterWalletTransaction), [{
+        "center_id": center.center_id,
+        "type": "vip_purchase",
+        "amount": price,
+        "method": "wallet",
+        "status": "completed",
+        "target_user_id": target.user_id,
+        "package_id": package.package_id,
+        "discount_rate": rate,
+        "note": f"VIP {package.name} cho {target.username}",
+        "created_at": now,
+    } for target, (rate, price) in zip(targets, prices)])
+    on_center_vip_purchases(db, now, total, seats)
 
+    return {"prices": prices, "total": total, "ends": ends, "vip_purchase_count": count + seats}
 
-@router.post("/center/vip/purchase", response_model=dict)
-async def purchase_vip(request: PurchaseVIPRequest,
-                      current_center: User = Depends(get_current_center),
-                      db: Session = Depends(get_db)):
-    center = _center_of(current_center, db)
-    membership = _membership_or_404(db, center, request.target_user_id)  # teacher or student of this center
-    target = membership.user
 
+def _active_package_or_404(db: Session, package_id: int) -> VIPPackage:
     package = db.query(VIPPackage).filter(
-        VIPPackage.package_id == request.package_id,
+        VIPPackage.package_id == package_id,
         VIPPackage.is_active == True,
     ).first()
     if not package:
         raise HTTPException(status_code=404, detail="Không tìm thấy gói VIP")
+    return package
 
-    rate = compute_discount_rate(center.vip_purchase_count)
-    price = round(package.price * (1 - rate / 100))
-
-    if center.wallet_balance < price:
-        raise HTTPException(status_code=400, detail="Số dư ví không đủ, vui lòng nạp thêm")
 
-    # Deduct from wallet
-    center.wallet_balance -= price
-    center.wallet_used += price
+def _wallet_state(db: Session, center: Center) -> dict:
+    db.refresh(center)
+    return {
+        "wallet_balance": center.wallet_balance,
+        "vip_purchase_count": center.vip_purchase_count,
+        "next_discount_rate": center.discount_rate,
+    }
 
-    # Grant VIP
-    sub, end = _grant_vip(db, target, package)
 
-    # Advance the discount tier
-    center.vip_purchase_count += 1
-    center.discount_rate = compute_discount_rate(center.vip_purchase_count)
+@router.post("/center/vip/purchase", response_model=dict)
+async def purchase_vip(request: PurchaseVIPRequest,
+                      current_center: User = Depends(get_current_center),
+                      db: Session = Depends(get_db)):
+    center = _center_of(current_center, db)
+    membership = _membership_or_404(db, center, request.target_user_id)  # teacher or student of this center
+    target = membership.user
+    package = _active_package_or_404(db, request.package_id)
 
-    # Ledger entry
-    txn = CenterWalletTransaction(
-        center_id=center.center_id,
-        type="vip_purchase",
-        amount=price,
-        method="wallet",
-        status="completed",
-        target_user_id=target.user_id,
-        package_id=package.package_id,
-        discount_rate=rate,
-        note=f"VIP {package.name} cho {target.username}",
-    )
-    db.add(txn)
+    try:
+        result = purchase_vip_seats(db, center, package, [target])
+    except InsufficientBalance:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Số dư ví không đủ, vui lòng nạp thêm")
     db.commit()
+    await invalidate_member_lists(center.center_id)
 
+    rate, price = result["prices"][0]
     return {
         "message": "Đã mua VIP thành công",
         "target_user_id": target.user_id,
@@ -248,8 +348,51 @@ async def purchase_vip(request: PurchaseVIPRequest,
         "package": package.name,
         "price": price,
         "discount_rate": rate,
-        "vip_expiry": end,
-        "wallet_balance": center.wallet_balance,
-        "vip_purchase_count": center.vip_purchase_count,
-        "next_discount_rate": center.discount_rate,
+        "vip_expiry": result["ends"][target.user_id],
+        **_wallet_state(db, center),
+    }
+
+
+@router.post("/center/vip/purchase-bulk", response_model=dict)
+async def purchase_vip_bulk(request: BulkPurchaseVIPRequest,
+                           current_center: User = Depends(get_current_center),
+                           db: Session = Depends(get_db)):
+    """Buy one package for many members at once; all seats or none."""
+    center = _center_of(current_center, db)
+    user_ids = list(dict.fromkeys(request.target_user_ids))
+    if len(user_ids) != len(request.target_user_ids):
+        raise HTTPException(status_code=400, detail="Danh sách thành viên bị trùng")
+
+    members = {
+        m.user_id: m.user
+        for m in db.query(CenterMembership)
+        .options(joinedload(CenterMembership.user))
+        .filter(CenterMembership.center_id == center.center_id, CenterMembership.user_id.in_(user_ids))
+    }
+    missing = [user_id for user_id in user_ids if user_id not in members]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Không tìm thấy thành viên trong trung tâm này: {missing}")
+    package = _active_package_or_404(db, request.package_id)
+
+    targets = [members[user_id] for user_id in user_ids]
+    try:
+        result = purchase_vip_seats(db, center, package, targets)
+    except InsufficientBalance:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Số dư ví không đủ, vui lòng nạp thêm")
+    db.commit()
+    await invalidate_member_lists(center.center_id)
+
+    return {
+        "message": f"Đã mua VIP cho {len(targets)} thành viên",
+        "package": package.name,
+        "total_price": result["total"],
+        "seats": [{
+            "target_user_id": target.user_id,
+            "target_username": target.username,
+            "price": price,
+            "discount_rate": rate,
+            "vip_expiry": result["ends"][target.user_id],
+        } for target, (rate, price) in zip(targets, result["prices"])],
+        **_wallet_state(db, center),
     }
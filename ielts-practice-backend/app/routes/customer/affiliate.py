@@ -4,7 +4,6 @@ Each customer sees their referral link, signup count, total commission earned,
 wallet balance (xu) + history, and can request a bank withdrawal (≥ 300,000 xu).
 """
 import os
-import uuid
 from typing import Optional, List
 
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, BackgroundTasks
@@ -17,6 +16,7 @@ from app.models.models import User, AffiliateWalletTx, AffiliateWithdrawal
 from app.routes.admin.auth import get_current_student
 from app.utils.affiliate import ensure_referral_code, WITHDRAW_MIN_XU
 from app.utils.datetime_utils import get_vietnam_time
+from app.utils.uploads import UploadRejected, image_policy, ingest_upload
 
 router = APIRouter()
 
@@ -121,6 +121,7 @@ async def my_withdrawals(db: Session = Depends(get_db), current: User = Depends(
 # ── payout method (Payment page) ─────────────────────────────────────────────
 
 PAYOUT_QR_DIR = "static/affiliate_qr"
+PAYOUT_QR_IMAGES = image_policy(PAYOUT_QR_DIR, f"/{PAYOUT_QR_DIR}")
 
 
 def _has_payout(user: User) -> bool:
@@ -166,15 +167,12 @@ async def upload_payout_qr(
     db: Session = Depends(get_db),
     current: User = Depends(get_current_student),
 ):
-    if not image.content_type or not image.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="File phải là ảnh")
-    os.makedirs(PAYOUT_QR_DIR, exist_ok=True)
-    ext = os.path.splitext(image.filename or "")[1] or ".png"
-    fname = f"{uuid.uuid4().hex}{ext}"
-    path = os.path.join(PAYOUT_QR_DIR, fname)
-    with open(path, "wb") as f:
-        f.write(await image.read())
-    current.payout_qr_url = f"/{PAYOUT_QR_DIR}/{fname}"
+    # Streamed to a content-addressed file; the type is checked from the bytes
+    try:
+        stored = await ingest_upload(image, PAYOUT_QR_IMAGES)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    current.payout_qr_url = stored.url
     db.commit()
     return {"ok": True, "qr_url": current.payout_qr_url}
 
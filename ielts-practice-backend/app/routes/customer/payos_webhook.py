@@ -4,11 +4,13 @@ Receives payment notifications from PayOS and auto-completes transactions.
 Security: HMAC_SHA256 checksum verification, amount validation, idempotency.
 """
 from fastapi import APIRouter, Depends, Request, HTTPException
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models.models import PackageTransaction, VIPSubscription, User, CenterWalletTransaction, Center
 from app.utils.payos_service import verify_webhook
 from app.utils.datetime_utils import get_vietnam_time
+from app.utils.revenue_rollup import on_package_transaction_status, on_center_transaction_status
 import logging
 
 logger = logging.getLogger(__name__)
@@ -30,11 +32,20 @@ def _handle_center_deposit(db, center_txn, webhook_data, webhook_amount):
 
     is_success = str(getattr(webhook_data, 'code', None)) == "00"
     if is_success:
-        center = db.query(Center).filter(Center.center_id == center_txn.center_id).first()
-        if center:
-            center.wallet_balance += center_txn.amount
-            center.wallet_deposited += center_txn.amount
+        # In-place increment: a read-modify-write here could undo a wallet
+        # debit committed between our read and write
+        db.execute(
+            update(Center)
+            .where(Center.center_id == center_txn.center_id)
+            .values(
+                wallet_balance=Center.wallet_balance + center_txn.amount,
+                wallet_deposited=Center.wallet_deposited + center_txn.amount,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        old_status = center_txn.status
         center_txn.status = "completed"
+        on_center_transaction_status(db, center_txn, old_status)
         db.commit()
         logger.info(f"PayOS center deposit SUCCESS: txn={center_txn.transaction_id}, amount={center_txn.amount}")
     else:
@@ -119,8 +130,10 @@ async def payos_webhook(request: Request, db: Session = Depends(get_db)):
         
         if is_success:
             # Payment successful - activate subscription
+            old_status = transaction.status
             transaction.status = "completed"
             transaction.admin_note = "Tự động xác nhận bởi PayOS"
+            on_package_transaction_status(db, transaction, old_status)
             
             # Update subscription
             subscription = db.query(VIPSubscription).filter(
@@ -0,0 +1,24 @@
+import hmac
+import os
+
+from fastapi import APIRouter, HTTPException, Request, Response
+
+from app.utils.metrics import render_metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+def get_metrics(request: Request):
+    """Prometheus exposition for all workers (see app/utils/metrics.py).
+    Disabled (403) until METRICS_TOKEN is set; the scraper sends it as a bearer token."""
+    token = os.getenv("METRICS_TOKEN")
+    if not token:
+        raise HTTPException(status_code=403, detail="Metrics are disabled: METRICS_TOKEN is not set")
+    if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    rendered = render_metrics()
+    if rendered is None:
+        raise HTTPException(status_code=503, detail="prometheus_client is not installed")
+    body, content_type = rendered
+    return Response(content=body, media_type=content_type)
@@ -0,0 +1,60 @@
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from app.database import get_db
+from app.models.models import ExamResult
+from app.routes.admin.auth import get_current_student
+from app.utils.exam_catalog import allowed_access_types, catalog_cards, filter_catalog, get_catalog
+
+router = APIRouter()
+
+
+def _latest_results(db: Session, user_id: int, exam_ids, skill: str) -> dict:
+    """exam_id -> total_score of the user's latest result, for one page of tests.
+    Listening counts full tests only, as /available-listening-exams does."""
+    if not exam_ids:
+        return {}
+    query = db.query(ExamResult.exam_id, ExamResult.total_score).filter(
+        ExamResult.user_id == user_id,
+        ExamResult.exam_id.in_(exam_ids),
+    )
+    if skill == "listening":
+        query = query.filter(ExamResult.is_forecast.in_([False, None]))
+    latest = {}
+    for exam_id, total_score in query.order_by(ExamResult.completion_date):
+        latest[exam_id] = total_score
+    return latest
+
+
+@router.get("/catalog/{skill}", response_model=dict)
+async def get_test_catalog(
+    skill: Literal['listening', 'reading'],
+    types: Optional[str] = Query(None, description="comma-separated question types, e.g. fill_blank,matching"),
+    match: Literal['any', 'all'] = 'any',
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100),
+    current_student = Depends(get_current_student),
+    db: Session = Depends(get_db)
+):
+    """Tests the student can open, filtered by question type and paginated,
+    with per-type counts for the filter chips (app/utils/exam_catalog.py)."""
+    wanted = [t.strip() for t in (types or "").split(",") if t.strip()]
+    access_types = allowed_access_types(current_student)
+    catalog = await get_catalog(db)
+    found = filter_catalog(catalog, skill, access_types, wanted, match)
+
+    exam_ids = found["exam_ids"][(page - 1) * page_size:page * page_size]
+    latest = _latest_results(db, current_student.user_id, exam_ids, skill)
+    items = catalog_cards(catalog, skill, exam_ids, access_types, wanted)
+    for item in items:
+        item["is_completed"] = item["exam_id"] in latest
+        item["total_score"] = latest.get(item["exam_id"]) or 0
+    return {
+        "items": items,
+        "total": len(found["exam_ids"]),
+        "page": page,
+        "page_size": page_size,
+        "facets": found["facet_counts"],
+    }
@@ -7,8 +7,9 @@ from typing import List, Dict
 from sqlalchemy.sql import func
 from datetime import datetime
 from pydantic import BaseModel
-from app.utils.redis_cache import cache, get_reading_test_cache_key
 from app.utils.datetime_utils import get_vietnam_time
+from app.utils.forecast_history import get_forecast_attempts
+from app.utils.exam_payloads import get_or_build, load_exam_tree, payload_response, sorted_options
 import logging
 
 logger = logging.getLogger(__name__)
@@ -161,39 +162,11 @@ async def retake_reading_exam(
         "attempt_number": existing_attempts + 1,
         "previous_attempts": existing_attempts
     }
-@router.get("/reading-test/{exam_id}", response_model=Dict)
-async def get_reading_test(
-    exam_id: int,
-    current_student = Depends(get_current_student),
-    db: Session = Depends(get_db)
-):
-    """Get details of a specific reading test with caching"""
-    # Try to get from cache first
-    cache_key = get_reading_test_cache_key(exam_id)
-    cached_result = await cache.get(cache_key)
-    
-    if cached_result:
-        logger.info(f"Reading test {exam_id} served from cache")
-        return cached_result
-    
-    exam = db.query(Exam).filter(
-        Exam.exam_id == exam_id,
-        Exam.is_active == True
-    ).first()
-    
-    if not exam:
-        raise HTTPException(status_code=404, detail="Reading test not found")
-    
-    sections = db.query(ExamSection)\
-        .filter(
-            ExamSection.exam_id == exam_id,
-            ExamSection.section_type == 'reading'
-        )\
-        .order_by(ExamSection.order_number)\
-        .all()
-    
+def _build_reading_test_payload(db: Session, exam: Exam) -> Dict:
+    tree = load_exam_tree(db, exam.exam_id, section_type='reading')
+
     section_details = []
-    for section in sections:
+    for section in tree.sections:
         section_data = {
             "section_id": section.section_id,
             "section_type": "reading",
@@ -204,26 +177,17 @@ async def get_reading_test(
             "questions": []
         }
 
-        # Get passage
-        passages = db.query(ReadingPassage)\
-            .filter(ReadingPassage.section_id == section.section_id)\
-            .all()
         section_data["passages"] = [
             {
                 "passage_id": p.passage_id,
                 "title": p.title.strip(),
                 "content": p.content.strip(),
                 "word_count": p.word_count
-            } for p in passages
+            } for p in tree.passages.get(section.section_id, [])
         ]
 
-        # Get all questions including main_text
-        questions = db.query(Question)\
-            .filter(Question.section_id == section.section_id)\
-            .order_by(Question.question_id)\
-            .all()
-
-        for question in questions:
+        # All questions including main_text
+        for question in tree.questions[section.section_id]:
             question_data = {
                 "question_id": question.question_id,
                 "question_text": question.question_text.strip(),
@@ -233,37 +197,44 @@ async def get_reading_test(
                 "explanation": question.explanation,
                 "locate": question.locate,
                 "additional_data": question.additional_data,
-                "options": []
+                "options": [
+                    {
+                        "option_id": opt.option_id,
+                        "option_text": opt.option_text.strip()
+                    } for opt in sorted_options(question)
+                ]
             }
 
-            options = db.query(QuestionOption)\
-                .filter(QuestionOption.question_id == question.question_id)\
-                .order_by(QuestionOption.option_id)\
-                .all()
-            
-            question_data["options"] = [
-                {
-                    "option_id": opt.option_id,
-                    "option_text": opt.option_text.strip()
-                } for opt in options
-            ]
-
             section_data["questions"].append(question_data)
 
         section_details.append(section_data)
     
-    result = {
+    return {
         "exam_id": exam.exam_id,
         "title": exam.title.strip(),
         "created_at": exam.created_at,
         "sections": section_details
     }
+
+@router.get("/reading-test/{exam_id}", response_model=Dict)
+async def get_reading_test(
+    exam_id: int,
+    request: Request,
+    current_student = Depends(get_current_student),
+    db: Session = Depends(get_db)
+):
+    """Get details of a specific reading test, served as pre-encoded bytes"""
+    exam = db.query(Exam).filter(
+        Exam.exam_id == exam_id,
+        Exam.is_active == True
+    ).first()
     
-    # Cache the result for 2 hours (7200 seconds)
-    await cache.set(cache_key, result, ttl=7200)
-    logger.info(f"Reading test {exam_id} cached successfully")
+    if not exam:
+        raise HTTPException(status_code=404, detail="Reading test not found")
     
-    return result
+    payload = get_or_build("reading_test", exam_id, exam.content_version,
+                           lambda: _build_reading_test_payload(db, exam))
+    return payload_response(request, payload)
 
 @router.post("/reading-test/{exam_id}/submit", response_model=Dict)
 async def submit_reading_exam(
@@ -476,29 +447,14 @@ async def submit_reading_exam(
         # Update exam result with total score and section scores
         exam_result.total_score = total_score
         exam_result.section_scores = section_scores
+        if forecast_part:
+            # Forecast history reads these back (get_reading_forecast_history)
+            exam_result.forecast_score_earned = part_scores[forecast_part]["earned"]
+            exam_result.forecast_score_total = part_scores[forecast_part]["total"]
         
         # Commit the transaction
         db.commit()
 
-        # If forecast submission, cache attempt details and mark result
-        try:
-            if forecast_part:
-                attempt_entry = {
-                    "result_id": exam_result.result_id,
-                    "completion_date": exam_result.completion_date.isoformat() if exam_result.completion_date else None,
-                    "part_number": forecast_part,
-                    "score_earned": part_scores[forecast_part]["earned"],
-                    "score_total": part_scores[forecast_part]["total"]
-                }
-
-                cache_key = f"forecast_attempts:{current_student.user_id}:{exam_id}:{forecast_part}"
-                existing_attempts = await cache.get(cache_key) or []
-                existing_attempts.append(attempt_entry)
-                await cache.set(cache_key, existing_attempts, ttl=31536000)
-                await cache.set(f"forecast_result:{exam_result.result_id}", True, ttl=31536000)
-        except Exception:
-            pass
-
         return {
             "result_id": exam_result.result_id,
             "total_score": total_score,
@@ -636,50 +592,4 @@ async def get_reading_forecast_history(
     current_student = Depends(get_current_student),
     db: Session = Depends(get_db)
 ):
-    # Get section for this part to calculate total marks
-    section = db.query(ExamSection).filter(
-        ExamSection.exam_id == exam_id,
-        ExamSection.section_type == 'reading',
-        ExamSection.order_number == part_number
-    ).first()
-    if not section:
-        return []
-
-    from sqlalchemy.sql import func
-    
-    # Use database columns to filter forecast results directly
-    forecast_results = db.query(ExamResult).filter(
-        ExamResult.user_id == current_student.user_id,
-        ExamResult.exam_id == exam_id,
-        ExamResult.is_forecast == True,
-        ExamResult.forecast_part == part_number
-    ).order_by(ExamResult.completion_date.desc()).all()
-
-    # Compute total marks for this part (excluding main_text questions)
-    total_marks = db.query(func.sum(Question.marks))\
-        .filter(
-            Question.section_id == section.section_id,
-            Question.question_type != 'main_text'
-        )\
-        .scalar() or 0
-
-    # Calculate earned scores for each forecast result
-    attempts = []
-    for result in forecast_results:
-        # Get earned score from StudentAnswer
-        earned_score = db.query(func.sum(StudentAnswer.score)).join(
-            Question, StudentAnswer.question_id == Question.question_id
-        ).filter(
-            StudentAnswer.result_id == result.result_id,
-            Question.section_id == section.section_id
-        ).scalar() or 0
-        
-        attempts.append({
-            'result_id': result.result_id,
-            'completion_date': result.completion_date,
-            'attempt_number': result.attempt_number,
-            'score_earned': float(earned_score),
-            'score_total': int(total_marks)
-        })
-    
-    return attempts
+    return get_forecast_attempts(db, current_student.user_id, exam_id, part_number)
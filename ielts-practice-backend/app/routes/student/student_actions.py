@@ -1,24 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Request
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Request, Query, Response
 from sqlalchemy.orm import Session, joinedload, defer, undefer
 from typing import Optional
 from app.database import get_db
-from app.models.models import ExamAccessType, User, ExamResult, Exam, ExamSection, Question, QuestionOption, ReadingPassage, ListeningMedia, WritingTask, StudentAnswer, WritingAnswer, ListeningAnswer, SpeakingMaterial
+from app.models.models import ExamAccessType, User, ExamResult, ExamResultSnapshot, Exam, ExamSection, Question, QuestionOption, ReadingPassage, ListeningMedia, WritingTask, StudentAnswer, WritingAnswer, ListeningAnswer, SpeakingMaterial
 from app.routes.admin.auth import get_current_student, check_exam_access
-from typing import List, Dict
+from typing import List, Dict, Literal
 from bs4 import BeautifulSoup
-from fastapi.responses import StreamingResponse
+from fastapi.responses import RedirectResponse, StreamingResponse
 from mutagen.mp3 import MP3
 import subprocess
 import tempfile
+import base64
+import hashlib
 import io
 import os
 import re 
 from sqlalchemy import and_, or_, func
-from uuid import uuid4
 from pydantic import BaseModel
 from app.utils.datetime_utils import get_vietnam_time, convert_to_vietnam_time
 from datetime import datetime, timedelta
 from app.utils.redis_cache import cache, get_listening_test_cache_key, get_audio_metadata_cache_key
+from app.utils.result_snapshots import encode_snapshot, save_snapshot, snapshot_response
+from app.utils.exam_metadata import get_exam_metadata, part_question_count
+from app.utils.forecast_history import get_forecast_attempts
+from app.utils.exam_payloads import dumps, get_or_build, json_bytes_response, load_exam_tree, sorted_options, with_fields
+from app.utils.metrics import time_audio
+from app.utils.uploads import UploadRejected, image_policy, ingest_upload, listening_audio_bytes
+from app.utils import audio_renditions, presence, writing_drafts
 import logging
 
 logger = logging.getLogger(__name__)
@@ -27,6 +35,7 @@ router = APIRouter()
 
 
 UPLOAD_DIR = "static/student_images"
+PROFILE_IMAGES = image_policy(UPLOAD_DIR, "/static/student_images")
 
 @router.get("/speaking/materials", response_model=List[dict])
 async def student_list_speaking_materials(
@@ -124,6 +133,16 @@ class WritingAnswerSubmit(BaseModel):
 class WritingTestSubmit(BaseModel):
     part1_answer: str
     part2_answer: str
+class WritingDraftOp(BaseModel):
+    at: int
+    delete: int = 0
+    insert: str = ""
+class WritingDraftUpdate(BaseModel):
+    base_version: int
+    client_id: Optional[str] = None
+    ops: Optional[List[WritingDraftOp]] = None
+    text: Optional[str] = None  # full text instead of ops (first save / resync)
+    length: Optional[int] = None  # UTF-16 length of the client's text after the edit
 
 @router.get("/user-role/{user_id}", response_model=dict)
 async def get_user_role_by_id(
@@ -189,14 +208,16 @@ async def stream_combined_audio(
     temp_files = []
     total_duration = 0
     for media in listening_media_files:
+        audio_bytes = listening_audio_bytes(media)
         temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
-        temp_file.write(media.audio_file)
+        temp_file.write(audio_bytes)
         temp_file.close()
         temp_files.append(temp_file.name)
         
         # Calculate duration of each audio file
-        audio_data = io.BytesIO(media.audio_file)
-        audio = MP3(audio_data)
+        audio_data = io.BytesIO(audio_bytes)
+        with time_audio("mutagen", "duration"):
+            audio = MP3(audio_data)
         total_duration += audio.info.length
     
     # Create a temporary file for the combined audio
@@ -208,7 +229,8 @@ async def stream_combined_audio(
         "ffmpeg", "-y", "-i", f"concat:{'|'.join(temp_files)}",
         "-c", "copy", combined_audio_file.name
     ]
-    subprocess.run(ffmpeg_command, check=True)
+    with time_audio("ffmpeg", "concat"):
+        subprocess.run(ffmpeg_command, check=True)
     
     # Get file size for Content-Length header
     file_size = os.path.getsize(combined_audio_file.name)
@@ -410,15 +432,13 @@ async def update_student_profile(
         current_student.username = username
     
     if image:
-        file_extension = os.path.splitext(image.filename)[1]
-        unique_filename = f"{uuid4()}{file_extension}"
-        file_path = os.path.join(UPLOAD_DIR, unique_filename)
-        
-        with open(file_path, "wb") as buffer:
-            content = await image.read()
-            buffer.write(content)
+        # Streamed to a content-addressed file; the type is checked from the bytes
+        try:
+            stored = await ingest_upload(image, PROFILE_IMAGES)
+        except UploadRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
         
-        current_student.image_url = file_path
+        current_student.image_url = stored.path
 
     db.commit()
     db.refresh(current_student)
@@ -600,19 +620,16 @@ async def get_writing_thumbnails(
     if not task_ids or len(task_ids) > 6:
         return {"thumbnails": {}}
 
-    # Fetch full instructions for just these few tasks (max 6 at a time)
+    # Precomputed when the task is saved (or by scripts/extract_inline_images.py)
     rows = db.query(
         WritingTask.task_id,
-        WritingTask.instructions
-    ).filter(WritingTask.task_id.in_(task_ids)).all()
+        WritingTask.thumbnail_url
+    ).filter(
+        WritingTask.task_id.in_(task_ids),
+        WritingTask.thumbnail_url.isnot(None)
+    ).all()
 
-    thumbnails = {}
-    for tid, instructions in rows:
-        if instructions:
-            # Match the first <img> src — handles both URLs and data:image/... base64
-            img_match = re.search(r'<img[^>]+src=["\']([^"\']+)["\']', instructions)
-            if img_match:
-                thumbnails[str(tid)] = img_match.group(1)
+    thumbnails = {str(tid): thumbnail_url for tid, thumbnail_url in rows}
 
     return {"thumbnails": thumbnails}
 
@@ -744,60 +761,7 @@ async def get_listening_forecast_history(
     current_student = Depends(get_current_student),
     db: Session = Depends(get_db)
 ):
-    # Get the section for this forecast part
-    section = db.query(ExamSection).filter(
-        ExamSection.exam_id == exam_id,
-        ExamSection.section_type == 'listening',
-        ExamSection.order_number == part_number
-    ).first()
-    if not section:
-        return []
-    
-    from sqlalchemy.sql import func
-    
-    # Calculate total marks for this section (excluding main_text questions)
-    total_marks = db.query(func.sum(Question.marks)).filter(
-        Question.section_id == section.section_id,
-        Question.question_type != 'main_text'
-    ).scalar() or 0
-
-    # Use database columns to filter forecast results directly
-    forecast_results = db.query(ExamResult).filter(
-        ExamResult.user_id == current_student.user_id,
-        ExamResult.exam_id == exam_id,
-        ExamResult.is_forecast == True,
-        ExamResult.forecast_part == part_number
-    ).order_by(ExamResult.completion_date.desc()).all()
-
-    # Calculate earned scores for each forecast result
-    attempts = []
-    for result in forecast_results:
-        # Get earned score for this forecast result from ListeningAnswer
-        earned_score = db.query(func.sum(ListeningAnswer.score)).join(
-            Question, ListeningAnswer.question_id == Question.question_id
-        ).filter(
-            ListeningAnswer.result_id == result.result_id,
-            Question.section_id == section.section_id
-        ).scalar() or 0
-        
-        # If no ListeningAnswer, try StudentAnswer
-        if earned_score == 0:
-            earned_score = db.query(func.sum(StudentAnswer.score)).join(
-                Question, StudentAnswer.question_id == Question.question_id
-            ).filter(
-                StudentAnswer.result_id == result.result_id,
-                Question.section_id == section.section_id
-            ).scalar() or 0
-        
-        attempts.append({
-            'result_id': result.result_id,
-            'completion_date': result.completion_date,
-            'attempt_number': result.attempt_number,
-            'score_earned': float(earned_score),
-            'score_total': int(total_marks)
-        })
-    
-    return attempts
+    return get_forecast_attempts(db, current_student.user_id, exam_id, part_number)
 
 @router.get("/writing/forecast/{task_id}", response_model=dict)
 async def get_writing_forecast_detail(
@@ -866,18 +830,10 @@ async def retake_exam(
         "previous_attempts": existing_attempts
     }
 
-@router.get("/exam/{exam_id}/audio-part/{part_number}", response_model=Dict)
-async def get_exam_audio_part(
-    exam_id: int,
-    part_number: int,
-    request: Request,
-    token: Optional[str] = None,
-    db: Session = Depends(get_db)
-):
-    """Get a specific audio part for an exam.
-    Supports both Authorization header and ?token= query parameter for auth.
-    Query param auth enables native browser <audio src> streaming.
-    """
+async def _authorize_audio_part(exam_id: int, part_number: int, request: Request,
+                                token: Optional[str], db: Session) -> User:
+    """Student from the Authorization header or ?token=, checked against the exam.
+    Query param auth enables native browser <audio src> streaming."""
     from jose import jwt, JWTError
     from app.routes.admin.auth import SECRET_KEY, ALGORITHM
 
@@ -932,7 +888,11 @@ async def get_exam_audio_part(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You don't have access to this exam"
         )
-    
+    return current_student
+
+
+def _original_audio_response(db: Session, exam_id: int, part_number: int, request: Request):
+    """The uploaded MP3 of one part, with Range support."""
     # Get the specific audio file for this exam part
     listening_media = db.query(ListeningMedia)\
         .options(undefer(ListeningMedia.audio_file))\
@@ -942,14 +902,17 @@ async def get_exam_audio_part(
             ExamSection.order_number == part_number
         ).first()
     
-    if not listening_media or not listening_media.audio_file:
+    if not listening_media or not (listening_media.audio_path or listening_media.audio_file):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"No audio file found for exam {exam_id} part {part_number}"
         )
     
-    # Create a BytesIO object from the audio data
-    audio_data = io.BytesIO(listening_media.audio_file)
+    # Stored uploads are read from disk; older parts from the blob
+    if listening_media.audio_path:
+        audio_data = open(listening_media.audio_path, "rb")
+    else:
+        audio_data = io.BytesIO(listening_media.audio_file)
     
     # Get file size for Content-Length header
     audio_data.seek(0, io.SEEK_END)
@@ -977,13 +940,16 @@ async def get_exam_audio_part(
     
     # Create a file-like object for the response
     def iterfile():
-        audio_data.seek(start)
-        data = audio_data.read(min(content_length, 1024 * 1024))  # Read in 1MB chunks
-        while data:
-            yield data
-            if len(data) < 1024 * 1024:
-                break
-            data = audio_data.read(min(content_length - audio_data.tell() + start, 1024 * 1024))
+        try:
+            audio_data.seek(start)
+            data = audio_data.read(min(content_length, 1024 * 1024))  # Read in 1MB chunks
+            while data:
+                yield data
+                if len(data) < 1024 * 1024:
+                    break
+                data = audio_data.read(min(content_length - audio_data.tell() + start, 1024 * 1024))
+        finally:
+            audio_data.close()
     
     # Set appropriate headers for streaming and seeking
     headers = {
@@ -1004,6 +970,52 @@ async def get_exam_audio_part(
     )
 
 
+@router.get("/exam/{exam_id}/audio-part/{part_number}", response_model=Dict)
+async def get_exam_audio_part(
+    exam_id: int,
+    part_number: int,
+    request: Request,
+    token: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Get a specific audio part for an exam (the original upload).
+    Supports both Authorization header and ?token= query parameter for auth.
+    """
+    await _authorize_audio_part(exam_id, part_number, request, token, db)
+    return _original_audio_response(db, exam_id, part_number, request)
+
+
+@router.get("/exam/{exam_id}/audio-part/{part_number}/stream")
+async def stream_exam_audio_part(
+    exam_id: int,
+    part_number: int,
+    request: Request,
+    format: Literal['mp3', 'hls'] = 'mp3',
+    quality: Literal['auto', '64k', '96k'] = 'auto',
+    token: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Redirect to the part's static low-bitrate rendition (MP3 or HLS master
+    playlist, app/utils/audio_renditions.py). While it has none, MP3 requests
+    get the original upload and HLS requests a 404, so the player can fall
+    back to MP3. Same auth as /audio-part/{part_number}."""
+    await _authorize_audio_part(exam_id, part_number, request, token, db)
+    row = db.query(ListeningMedia.audio_digest)\
+        .join(ExamSection)\
+        .filter(
+            ExamSection.exam_id == exam_id,
+            ExamSection.order_number == part_number
+        ).first()
+    url = audio_renditions.rendition_url(row[0] if row else None, format,
+                                         audio_renditions.choose_quality(quality, request.headers))
+    if url is None:
+        if format == 'hls':
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No HLS rendition for this part yet")
+        return _original_audio_response(db, exam_id, part_number, request)
+    # The target is immutable and cached by nginx; the choice itself is per client
+    return RedirectResponse(url, status_code=307, headers={"Cache-Control": "private, no-store", "Vary": "Save-Data, Downlink"})
+
+
 @router.get("/exam/{exam_id}/audio-lengths", response_model=Dict)
 async def get_audio_file_lengths(
     exam_id: int,
@@ -1034,12 +1046,14 @@ async def get_audio_file_lengths(
     total_length = 0
     
     for i, media in enumerate(listening_media):
-        if media.audio_file:
+        audio_bytes = listening_audio_bytes(media)
+        if audio_bytes:
             # Create a BytesIO object from the audio data
-            audio_data = io.BytesIO(media.audio_file)
+            audio_data = io.BytesIO(audio_bytes)
             # Load the MP3 file and get its length
             try:
-                audio = MP3(audio_data)
+                with time_audio("mutagen", "duration"):
+                    audio = MP3(audio_data)
                 length = int(audio.info.length)  # Length in seconds
                 total_length += length
                 part_lengths.append({
@@ -1085,16 +1099,20 @@ async def update_student_status(
             detail="Status must be either 'online' or 'offline'"
         )
     
-    # Update the status in the database
-    current_student.status = status
-    current_student.last_active = get_vietnam_time().replace(tzinfo=None)
-    db.commit()
+    # Presence lives in Redis; last_active reaches MySQL in periodic batches
+    recorded = await (presence.touch if status == 'online' else presence.mark_offline)(current_student.user_id)
+    last_active = get_vietnam_time().replace(tzinfo=None)
+    if not recorded:
+        # Redis unavailable: write the users row as before
+        current_student.status = status
+        current_student.last_active = last_active
+        db.commit()
     
     return {
         "message": f"Status updated to {status}",
         "user_id": current_student.user_id,
         "status": status,
-        "last_active": current_student.last_active
+        "last_active": last_active
     }
 def calculate_band_score(total_score: float) -> float:
     # IELTS band score calculation logic
@@ -1102,29 +1120,11 @@ def calculate_band_score(total_score: float) -> float:
     band_score = (total_score / 40) * 9
     return round(band_score * 2) / 2  # Rounds to nearest 0.5
 
-@router.get("/exam/{exam_id}/start", response_model=Dict)
-async def start_exam(
-    exam_id: int,
-    current_student = Depends(get_current_student),
-    db: Session = Depends(get_db)
-):
-    exam = db.query(Exam).filter(
-        Exam.exam_id == exam_id,
-        Exam.is_active == True
-    ).first()
-    
-    if not exam:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Exam not found or not active"
-        )
+def _build_exam_start_payload(db: Session, exam: Exam) -> Dict:
+    tree = load_exam_tree(db, exam.exam_id)
 
     sections = []
-    exam_sections = db.query(ExamSection).filter(
-        ExamSection.exam_id == exam_id
-    ).order_by(ExamSection.order_number).all()
-
-    for section in exam_sections:
+    for section in tree.sections:
         section_data = {
             "section_id": section.section_id,
             "section_type": section.section_type,
@@ -1135,24 +1135,17 @@ async def start_exam(
         }
 
         if section.section_type == 'reading':
-            passages = db.query(ReadingPassage).filter(
-                ReadingPassage.section_id == section.section_id
-            ).all()
             section_data["passages"] = [
                 {
                     "passage_id": p.passage_id,
                     "title": p.title.strip(),
                     "content": p.content.strip(),
                     "word_count": p.word_count
-                } for p in passages
+                } for p in tree.passages.get(section.section_id, [])
             ]
 
         elif section.section_type == 'listening':
-            media = db.query(ListeningMedia).options(
-                defer(ListeningMedia.audio_file)
-            ).filter(
-                ListeningMedia.section_id == section.section_id
-            ).first()
+            media = tree.media.get(section.section_id)
             if media:
                 section_data["media"] = {
                     "media_id": media.media_id,
@@ -1161,41 +1154,54 @@ async def start_exam(
                     "duration": media.duration
                 }
 
-        questions = db.query(Question).filter(
-            Question.section_id == section.section_id
-        ).order_by(Question.question_id).all()
-
-        for question in questions:
-            question_data = {
+        for question in tree.questions[section.section_id]:
+            section_data["questions"].append({
                 "question_id": question.question_id,
                 "question_text": question.question_text.strip(),
                 "question_type": question.question_type.strip(),
                 "marks": int(question.marks) if question.marks is not None else 0,
-                "options": []
-            }
-
-            options = db.query(QuestionOption).filter(
-                QuestionOption.question_id == question.question_id
-            ).order_by(QuestionOption.option_id).all()
-            
-            question_data["options"] = [
-                {
-                    "option_id": opt.option_id,
-                    "option_text": opt.option_text.strip()
-                } for opt in options
-            ]
-
-            section_data["questions"].append(question_data)
+                "options": [
+                    {
+                        "option_id": opt.option_id,
+                        "option_text": opt.option_text.strip()
+                    } for opt in sorted_options(question)
+                ]
+            })
 
         sections.append(section_data)
 
     return {
         "exam_id": exam.exam_id,
         "title": exam.title.strip(),
-        "start_time": get_vietnam_time().replace(tzinfo=None),
         "sections": sections
     }
 
+@router.get("/exam/{exam_id}/start", response_model=Dict)
+async def start_exam(
+    exam_id: int,
+    request: Request,
+    current_student = Depends(get_current_student),
+    db: Session = Depends(get_db)
+):
+    exam = db.query(Exam).filter(
+        Exam.exam_id == exam_id,
+        Exam.is_active == True
+    ).first()
+    
+    if not exam:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Exam not found or not active"
+        )
+
+    # Exam tree is shared, pre-encoded bytes; only the start time is per request
+    payload = get_or_build("exam_start", exam_id, exam.content_version,
+                           lambda: _build_exam_start_payload(db, exam))
+    return json_bytes_response(request, with_fields(payload.body, {
+        "start_time": get_vietnam_time().replace(tzinfo=None)
+    }))
+
+
 
 @router.post("/exam/{exam_id}/submit", response_model=Dict)
 async def submit_exam_answers(
@@ -1348,54 +1354,21 @@ async def submit_exam_answers(
 
         exam_result.total_score = total_score
         exam_result.section_scores = section_scores
-        
-        db.commit()
 
-        try:
-            forecast_part_str = request.query_params.get('forecast_part')
-            if is_listening_exam and forecast_part_str:
-                try:
-                    forecast_part = int(forecast_part_str)
-                except ValueError:
-                    forecast_part = None
-
-                if forecast_part and 1 <= forecast_part <= 4:
-                    part_section = db.query(ExamSection).filter(
-                        ExamSection.exam_id == exam_id,
-                        ExamSection.section_type == 'listening',
-                        ExamSection.order_number == forecast_part
-                    ).first()
-
-                    if part_section:
-                        part_total = db.query(Question).filter(
-                            Question.section_id == part_section.section_id,
-                            Question.question_type != 'main_text'
-                        ).with_entities(Question.marks).all()
-                        total_marks_part = sum([q.marks or 0 for q in part_total])
-
-                        part_answers = db.query(ListeningAnswer).join(Question, ListeningAnswer.question_id == Question.question_id)\
-                            .filter(
-                                ListeningAnswer.result_id == exam_result.result_id,
-                                Question.section_id == part_section.section_id
-                            ).all()
-                        earned_marks_part = sum([a.score or 0 for a in part_answers])
-
-                        attempt_entry = {
-                            "result_id": exam_result.result_id,
-                            "completion_date": exam_result.completion_date.isoformat() if exam_result.completion_date else None,
-                            "part_number": forecast_part,
-                            "score_earned": earned_marks_part,
-                            "score_total": total_marks_part
-                        }
-
-                        cache_key = f"forecast_attempts:{current_student.user_id}:{exam_id}:{forecast_part}"
-                        existing_attempts = await cache.get(cache_key) or []
-                        existing_attempts.append(attempt_entry)
-                        await cache.set(cache_key, existing_attempts, ttl=31536000)
-                        # Mark this exam_result as forecast to separate it from full tests
-                        await cache.set(f"forecast_result:{exam_result.result_id}", True, ttl=31536000)
-        except Exception:
-            pass
+        # Forecast history reads these back (get_listening_forecast_history)
+        if is_forecast_submission:
+            part_section = next((
+                section for section in exam_sections
+                if section.section_type == 'listening' and section.order_number == forecast_part
+            ), None)
+            if part_section:
+                exam_result.forecast_score_earned = section_scores.get(part_section.section_id, {}).get("earned", 0)
+                exam_result.forecast_score_total = db.query(func.coalesce(func.sum(Question.marks), 0)).filter(
+                    Question.section_id == part_section.section_id,
+                    Question.question_type != 'main_text'
+                ).scalar()
+
+        db.commit()
 
         return {
             "result_id": exam_result.result_id,
@@ -1416,31 +1389,13 @@ async def submit_exam_answers(
             detail="An error occurred while submitting your exam. Please try again."
         )
 
-@router.get("/exam-result/{result_id}", response_model=Dict)
-async def get_exam_result_details(
-    result_id: int,
-    current_student = Depends(get_current_student),
-    db: Session = Depends(get_db)
-):
-    # Get exam result with validation
-    exam_result = db.query(ExamResult).filter(
-        ExamResult.result_id == result_id,
-        ExamResult.user_id == current_student.user_id
-    ).first()
-    
-    if not exam_result:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Exam result not found"
-        )
-
-    # Get exam sections to determine the type
-    exam_sections = db.query(ExamSection).filter(
-        ExamSection.exam_id == exam_result.exam_id
-    ).all()
-    
+def _build_exam_result_review(db: Session, exam_result: ExamResult) -> Dict:
+    """Full review payload for a result; stored as a snapshot by the endpoint below."""
     # Check if this is a listening exam
-    is_listening_exam = any(section.section_type == 'listening' for section in exam_sections)
+    is_listening_exam = db.query(ExamSection.section_id).filter(
+        ExamSection.exam_id == exam_result.exam_id,
+        ExamSection.section_type == 'listening'
+    ).first() is not None
 
     detailed_answers = []
     
@@ -1494,9 +1449,12 @@ async def get_exam_result_details(
                 "evaluation": evaluation
             })
     else:
-        # Get detailed answers from StudentAnswer table for other exam types
-        student_answers = db.query(StudentAnswer).filter(
-            StudentAnswer.result_id == result_id
+        # Get detailed answers from StudentAnswer table for other exam types,
+        # with their questions in the same query (no per-answer lazy load)
+        student_answers = db.query(StudentAnswer).options(
+            joinedload(StudentAnswer.question)
+        ).filter(
+            StudentAnswer.result_id == exam_result.result_id
         ).all()
         
         for answer in student_answers:
@@ -1524,51 +1482,117 @@ async def get_exam_result_details(
         "section_scores": exam_result.section_scores,
         "detailed_answers": detailed_answers
     }
+
+
+@router.get("/exam-result/{result_id}", response_model=Dict)
+async def get_exam_result_details(
+    result_id: int,
+    request: Request,
+    current_student = Depends(get_current_student),
+    db: Session = Depends(get_db)
+):
+    # Result, current exam content version and any stored snapshot in one query
+    row = db.query(ExamResult, Exam.content_version, ExamResultSnapshot.content_version, ExamResultSnapshot.payload)\
+        .join(Exam, Exam.exam_id == ExamResult.exam_id)\
+        .outerjoin(ExamResultSnapshot, ExamResultSnapshot.result_id == ExamResult.result_id)\
+        .filter(
+            ExamResult.result_id == result_id,
+            ExamResult.user_id == current_student.user_id
+        ).first()
+    
+    if not row:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Exam result not found"
+        )
+
+    exam_result, exam_version, snapshot_version, snapshot = row
+    exam_version = exam_version or 1
+    accept_encoding = request.headers.get("accept-encoding", "")
+    if snapshot is not None and snapshot_version == exam_version:
+        return snapshot_response(snapshot, accept_encoding)
+
+    # First view (or the answer key changed since): build and store the snapshot
+    payload = encode_snapshot(_build_exam_result_review(db, exam_result))
+    try:
+        save_snapshot(db, result_id, exam_version, payload)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Could not store review snapshot for result {result_id}: {e}")
+    return snapshot_response(payload, accept_encoding)
+def _encode_history_cursor(completion_date, result_id: int) -> str:
+    raw = f"{completion_date.isoformat() if completion_date else ''}|{result_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_history_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        completion_date, result_id = raw.split("|")
+        return (datetime.fromisoformat(completion_date) if completion_date else None), int(result_id)
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
 @router.get("/my-exam-history", response_model=List[dict])
 async def get_student_exam_history(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=200, description="Page size; omit for the full history"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
     current_student = Depends(get_current_student),
     db: Session = Depends(get_db)
 ):
-    # Return both full test and forecast results for the frontend to filter
-    exam_results = db.query(ExamResult).filter(
-        ExamResult.user_id == current_student.user_id
-    ).order_by(ExamResult.completion_date.desc()).all()
-    
+    # Return both full test and forecast results for the frontend to filter.
+    # Newest first, keyset-paginated on (completion_date, result_id); the exam
+    # title and content version come from the same query.
+    query = db.query(ExamResult, Exam.title, Exam.content_version)\
+        .join(Exam, Exam.exam_id == ExamResult.exam_id)\
+        .filter(ExamResult.user_id == current_student.user_id)
+    if cursor:
+        cursor_date, cursor_id = _decode_history_cursor(cursor)
+        if cursor_date is None:
+            # Rows without a completion date sort last (MySQL DESC puts NULLs last)
+            query = query.filter(ExamResult.completion_date.is_(None), ExamResult.result_id < cursor_id)
+        else:
+            query = query.filter(or_(
+                ExamResult.completion_date < cursor_date,
+                ExamResult.completion_date.is_(None),
+                and_(ExamResult.completion_date == cursor_date, ExamResult.result_id < cursor_id)
+            ))
+    query = query.order_by(ExamResult.completion_date.desc(), ExamResult.result_id.desc())
+    rows = query.limit(limit + 1).all() if limit else query.all()
+
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1][0]
+        response.headers["X-Next-Cursor"] = _encode_history_cursor(last.completion_date, last.result_id)
+
+    # Skill and per-part question counts from the exam metadata index
+    exam_metadata = await get_exam_metadata(db, {result.exam_id: version for result, _, version in rows})
+
     result_list = []
-    for result in exam_results:
-        # Get the first section to determine exam type
-        first_section = db.query(ExamSection).filter(
-            ExamSection.exam_id == result.exam_id
-        ).first()
-        
-        exam_type = first_section.section_type if first_section else "reading"  # Default to reading
+    for result, exam_title, _ in rows:
+        metadata = exam_metadata[result.exam_id]
         
         # Calculate total_questions for forecast results
         total_questions = 40  # Default for full tests
         if result.is_forecast and result.forecast_part:
-            # Get the specific section for this forecast part
-            forecast_section = db.query(ExamSection).filter(
-                ExamSection.exam_id == result.exam_id,
-                ExamSection.order_number == result.forecast_part
-            ).first()
-            if forecast_section:
-                from app.models import Question
-                question_count = db.query(Question).filter(
-                    Question.section_id == forecast_section.section_id,
-                    Question.question_type != 'main_text'
-                ).count()
-                total_questions = question_count if question_count > 0 else 40
+            total_questions = part_question_count(metadata, result.forecast_part)
         
         result_list.append({
             "result_id": result.result_id,
             "exam_id": result.exam_id,
-            "exam_title": result.exam.title,
+            "exam_title": exam_title,
             "total_score": result.total_score,
             "total_questions": total_questions,
             "completion_date": result.completion_date,
             "section_scores": result.section_scores,
             "attempt_number": result.attempt_number if hasattr(result, 'attempt_number') and result.attempt_number else 1,
-            "exam_type": exam_type,
+            "exam_type": metadata["exam_type"],
             "is_forecast": bool(result.is_forecast),
             "forecast_part": result.forecast_part if result.is_forecast else None,
             "part_number": result.forecast_part if result.is_forecast else None
@@ -1694,15 +1718,12 @@ async def get_writing_tasks(
     current_student = Depends(get_current_student),
     db: Session = Depends(get_db)
 ):
-    import time
-    t0 = time.time()
     # Query 1: Get all active exams with writing (essay) sections
     exams = db.query(Exam).join(ExamSection)\
         .filter(
             Exam.is_active == True,
             ExamSection.section_type == 'essay'
         ).distinct().all()
-    print(f"[TIMING] Query 1 (exams): {time.time()-t0:.3f}s, found {len(exams)} exams")
 
     if not exams:
         return []
@@ -1713,7 +1734,6 @@ async def get_writing_tasks(
     all_access_types = db.query(ExamAccessType)\
         .filter(ExamAccessType.exam_id.in_(exam_ids))\
         .all()
-    print(f"[TIMING] Query 2 (access types): {time.time()-t0:.3f}s")
 
     # Index access types by exam_id for O(1) lookup
     access_by_exam = {}
@@ -1741,7 +1761,6 @@ async def get_writing_tasks(
 
     if not accessible_exam_ids:
         return []
-    print(f"[TIMING] Access filter: {time.time()-t0:.3f}s, {len(accessible_exam_ids)} accessible exams")
 
     # Query 3: Batch fetch ALL writing tasks (skip heavy columns)
     all_tasks = db.query(WritingTask)\
@@ -1749,7 +1768,6 @@ async def get_writing_tasks(
         .filter(WritingTask.test_id.in_(accessible_exam_ids))\
         .order_by(WritingTask.test_id, WritingTask.part_number)\
         .all()
-    print(f"[TIMING] Query 3 (tasks): {time.time()-t0:.3f}s, found {len(all_tasks)} tasks")
 
     # Index tasks by exam_id
     tasks_by_exam = {}
@@ -1764,7 +1782,6 @@ async def get_writing_tasks(
             WritingAnswer.task_id.in_(all_task_ids),
             WritingAnswer.user_id == current_student.user_id
         ).all()
-    print(f"[TIMING] Query 4 (answers): {time.time()-t0:.3f}s, found {len(all_answers)} answers")
 
     # Index answer count by exam_id (via task → exam mapping)
     task_to_exam = {task.task_id: task.test_id for task in all_tasks}
@@ -1801,21 +1818,38 @@ async def get_writing_tasks(
 
     return exam_details
 
+def _build_writing_task_payload(task: WritingTask) -> Dict:
+    return {
+        "task_id": task.task_id,
+        "part_number": task.part_number,
+        "task_type": task.task_type,
+        "instructions": task.instructions,
+        "sample_essay": getattr(task, 'sample_essay', None),
+        "word_limit": task.word_limit,
+        "total_marks": task.total_marks,
+        "duration": task.duration
+    }
+
 @router.get("/writing/tasks/{task_id}", response_model=dict)
 async def get_writing_task_detail(
     task_id: int,
+    request: Request,
     current_student = Depends(get_current_student),
     db: Session = Depends(get_db)
 ):
-    task = db.query(WritingTask).filter(
-        WritingTask.task_id == task_id
-    ).first()
+    row = db.query(WritingTask, Exam.content_version)\
+        .outerjoin(Exam, Exam.exam_id == WritingTask.test_id)\
+        .filter(WritingTask.task_id == task_id)\
+        .first()
     
-    if not task:
+    if not row:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Writing task not found"
         )
+    task, content_version = row
+    payload = get_or_build("writing_task", task_id, content_version,
+                           lambda: _build_writing_task_payload(task))
     
     # Get student's previous answer if exists using WritingAnswer
     previous_answer = db.query(WritingAnswer).filter(
@@ -1823,15 +1857,7 @@ async def get_writing_task_detail(
         WritingAnswer.user_id == current_student.user_id
     ).first()
 
-    return {
-        "task_id": task.task_id,
-        "part_number": task.part_number,
-        "task_type": task.task_type,
-        "instructions": task.instructions,
-        "sample_essay": getattr(task, 'sample_essay', None),
-        "word_limit": task.word_limit,
-        "total_marks": task.total_marks,
-        "duration": task.duration,
+    answer_fields = {
         "previous_answer": {
             "answer_text": previous_answer.answer_text,
             "score": previous_answer.score,
@@ -1839,6 +1865,9 @@ async def get_writing_task_detail(
             "updated_at": previous_answer.updated_at
         } if previous_answer else None
     }
+    # Task bytes are shared; the ETag also covers this student's answer
+    etag = payload.etag[:-1] + "-" + hashlib.sha1(dumps(answer_fields)).hexdigest()[:12] + '"'
+    return json_bytes_response(request, with_fields(payload.body, answer_fields), etag=etag)
 
 # Add this new endpoint to get all writing answers for a test
 @router.get("/writing/test/{test_id}/answers", response_model=dict)
@@ -1942,6 +1971,7 @@ async def submit_complete_writing_test(
         })
 
     db.commit()
+    await writing_drafts.discard_drafts(current_student.user_id, [task.task_id for task in tasks])
 
     return {
         "message": "Writing test submitted successfully",
@@ -1999,6 +2029,8 @@ async def submit_writing_answer(
     ).first()
 
     db.commit()
+    # A full-text save supersedes any delta draft of this task
+    await writing_drafts.discard_drafts(current_student.user_id, [task_id])
 
     return {
         "message": "Writing answer submitted successfully",
@@ -2012,6 +2044,87 @@ async def submit_writing_answer(
             "submitted": bool(other_part[1]) if other_part else False
         } if other_part else None
     }
+@router.get("/writing/tasks/{task_id}/draft", response_model=dict)
+async def get_writing_draft(
+    task_id: int,
+    current_student = Depends(get_current_student),
+    db: Session = Depends(get_db)
+):
+    """Latest autosaved text and its version (the base for the next PATCH)."""
+    draft = await writing_drafts.get_draft(current_student.user_id, task_id)
+    if draft:
+        return {
+            "task_id": task_id,
+            "version": draft["version"],
+            "answer_text": draft["text"],
+            "updated_at": draft["updated_at"],
+        }
+
+    answer = db.query(WritingAnswer.answer_text, WritingAnswer.updated_at).filter(
+        WritingAnswer.task_id == task_id,
+        WritingAnswer.user_id == current_student.user_id
+    ).first()
+    return {
+        "task_id": task_id,
+        "version": 0,
+        "answer_text": answer.answer_text if answer else None,
+        "updated_at": answer.updated_at if answer else None,
+    }
+@router.patch("/writing/tasks/{task_id}/draft", response_model=dict)
+async def update_writing_draft(
+    task_id: int,
+    update: WritingDraftUpdate,
+    current_student = Depends(get_current_student),
+    db: Session = Depends(get_db)
+):
+    """Autosave: apply the edits made since base_version (see app/utils/writing_drafts)."""
+    if update.ops is None and update.text is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Send ops or text")
+
+    def saved_text():
+        if not db.query(WritingTask.task_id).filter(WritingTask.task_id == task_id).first():
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Writing task not found")
+        answer = db.query(WritingAnswer.answer_text).filter(
+            WritingAnswer.task_id == task_id,
+            WritingAnswer.user_id == current_student.user_id
+        ).first()
+        return answer.answer_text if answer else ""
+
+    try:
+        draft = await writing_drafts.apply_update(
+            current_student.user_id,
+            task_id,
+            update.base_version,
+            update.client_id,
+            saved_text,
+            ops=[op.model_dump() for op in update.ops] if update.ops is not None else None,
+            text=update.text,
+            length=update.length,
+        )
+    except writing_drafts.DraftConflict as conflict:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "message": "Bài viết đã được thay đổi ở một tab khác. Vui lòng tải lại bản mới nhất.",
+                "version": conflict.version,
+                "answer_text": conflict.text,
+                "client_id": conflict.client_id,
+            }
+        )
+    except writing_drafts.InvalidDelta as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    except writing_drafts.DraftUnavailable:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Autosave is unavailable, use save-draft"
+        )
+
+    return {
+        "task_id": task_id,
+        "version": draft["version"],
+        "word_count": len(draft["text"].split()),
+        "updated_at": draft["updated_at"],
+    }
 @router.get("/writing/test/{test_id}/answers", response_model=dict)
 async def get_writing_test_answers(
     test_id: int,
@@ -2095,6 +2208,7 @@ async def reset_writing_test(
     ).delete(synchronize_session=False)
 
     db.commit()
+    await writing_drafts.discard_drafts(current_student.user_id, task_ids)
 
     return {
         "message": "Writing test answers reset successfully",
@@ -2185,6 +2299,7 @@ async def update_writing_part_essay(
         db.add(writing_answer)
 
     db.commit()
+    await writing_drafts.discard_drafts(current_student.user_id, [task_id])
 
     return {
         "message": "Essay updated successfully",
@@ -2283,6 +2398,8 @@ async def submit_writing_answer(
     ).first()
 
     db.commit()
+    # A full-text save supersedes any delta draft of this task
+    await writing_drafts.discard_drafts(current_student.user_id, [task_id])
 
     return {
         "message": "Writing answer submitted successfully",
@@ -2379,6 +2496,7 @@ async def reset_writing_test(
     ).delete(synchronize_session=False)
 
     db.commit()
+    await writing_drafts.discard_drafts(current_student.user_id, task_ids)
 
     return {
         "message": "Writing test answers reset successfully",
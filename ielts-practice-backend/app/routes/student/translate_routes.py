@@ -19,6 +19,7 @@ import groq
 from app.routes.student.student_actions import get_current_student
 from app.models.models import User
 from app.utils.datetime_utils import get_vietnam_time
+from app.utils.metrics import timed_groq_call
 
 router = APIRouter()
 
@@ -64,7 +65,8 @@ async def translate_text(
     )
 
     try:
-        resp = _client().chat.completions.create(
+        resp = timed_groq_call(
+            "translate", _client().chat.completions.create,
             model=MODEL,
             messages=[
                 {
@@ -142,7 +144,8 @@ async def dictionary_lookup(
     )
 
     try:
-        resp = _client().chat.completions.create(
+        resp = timed_groq_call(
+            "dictionary", _client().chat.completions.create,
             model=MODEL,
             messages=[
                 {
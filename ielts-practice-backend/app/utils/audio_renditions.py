@@ -0,0 +1,223 @@
+"""Low-bitrate and HLS renditions of listening audio, stored as static files.
+
+Every listening part was served from ListeningMedia.audio_file: the original
+upload, at whatever bitrate it was exported (often 192-320 kbps), read out of
+MySQL and streamed through a Python worker on each request. Our links are
+200 Mbps domestic / 30 Mbps international (nginx/nginx.conf), so each
+listener costs far more than speech needs.
+
+After an admin uploads part audio, one ffmpeg run loudness-normalizes it
+(EBU R128, LOUDNORM) and writes, under static/audio/{sha[:2]}/{sha}/:
+
+  64k.mp3, 96k.mp3              progressive renditions (64k mono), for <audio src>
+  64k/index.m3u8, 96k/index.m3u8
+                                HLS playlists of SEGMENT_SECONDS AAC segments
+  master.m3u8                   variant playlist listing both
+
+{sha} is the SHA-256 of the source audio (the name of its stored upload,
+app/utils/uploads.py, for parts uploaded since), recorded in
+ListeningMedia.audio_digest once the files exist, so re-uploading the same
+file or cloning an exam reuses them. The directory is written under a
+temporary name and renamed into place, so a reader never sees a half-written
+rendition. Files never change once written, so nginx serves /static/audio/
+from disk with an immutable cache policy.
+
+/student/exam/{id}/audio-part/{n}/stream checks access and redirects to the
+rendition for the client: the format it asks for, and 64k when it sends
+Save-Data or a Downlink hint under LOW_BANDWIDTH_MBPS. Parts without
+renditions (not transcoded yet, or ffmpeg failed) get the original upload as
+MP3, and a 404 for HLS.
+Hashed URLs are unguessable, but they are not access-checked once handed out.
+
+Existing audio is converted with:
+  python -m scripts.transcode_listening_audio
+
+Env:
+  AUDIO_RENDITIONS_DIR          storage root (default static/audio)
+  AUDIO_TRANSCODE_CONCURRENCY   ffmpeg runs at once per worker (default 1)
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from typing import Mapping, Optional, Union
+
+from sqlalchemy import update
+from sqlalchemy.orm import undefer
+
+from app.database import SessionLocal
+from app.models.models import ListeningMedia
+from app.utils.metrics import time_audio
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS_DIR = os.getenv("AUDIO_RENDITIONS_DIR", "static/audio")
+RENDITIONS_URL = "/static/audio"
+TRANSCODE_CONCURRENCY = int(os.getenv("AUDIO_TRANSCODE_CONCURRENCY", "1"))
+# name -> (kbps, channels)
+RENDITIONS = {"64k": (64, 1), "96k": (96, 2)}
+LOW_QUALITY, DEFAULT_QUALITY = "64k", "96k"
+LOUDNORM = "loudnorm=I=-16:TP=-1.5:LRA=11"
+SEGMENT_SECONDS = 6
+LOW_BANDWIDTH_MBPS = 1.0
+FFMPEG_TIMEOUT = 600
+
+
+def audio_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _directory(digest: str) -> str:
+    return os.path.join(RENDITIONS_DIR, digest[:2], digest)
+
+
+def renditions_exist(digest: str) -> bool:
+    return os.path.exists(os.path.join(_directory(digest), "master.m3u8"))
+
+
+def _master_playlist() -> str:
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3"]
+    for name, (kbps, _) in RENDITIONS.items():
+        # Declared bandwidth includes MPEG-TS overhead
+        lines.append(f'#EXT-X-STREAM-INF:BANDWIDTH={kbps * 1150},CODECS="mp4a.40.2"')
+        lines.append(f"{name}/index.m3u8")
+    return "\n".join(lines) + "\n"
+
+
+def _ffmpeg_command(source: str, out: str) -> list:
+    outputs = len(RENDITIONS) * 2
+    labels = [f"[a{i}]" for i in range(outputs)]
+    command = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-i", source,
+        "-filter_complex", f"[0:a]{LOUDNORM},aresample=44100,asplit={outputs}{''.join(labels)}",
+    ]
+    streams = iter(labels)
+    for name, (kbps, channels) in RENDITIONS.items():
+        command += ["-map", next(streams), "-c:a", "libmp3lame", "-b:a", f"{kbps}k", "-ac", str(channels),
+                    os.path.join(out, f"{name}.mp3")]
+        command += ["-map", next(streams), "-c:a", "aac", "-b:a", f"{kbps}k", "-ac", str(channels),
+                    "-f", "hls", "-hls_time", str(SEGMENT_SECONDS), "-hls_playlist_type", "vod",
+                    "-hls_segment_filename", os.path.join(out, name, "seg_%03d.ts"),
+                    os.path.join(out, name, "index.m3u8")]
+    return command
+
+
+def build_renditions(data: Union[bytes, str], force: bool = False) -> str:
+    """Write the renditions of `data` (audio bytes, or the path of a stored
+    upload) unless they exist (or `force`, e.g. after changing the encoder
+    settings); returns its digest. Raises on ffmpeg failure."""
+    from_file = isinstance(data, str)
+    digest = file_digest(data) if from_file else audio_digest(data)
+    if renditions_exist(digest) and not force:
+        return digest
+    final = _directory(digest)
+    parent = os.path.dirname(final)
+    os.makedirs(parent, exist_ok=True)
+    work = tempfile.mkdtemp(prefix=f".{digest}.", dir=parent)
+    try:
+        if from_file:
+            source = data
+        else:
+            source = os.path.join(work, "source")
+            with open(source, "wb") as f:
+                f.write(data)
+        out = os.path.join(work, "out")
+        for name in RENDITIONS:
+            os.makedirs(os.path.join(out, name))
+        with time_audio("ffmpeg", "renditions"):
+            subprocess.run(_ffmpeg_command(source, out), check=True, capture_output=True, timeout=FFMPEG_TIMEOUT)
+        with open(os.path.join(out, "master.m3u8"), "w") as f:
+            f.write(_master_playlist())
+        if force:
+            shutil.rmtree(final, ignore_errors=True)
+        try:
+            os.rename(out, final)
+        except OSError:
+            if not renditions_exist(digest):  # else: a concurrent run finished first
+                raise
+        return digest
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def transcode_media(db, media_id: int, force: bool = False) -> Optional[str]:
+    """Build renditions for one ListeningMedia row and record its digest.
+    Commits; returns the digest, or None when the row has no audio."""
+    media = db.query(ListeningMedia).options(undefer(ListeningMedia.audio_file))\
+        .filter(ListeningMedia.media_id == media_id).first()
+    if not media or not (media.audio_path or media.audio_file):
+        return None
+    digest = build_renditions(media.audio_path or media.audio_file, force)
+    db.execute(
+        update(ListeningMedia).where(ListeningMedia.media_id == media_id).values(audio_digest=digest)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    db.expunge(media)  # don't keep the blob in the session
+    return digest
+
+
+def _transcode_in_session(media_id: int):
+    db = SessionLocal()
+    try:
+        transcode_media(db, media_id)
+    finally:
+        db.close()
+
+
+_semaphore: Optional[asyncio.Semaphore] = None
+_transcode_tasks = set()
+
+
+async def _transcode(media_id: int):
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(TRANSCODE_CONCURRENCY)
+    async with _semaphore:
+        try:
+            await asyncio.to_thread(_transcode_in_session, media_id)
+            logger.info(f"AUDIO - renditions ready for listening media {media_id}")
+        except Exception as e:
+            # Students keep getting the original upload; the backfill retries
+            logger.error(f"AUDIO - renditions failed for listening media {media_id}: {e}")
+
+
+def spawn_transcode(media_id: int):
+    """Build renditions in the background, after the upload is committed."""
+    task = asyncio.get_running_loop().create_task(_transcode(media_id))
+    _transcode_tasks.add(task)
+    task.add_done_callback(_transcode_tasks.discard)
+
+
+def choose_quality(quality: str, headers: Mapping[str, str]) -> str:
+    """Requested rendition, or for 'auto' one picked from Save-Data/Downlink hints."""
+    if quality in RENDITIONS:
+        return quality
+    if headers.get("save-data", "").lower() == "on":
+        return LOW_QUALITY
+    try:
+        if float(headers.get("downlink", "")) < LOW_BANDWIDTH_MBPS:
+            return LOW_QUALITY
+    except ValueError:
+        pass
+    return DEFAULT_QUALITY
+
+
+def rendition_url(digest: Optional[str], fmt: str, quality: str) -> Optional[str]:
+    """Static URL of a rendition, or None when it has not been built.
+    HLS clients get the master playlist and switch variants themselves."""
+    if not digest or not renditions_exist(digest):
+        return None
+    base = f"{RENDITIONS_URL}/{digest[:2]}/{digest}"
+    return f"{base}/master.m3u8" if fmt == "hls" else f"{base}/{quality}.mp3"
@@ -0,0 +1,174 @@
+"""Async sending engine for admin email broadcasts.
+
+The old broadcast loop sent one email per `requests.post` (fresh TLS handshake
+each time) with a fixed sleep every 40 messages. This engine keeps one pooled
+keep-alive client per broadcast, packs recipients into Resend's batch endpoint
+(up to 100 messages per request), runs a bounded number of requests in flight
+and paces them with a token bucket so we stay under the provider's rate limit.
+
+Transport routing matches app/utils/email_service.send_single_email: Resend
+only when marketing is explicitly opted in (RESEND_MARKETING), otherwise SES
+through one shared boto3 client.
+
+Env:
+  BROADCAST_CONCURRENCY     provider requests in flight (default 4)
+  BROADCAST_RATE_PER_SEC    provider requests per second (default 2 on Resend —
+                            its default team limit — and 10 on SES)
+  BROADCAST_BATCH_SIZE      recipients per Resend batch request (default/max 100)
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import List, Optional, Tuple
+
+from app.utils.resend_client import (
+    RESEND_BATCH_MAX,
+    RESEND_BATCH_URL,
+    marketing_from,
+    resend_marketing_enabled,
+)
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "4"))
+BROADCAST_BATCH_SIZE = min(int(os.getenv("BROADCAST_BATCH_SIZE", str(RESEND_BATCH_MAX))), RESEND_BATCH_MAX)
+MAX_RETRIES = 4
+
+
+class TokenBucket:
+    """Async token bucket: refills `rate` tokens per second, bursts up to `capacity` (default: no burst)."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or 1.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: float = 1.0):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+def _backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return min(30.0, 0.5 * (2 ** attempt)) + random.uniform(0, 0.25)
+
+
+class ResendBatchTransport:
+    """Resend `/emails/batch` over a pooled httpx client."""
+
+    default_rate = 2.0
+
+    def __init__(self, api_key: str, from_addr: str, batch_url: str = RESEND_BATCH_URL,
+                 batch_size: int = BROADCAST_BATCH_SIZE, concurrency: int = BROADCAST_CONCURRENCY):
+        import httpx  # imported lazily like boto3 in email_service
+
+        self.max_batch = batch_size
+        self.from_addr = from_addr
+        self.batch_url = batch_url
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, connect=10.0),
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+            headers={"Authorization": f"Bearer {api_key}"},
+        )
+
+    async def send_batch(self, emails: List[str], subject: str, html: str) -> Tuple[int, int]:
+        import httpx
+
+        payload = [{"from": self.from_addr, "to": [email], "subject": subject, "html": html} for email in emails]
+        for attempt in range(MAX_RETRIES + 1):
+            retry_after = None
+            try:
+                resp = await self.client.post(self.batch_url, json=payload)
+                if resp.status_code // 100 == 2:
+                    return len(emails), 0
+                # 4xx other than 429 won't get better by retrying (bad address, bad key).
+                if resp.status_code != 429 and resp.status_code < 500:
+                    logger.error(f"Resend batch of {len(emails)} rejected: {resp.status_code} {resp.text[:300]}")
+                    return 0, len(emails)
+                retry_after = resp.headers.get("retry-after")
+                logger.warning(f"Resend batch got {resp.status_code}, attempt {attempt + 1}/{MAX_RETRIES + 1}")
+            except httpx.HTTPError as e:
+                logger.warning(f"Resend batch errored on attempt {attempt + 1}/{MAX_RETRIES + 1}: {e}")
+            if attempt < MAX_RETRIES:
+                await asyncio.sleep(_backoff_delay(attempt, retry_after))
+        logger.error(f"Resend batch of {len(emails)} failed after {MAX_RETRIES + 1} attempts")
+        return 0, len(emails)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class SesTransport:
+    """SES has no multi-message send for distinct HTML bodies, so each request
+    carries one recipient; the blocking boto3 call runs in a worker thread."""
+
+    default_rate = 10.0
+    max_batch = 1
+
+    def __init__(self):
+        from app.utils.email_service import _get_ses_client
+        self.client = _get_ses_client()
+
+    async def send_batch(self, emails: List[str], subject: str, html: str) -> Tuple[int, int]:
+        from app.utils.email_service import send_via_ses
+
+        sent = 0
+        for email in emails:
+            if await asyncio.to_thread(send_via_ses, self.client, email, subject, html):
+                sent += 1
+        return sent, len(emails) - sent
+
+    async def aclose(self):
+        pass
+
+
+def build_transport():
+    """Pick the broadcast transport the same way send_single_email does."""
+    if resend_marketing_enabled():
+        return ResendBatchTransport(os.getenv("RESEND_API_KEY"), marketing_from())
+    return SesTransport()
+
+
+class BroadcastSender:
+    """Fans a window of recipients out into provider batches, bounded by a
+    semaphore (in-flight requests) and a token bucket (requests per second)."""
+
+    def __init__(self, transport, concurrency: int = BROADCAST_CONCURRENCY, rate: Optional[float] = None):
+        self.transport = transport
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(rate or float(os.getenv("BROADCAST_RATE_PER_SEC", transport.default_rate)))
+
+    async def _send_one(self, emails: List[str], subject: str, html: str) -> Tuple[int, int]:
+        async with self.semaphore:
+            await self.bucket.acquire()
+            try:
+                return await self.transport.send_batch(emails, subject, html)
+            except Exception as e:
+                logger.error(f"Broadcast batch of {len(emails)} errored: {e}")
+                return 0, len(emails)
+
+    async def send(self, emails: List[str], subject: str, html: str) -> Tuple[int, int]:
+        """Send every address in `emails`; returns (sent, failed) once all batches settle."""
+        size = self.transport.max_batch
+        results = await asyncio.gather(*(
+            self._send_one(emails[i:i + size], subject, html) for i in range(0, len(emails), size)
+        ))
+        return sum(r[0] for r in results), sum(r[1] for r in results)
+
+    async def aclose(self):
+        await self.transport.aclose()
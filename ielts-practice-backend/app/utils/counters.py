@@ -0,0 +1,227 @@
+"""Admin dashboard counters, kept current instead of recounted per page load.
+
+/admin/users/count ran six COUNT(*) queries over users and
+/admin/dashboard/statistics five more scans, on every admin page load. The
+numbers now live in one Redis hash (admin_counters):
+
+  users:{role}:{0|1|null}   users per role and is_active (NULL is counted
+                            apart, as the old == True / == False counts did)
+  exams                rows in exams
+  exam_results         rows in exam_results
+
+They are kept current incrementally: a session hook looks at every flush for
+inserted or deleted User/Exam/ExamResult rows and for users whose role or
+is_active changed, and after the commit applies the deltas with HINCRBY
+(only if the hash exists, so a delta never creates a partial one): as a task
+on the event loop, or with the blocking client when the commit runs in a
+worker thread (sync endpoints such as admin create_student, asyncio.to_thread
+helpers). That covers the ORM write paths (registration, admin create, center
+members, activation toggles, role conversion) without touching them.
+
+Bulk UPDATE/DELETE statements (the lifecycle sweeps, cascading deletes) are
+not seen by the hook. Those, and any drift, are fixed by reconcile_counters: one
+GROUP BY role, is_active query plus two counts, run by the scheduler every
+COUNTERS_RECONCILE_SECONDS. That interval bounds how stale a counter can be.
+
+Without Redis each worker recounts at most every COUNTERS_LOCAL_TTL seconds.
+
+Env:
+  COUNTERS_RECONCILE_SECONDS   full recount interval (default 300)
+  COUNTERS_LOCAL_TTL           in-process cache lifetime without Redis (default 60)
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models.models import Exam, ExamResult, User
+from app.utils.redis_cache import cache
+from app.utils.scheduler import register_job
+
+logger = logging.getLogger(__name__)
+
+COUNTERS_KEY = "admin_counters"
+COUNTERS_RECONCILE_SECONDS = int(os.getenv("COUNTERS_RECONCILE_SECONDS", "300"))
+COUNTERS_LOCAL_TTL = int(os.getenv("COUNTERS_LOCAL_TTL", "60"))
+PENDING_INFO_KEY = "admin_counter_deltas"
+
+# Increment only a hash that a reconcile has populated
+_INCREMENT_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 1 then
+    for i = 1, #ARGV, 2 do
+        redis.call('hincrby', KEYS[1], ARGV[i], ARGV[i + 1])
+    end
+end
+return 0
+"""
+
+
+def user_field(role: Optional[str], is_active) -> str:
+    state = "null" if is_active is None else int(bool(is_active))
+    return f"users:{role or 'none'}:{state}"
+
+
+# ── Counting ────────────────────────────────────────────────────────────────
+
+def count_all(db) -> Dict[str, int]:
+    counts = {
+        user_field(role, is_active): total
+        for role, is_active, total in db.query(User.role, User.is_active, func.count()).group_by(User.role, User.is_active)
+    }
+    counts["exams"] = db.query(func.count(Exam.exam_id)).scalar() or 0
+    counts["exam_results"] = db.query(func.count(ExamResult.result_id)).scalar() or 0
+    return counts
+
+
+def _count_all_in_session() -> Dict[str, int]:
+    db = SessionLocal()
+    try:
+        return count_all(db)
+    finally:
+        db.close()
+
+
+async def reconcile_counters():
+    """Scheduler job: recount and replace the hash."""
+    if not cache.redis_client:
+        return
+    counts = await asyncio.to_thread(_count_all_in_session)
+    async with cache.redis_client.pipeline(transaction=True) as pipe:
+        pipe.delete(COUNTERS_KEY)
+        pipe.hset(COUNTERS_KEY, mapping=counts)
+        await pipe.execute()
+
+
+_local: Dict[str, int] = {}
+_local_expires = 0.0
+
+
+async def get_counters(db) -> Dict[str, int]:
+    """field -> count, from Redis, else a recent in-process copy, else a recount."""
+    global _local, _local_expires
+    if cache.redis_client:
+        try:
+            stored = await cache.redis_client.hgetall(COUNTERS_KEY)
+            if stored:
+                return {field: int(value) for field, value in stored.items()}
+            counts = count_all(db)
+            await cache.redis_client.hset(COUNTERS_KEY, mapping=counts)
+            return counts
+        except Exception as e:
+            logger.error(f"Counter read failed: {e}")
+    if time.time() >= _local_expires:
+        _local, _local_expires = count_all(db), time.time() + COUNTERS_LOCAL_TTL
+    return dict(_local)
+
+
+def user_total(counts: Dict[str, int], role: Optional[str] = None, is_active: Optional[bool] = None) -> int:
+    total = 0
+    for field, value in counts.items():
+        kind, _, rest = field.partition(":")
+        if kind != "users":
+            continue
+        field_role, _, field_active = rest.rpartition(":")
+        if role and field_role != role:
+            continue
+        if is_active is not None and field_active != ("1" if is_active else "0"):
+            continue
+        total += value
+    return total
+
+
+# ── Incremental updates ─────────────────────────────────────────────────────
+
+def _committed(state, attr):
+    history = state.attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    # Not loaded before the change: no lazy load here, reconcile corrects it
+    return history.unchanged[0] if history.unchanged else state.dict.get(attr)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_deltas(session, flush_context):
+    deltas = Counter()
+    for obj in session.new:
+        if isinstance(obj, User):
+            deltas[user_field(obj.role, obj.is_active)] += 1
+        elif isinstance(obj, Exam):
+            deltas["exams"] += 1
+        elif isinstance(obj, ExamResult):
+            deltas["exam_results"] += 1
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            state = inspect(obj)
+            deltas[user_field(_committed(state, "role"), _committed(state, "is_active"))] -= 1
+        elif isinstance(obj, Exam):
+            deltas["exams"] -= 1
+        elif isinstance(obj, ExamResult):
+            deltas["exam_results"] -= 1
+    for obj in session.dirty:
+        if not isinstance(obj, User):
+            continue
+        state = inspect(obj)
+        if not (state.attrs.role.history.has_changes() or state.attrs.is_active.history.has_changes()):
+            continue
+        before = user_field(_committed(state, "role"), _committed(state, "is_active"))
+        after = user_field(obj.role, obj.is_active)
+        if before != after:
+            deltas[before] -= 1
+            deltas[after] += 1
+    if deltas:
+        session.info.setdefault(PENDING_INFO_KEY, Counter()).update(deltas)
+
+
+def _script_args(deltas: Counter) -> list:
+    return [value for field, delta in deltas.items() if delta for value in (field, delta)]
+
+
+async def _apply(deltas: Counter):
+    try:
+        args = _script_args(deltas)
+        if args:
+            await cache.redis_client.eval(_INCREMENT_SCRIPT, 1, COUNTERS_KEY, *args)
+    except Exception as e:
+        logger.error(f"Counter update failed: {e}")
+
+
+def _apply_blocking(deltas: Counter):
+    try:
+        args = _script_args(deltas)
+        if args and cache.sync_client:
+            cache.sync_client.eval(_INCREMENT_SCRIPT, 1, COUNTERS_KEY, *args)
+    except Exception as e:
+        logger.error(f"Counter update failed: {e}")
+
+
+_apply_tasks = set()  # strong references until the updates finish
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_deltas(session):
+    deltas = session.info.pop(PENDING_INFO_KEY, None)
+    if not deltas or not cache.redis_client:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _apply_blocking(deltas)  # worker thread: no loop to run the async client on
+        return
+    task = loop.create_task(_apply(deltas))
+    _apply_tasks.add(task)
+    task.add_done_callback(_apply_tasks.discard)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_deltas(session):
+    session.info.pop(PENDING_INFO_KEY, None)
+
+
+def register_counter_jobs():
+    register_job("admin_counters", COUNTERS_RECONCILE_SECONDS, reconcile_counters)
@@ -0,0 +1,152 @@
+"""Cached per-domain verdicts for signup email checks.
+
+verify_email_domain used to run the blocking dns.resolver.resolve (MX, then A)
+inside async endpoints on every signup attempt, so a slow resolver stalled the
+whole worker for seconds. Nearly all signups use a handful of domains
+(gmail.com, yahoo.com, …), so the answer is almost always already known.
+
+check_domain(domain) returns one verdict covering both checks:
+  {"domain_exists": bool, "disposable": bool}
+It is looked up in a small per-process LRU, then in Redis (email_domain:{domain},
+shared by every worker), and only then resolved with dns.asyncresolver, which
+does not block the event loop. Concurrent misses for the same domain share a
+single lookup.
+
+Positive verdicts live as long as the MX/A record TTL (clamped to
+[EMAIL_DOMAIN_MIN_TTL, EMAIL_DOMAIN_MAX_TTL]); domains that do not exist are
+cached for EMAIL_DOMAIN_NEGATIVE_TTL. Only NXDOMAIN or a domain with neither
+MX nor A records counts as "does not exist". Resolver timeouts, NoNameservers
+and unexpected errors leave the answer unknown: the domain is allowed (as the
+old is_valid_email did), logged, and not cached, so a DNS outage never blocks
+signups. Disposable domains are decided from DISPOSABLE_DOMAINS without
+touching DNS.
+
+Env:
+  EMAIL_DNS_TIMEOUT          seconds per lookup (default 3)
+  EMAIL_DOMAIN_MIN_TTL       default 300
+  EMAIL_DOMAIN_MAX_TTL       default 86400
+  EMAIL_DOMAIN_NEGATIVE_TTL  default 3600
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import dns.asyncresolver
+import dns.exception
+import dns.resolver
+
+from app.utils.email_blocklist import DISPOSABLE_DOMAINS
+from app.utils.redis_cache import cache, get_email_domain_cache_key
+
+logger = logging.getLogger(__name__)
+
+DNS_TIMEOUT = float(os.getenv("EMAIL_DNS_TIMEOUT", "3"))
+MIN_TTL = int(os.getenv("EMAIL_DOMAIN_MIN_TTL", "300"))
+MAX_TTL = int(os.getenv("EMAIL_DOMAIN_MAX_TTL", "86400"))
+NEGATIVE_TTL = int(os.getenv("EMAIL_DOMAIN_NEGATIVE_TTL", "3600"))
+LOCAL_MAX_ENTRIES = 10000
+
+# domain -> (verdict, monotonic expiry)
+_local: "OrderedDict[str, Tuple[Dict[str, bool], float]]" = OrderedDict()
+_inflight: Dict[str, asyncio.Future] = {}
+_resolver: Optional[dns.asyncresolver.Resolver] = None
+
+stats = {"local_hits": 0, "redis_hits": 0, "lookups": 0}
+
+
+def normalize_domain(email_or_domain: str) -> str:
+    return email_or_domain.rsplit("@", 1)[-1].strip().lower().rstrip(".")
+
+
+def _get_resolver() -> dns.asyncresolver.Resolver:
+    global _resolver
+    if _resolver is None:
+        _resolver = dns.asyncresolver.Resolver()
+        _resolver.lifetime = DNS_TIMEOUT
+    return _resolver
+
+
+def _remember(domain: str, verdict: Dict[str, bool], ttl: int):
+    _local[domain] = (verdict, time.monotonic() + ttl)
+    _local.move_to_end(domain)
+    while len(_local) > LOCAL_MAX_ENTRIES:
+        _local.popitem(last=False)
+
+
+def _clamp_ttl(ttl: int) -> int:
+    return max(MIN_TTL, min(MAX_TTL, ttl))
+
+
+async def _resolve(domain: str) -> Tuple[Dict[str, bool], int]:
+    """Look the domain up (MX, then A). Returns (verdict, seconds to cache it);
+    0 seconds when the resolver could not answer and the domain is let through."""
+    resolver = _get_resolver()
+    transient = False
+    for record_type in ("MX", "A"):
+        try:
+            answer = await resolver.resolve(domain, record_type)
+            return {"domain_exists": True, "disposable": False}, _clamp_ttl(answer.rrset.ttl)
+        except dns.resolver.NXDOMAIN:
+            # No such name: the A lookup would say the same
+            return {"domain_exists": False, "disposable": False}, NEGATIVE_TTL
+        except dns.resolver.NoAnswer:
+            continue
+        except (dns.exception.Timeout, dns.resolver.NoNameservers) as e:
+            logger.warning(f"DNS {record_type} lookup for {domain} failed: {e!r}")
+            transient = True
+        except Exception as e:
+            logger.error(f"Error validating email domain {domain}: {e}")
+            transient = True
+    if transient:
+        return {"domain_exists": True, "disposable": False}, 0
+    return {"domain_exists": False, "disposable": False}, NEGATIVE_TTL
+
+
+async def _lookup_and_store(domain: str) -> Dict[str, bool]:
+    stats["lookups"] += 1
+    verdict, ttl = await _resolve(domain)
+    if ttl:
+        _remember(domain, verdict, ttl)
+        await cache.set(
+            get_email_domain_cache_key(domain),
+            {"verdict": verdict, "expires_at": time.time() + ttl},
+            ttl=ttl,
+        )
+    return verdict
+
+
+async def check_domain(domain: str) -> Dict[str, bool]:
+    """Verdict for an email address or bare domain:
+    {"domain_exists": bool, "disposable": bool}."""
+    domain = normalize_domain(domain)
+    if domain in DISPOSABLE_DOMAINS:
+        return {"domain_exists": True, "disposable": True}
+
+    entry = _local.get(domain)
+    if entry and entry[1] > time.monotonic():
+        stats["local_hits"] += 1
+        _local.move_to_end(domain)
+        return entry[0]
+
+    cached = await cache.get(get_email_domain_cache_key(domain))
+    if cached:
+        stats["redis_hits"] += 1
+        # Keep it locally for whatever is left of the record TTL
+        _remember(domain, cached["verdict"], max(0, int(cached["expires_at"] - time.time())))
+        return cached["verdict"]
+
+    pending = _inflight.get(domain)
+    if pending is not None:
+        return await asyncio.shield(pending)
+    task = asyncio.ensure_future(_lookup_and_store(domain))
+    _inflight[domain] = task
+    try:
+        return await asyncio.shield(task)
+    finally:
+        if task.done():
+            _inflight.pop(domain, None)
+        else:
+            task.add_done_callback(lambda _: _inflight.pop(domain, None))
@@ -0,0 +1,430 @@
+"""Durable outbox for transactional email (OTP, password reset, welcome, admin notices).
+
+Handlers used to call email_utils.send_email inline: a fresh SMTP connection
+with STARTTLS and login per message (or a fresh HTTPS request to Resend),
+blocking the event loop while the user waited. Now a handler only inserts an
+email_outbox row and pushes its id onto a queue; it returns as soon as the row
+is committed.
+
+Each uvicorn worker runs a small pool of outbox workers (started from
+app/main.py). A worker pops a batch of ids, claims the rows with a conditional
+UPDATE (so the 8 processes never send the same row twice), and sends them over
+a connection it keeps open between batches:
+  - Resend (when RESEND_API_KEY is set): one /emails/batch request per batch on
+    a pooled keep-alive client (broadcast_sender.ResendBatchTransport)
+  - SMTP otherwise: one persistent, logged-in connection per worker
+Failures are retried with exponential backoff through next_attempt_at; after
+EMAIL_OUTBOX_MAX_ATTEMPTS the row is marked failed. A Resend batch rejected as
+a whole (one bad address gets a 422) is resent message by message, so only the
+bad message is marked.
+
+The queue is a Redis list shared by all workers. When Redis is unavailable an
+in-process asyncio.Queue stands in for it. The table is the source of truth
+either way: a periodic sweep re-queues due rows (retries, ids lost with a
+Redis restart) and releases rows held by a worker that died mid-send: a
+worker renews claimed_at every CLAIM_RENEW_EVERY while its batch is sending,
+so only a claim left alone for CLAIM_STALE_AFTER is taken back, however long
+the batch takes.
+
+Env:
+  EMAIL_OUTBOX_WORKERS        workers per process (default 2)
+  EMAIL_OUTBOX_BATCH_SIZE     emails per claim/send (default 20)
+  EMAIL_OUTBOX_MAX_ATTEMPTS   attempts before giving up (default 6)
+  EMAIL_OUTBOX_POLL_SECONDS   sweep interval (default 15)
+"""
+import asyncio
+import logging
+import os
+import random
+import smtplib
+from datetime import timedelta
+from typing import List, Tuple
+from uuid import uuid4
+
+from sqlalchemy import or_
+
+from app.database import SessionLocal
+from app.models.models import EmailOutbox
+from app.utils.datetime_utils import get_vietnam_time
+from app.utils.redis_cache import cache
+
+logger = logging.getLogger(__name__)
+
+EMAIL_OUTBOX_WORKERS = int(os.getenv("EMAIL_OUTBOX_WORKERS", "2"))
+EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv("EMAIL_OUTBOX_BATCH_SIZE", "20"))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", "6"))
+EMAIL_OUTBOX_POLL_SECONDS = int(os.getenv("EMAIL_OUTBOX_POLL_SECONDS", "15"))
+CLAIM_STALE_AFTER = timedelta(minutes=5)
+CLAIM_RENEW_EVERY = 60  # seconds; well under CLAIM_STALE_AFTER
+QUEUE_KEY = "email_outbox:queue"
+
+
+def _now():
+    return get_vietnam_time().replace(tzinfo=None)
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    """30s, 1m, 2m, 4m, ... capped at 30 minutes, with jitter."""
+    seconds = min(1800, 30 * (2 ** max(attempts - 1, 0)))
+    return timedelta(seconds=seconds * random.uniform(0.8, 1.2))
+
+
+# ── Queue ────────────────────────────────────────────────────────────────────
+
+class OutboxQueue:
+    """Redis list shared by every process, or an in-process asyncio.Queue
+    when Redis is not connected. Only ids travel through it."""
+
+    def __init__(self):
+        self._local: asyncio.Queue = None
+
+    @property
+    def local(self) -> asyncio.Queue:
+        if self._local is None:
+            self._local = asyncio.Queue()
+        return self._local
+
+    async def push(self, ids: List[int]):
+        if not ids:
+            return
+        if cache.redis_client:
+            try:
+                await cache.redis_client.lpush(QUEUE_KEY, *ids)
+                return
+            except Exception as e:
+                logger.error(f"Outbox queue push failed, queueing locally: {e}")
+        for outbox_id in ids:
+            self.local.put_nowait(outbox_id)
+
+    async def pop_batch(self, max_items: int, timeout: float = 2.0) -> List[int]:
+        """Wait up to `timeout` for one id, then take up to max_items without waiting."""
+        ids = []
+        while not self.local.empty() and len(ids) < max_items:
+            ids.append(self.local.get_nowait())
+        if cache.redis_client and len(ids) < max_items:
+            try:
+                if not ids:
+                    # Blocking pop must stay under the client's 5s socket timeout
+                    item = await cache.redis_client.brpop(QUEUE_KEY, timeout=max(1, int(timeout)))
+                    if item:
+                        ids.append(int(item[1]))
+                if ids:
+                    more = await cache.redis_client.rpop(QUEUE_KEY, max_items - len(ids))
+                    ids.extend(int(outbox_id) for outbox_id in more or [])
+                return ids
+            except Exception as e:
+                logger.error(f"Outbox queue pop failed: {e}")
+        if not ids:
+            try:
+                ids.append(await asyncio.wait_for(self.local.get(), timeout))
+            except asyncio.TimeoutError:
+                return []
+            while not self.local.empty() and len(ids) < max_items:
+                ids.append(self.local.get_nowait())
+        return ids
+
+
+outbox_queue = OutboxQueue()
+
+
+# ── Enqueue (called from request handlers) ───────────────────────────────────
+
+def enqueue_email(db, to_email: str, subject: str, html: str, category: str = "transactional") -> int:
+    """Store an email in the outbox, commit it, and wake a worker.
+
+    Commits: every caller sends after its own state change is already
+    committed (or has none), and the row must be durable before we return.
+    Raises if the row cannot be stored, like send_email raised on bad config.
+    """
+    row = EmailOutbox(
+        to_email=to_email,
+        subject=subject,
+        body_html=html,
+        category=category,
+        status='pending',
+        next_attempt_at=_now(),
+    )
+    db.add(row)
+    db.commit()
+    try:
+        # Handlers run on the event loop; the push happens right after they return
+        asyncio.get_running_loop().create_task(outbox_queue.push([row.id]))
+    except RuntimeError:
+        pass  # no loop (scripts): the sweep picks the row up
+    return row.id
+
+
+# ── Transports ───────────────────────────────────────────────────────────────
+
+class SmtpTransport:
+    """One persistent, logged-in SMTP connection, reconnected when it drops.
+    Blocking smtplib calls run in a worker thread."""
+
+    def __init__(self, host: str = None, port: int = None, username: str = None, password: str = None):
+        from app.utils import email_utils
+
+        self.host = host or email_utils.EMAIL_HOST
+        self.port = port or email_utils.EMAIL_PORT
+        self.username = email_utils.EMAIL_USERNAME if username is None else username
+        self.password = email_utils.EMAIL_PASSWORD if password is None else password
+        self.server = None
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=30)
+        server.ehlo()
+        if server.has_extn("starttls"):
+            server.starttls()
+            server.ehlo()
+        if self.username and self.password:
+            server.login(self.username, self.password)
+        self.server = server
+
+    def _close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+            self.server = None
+
+    def _send_one(self, to_email: str, message: str):
+        for attempt in range(2):
+            try:
+                if self.server is None:
+                    self._connect()
+                self.server.sendmail(self.username or "", to_email, message)
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                # Idle connection was dropped by the server: reconnect once
+                self._close()
+                if attempt:
+                    raise
+            except smtplib.SMTPException:
+                raise  # rejected message or login; the connection itself is fine
+            except OSError:
+                self._close()
+                if attempt:
+                    raise
+
+    def _send_all(self, messages: List[Tuple[str, str, str]]) -> List[str]:
+        from app.utils.email_utils import build_mime_message
+
+        errors = []
+        for to_email, subject, html in messages:
+            try:
+                self._send_one(to_email, build_mime_message(to_email, subject, html).as_string())
+                errors.append(None)
+            except Exception as e:
+                errors.append(str(e) or type(e).__name__)
+        return errors
+
+    async def send_batch(self, messages: List[Tuple[str, str, str]]) -> List[str]:
+        """Returns one error (None on success) per message."""
+        return await asyncio.to_thread(self._send_all, messages)
+
+    async def aclose(self):
+        await asyncio.to_thread(self._close)
+
+
+class ResendTransport:
+    """Transactional Resend sends through one /emails/batch request per batch."""
+
+    def __init__(self):
+        from app.utils.broadcast_sender import ResendBatchTransport
+        from app.utils.resend_client import RESEND_API_URL, transactional_from
+
+        self.from_addr = transactional_from()
+        self.single_url = RESEND_API_URL
+        self.batch = ResendBatchTransport(os.getenv("RESEND_API_KEY"), self.from_addr, concurrency=1)
+
+    def _payload(self, to: str, subject: str, html: str) -> dict:
+        return {"from": self.from_addr, "to": [to], "subject": subject, "html": html}
+
+    async def _send_one(self, message: Tuple[str, str, str]) -> str:
+        try:
+            resp = await self.batch.client.post(self.single_url, json=self._payload(*message))
+        except Exception as e:
+            return str(e) or type(e).__name__
+        if resp.status_code // 100 == 2:
+            return None
+        return f"Resend {resp.status_code}: {resp.text[:200]}"
+
+    async def send_batch(self, messages: List[Tuple[str, str, str]]) -> List[str]:
+        payload = [self._payload(*message) for message in messages]
+        try:
+            resp = await self.batch.client.post(self.batch.batch_url, json=payload)
+        except Exception as e:
+            # Unknown whether Resend accepted it; resending could duplicate, so retry later
+            return [str(e) or type(e).__name__] * len(messages)
+        if resp.status_code // 100 == 2:
+            return [None] * len(messages)
+        error = f"Resend {resp.status_code}: {resp.text[:200]}"
+        if resp.status_code == 429 or len(messages) == 1:
+            return [error] * len(messages)
+        # Resend validates the batch as a whole: find the message(s) it rejected
+        logger.warning(f"Resend batch of {len(messages)} rejected ({error}), sending one by one")
+        return [await self._send_one(message) for message in messages]
+
+    async def aclose(self):
+        await self.batch.aclose()
+
+
+def build_outbox_transport():
+    """Same routing as email_utils.send_email: Resend when configured, else SMTP."""
+    from app.utils.resend_client import resend_configured
+
+    return ResendTransport() if resend_configured() else SmtpTransport()
+
+
+# ── Worker ───────────────────────────────────────────────────────────────────
+
+def _claim(ids: List[int]) -> Tuple[str, List[Tuple[int, str, str, str, int]]]:
+    """Atomically take the due, pending rows among `ids`; returns the claim
+    token and what to send."""
+    db = SessionLocal()
+    try:
+        token = uuid4().hex
+        db.query(EmailOutbox).filter(
+            EmailOutbox.id.in_(ids),
+            EmailOutbox.status == 'pending',
+            EmailOutbox.next_attempt_at <= _now(),
+        ).update({EmailOutbox.status: 'sending', EmailOutbox.claimed_at: _now(), EmailOutbox.claim_token: token},
+                 synchronize_session=False)
+        db.commit()
+        rows = db.query(
+            EmailOutbox.id, EmailOutbox.to_email, EmailOutbox.subject, EmailOutbox.body_html, EmailOutbox.attempts
+        ).filter(
+            EmailOutbox.id.in_(ids),
+            EmailOutbox.claim_token == token,
+        ).all()
+        return token, [tuple(row) for row in rows]
+    finally:
+        db.close()
+
+
+def _renew_claim(token: str):
+    db = SessionLocal()
+    try:
+        db.query(EmailOutbox).filter(
+            EmailOutbox.claim_token == token,
+            EmailOutbox.status == 'sending',
+        ).update({EmailOutbox.claimed_at: _now()}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+async def _keep_claim(token: str):
+    """Renew a batch's claim until cancelled, so the sweep leaves it alone."""
+    while True:
+        await asyncio.sleep(CLAIM_RENEW_EVERY)
+        try:
+            await asyncio.to_thread(_renew_claim, token)
+        except Exception as e:
+            logger.error(f"Outbox claim renewal failed: {e}")
+
+
+def _record_results(rows, errors: List[str]):
+    db = SessionLocal()
+    try:
+        now = _now()
+        sent_ids = [row[0] for row, error in zip(rows, errors) if error is None]
+        if sent_ids:
+            db.query(EmailOutbox).filter(EmailOutbox.id.in_(sent_ids)).update(
+                {EmailOutbox.status: 'sent', EmailOutbox.sent_at: now, EmailOutbox.claimed_at: None,
+                 EmailOutbox.claim_token: None, EmailOutbox.attempts: EmailOutbox.attempts + 1},
+                synchronize_session=False,
+            )
+        for (outbox_id, to_email, _, _, attempts), error in zip(rows, errors):
+            if error is None:
+                continue
+            attempts += 1
+            gave_up = attempts >= EMAIL_OUTBOX_MAX_ATTEMPTS
+            db.query(EmailOutbox).filter(EmailOutbox.id == outbox_id).update({
+                EmailOutbox.status: 'failed' if gave_up else 'pending',
+                EmailOutbox.attempts: attempts,
+                EmailOutbox.next_attempt_at: now + _retry_delay(attempts),
+                EmailOutbox.claimed_at: None,
+                EmailOutbox.claim_token: None,
+                EmailOutbox.last_error: error[:2000],
+            }, synchronize_session=False)
+            logger.warning(f"Outbox email {outbox_id} to {to_email} failed (attempt {attempts}): {error}")
+        db.commit()
+    finally:
+        db.close()
+
+
+def _due_rows(limit: int = 500) -> List[int]:
+    """Release claims of dead workers, then list rows that are due."""
+    db = SessionLocal()
+    try:
+        now = _now()
+        db.query(EmailOutbox).filter(
+            EmailOutbox.status == 'sending',
+            or_(EmailOutbox.claimed_at.is_(None), EmailOutbox.claimed_at < now - CLAIM_STALE_AFTER),
+        ).update({EmailOutbox.status: 'pending', EmailOutbox.claimed_at: None, EmailOutbox.claim_token: None},
+                 synchronize_session=False)
+        db.commit()
+        rows = db.query(EmailOutbox.id).filter(
+            EmailOutbox.status == 'pending',
+            EmailOutbox.next_attempt_at <= now,
+        ).order_by(EmailOutbox.next_attempt_at).limit(limit).all()
+        return [row.id for row in rows]
+    finally:
+        db.close()
+
+
+async def _worker(transport):
+    try:
+        while True:
+            ids = await outbox_queue.pop_batch(EMAIL_OUTBOX_BATCH_SIZE)
+            if not ids:
+                continue
+            try:
+                token, rows = await asyncio.to_thread(_claim, ids)
+                if not rows:
+                    continue
+                keeper = asyncio.create_task(_keep_claim(token))
+                try:
+                    errors = await transport.send_batch([(row[1], row[2], row[3]) for row in rows])
+                finally:
+                    keeper.cancel()
+                await asyncio.to_thread(_record_results, rows, errors)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Claimed rows are released by the sweep once their claim goes stale
+                logger.error(f"Outbox worker error: {e}")
+                await asyncio.sleep(1)
+    finally:
+        await transport.aclose()
+
+
+async def _sweeper():
+    while True:
+        try:
+            # Local queue only: every process sweeps, claims dedupe the overlap
+            for outbox_id in await asyncio.to_thread(_due_rows):
+                outbox_queue.local.put_nowait(outbox_id)
+        except Exception as e:
+            logger.error(f"Outbox sweep error: {e}")
+        await asyncio.sleep(EMAIL_OUTBOX_POLL_SECONDS)
+
+
+_outbox_tasks = []
+
+
+def start_outbox_workers(workers: int = EMAIL_OUTBOX_WORKERS):
+    """Start this process's outbox workers and sweep (called at app startup)."""
+    loop = asyncio.get_running_loop()
+    _outbox_tasks.append(loop.create_task(_sweeper()))
+    for _ in range(workers):
+        _outbox_tasks.append(loop.create_task(_worker(build_outbox_transport())))
+
+
+async def stop_outbox_workers():
+    """Cancel workers on shutdown; rows they held are re-queued by the next sweep."""
+    for task in _outbox_tasks:
+        task.cancel()
+    await asyncio.gather(*_outbox_tasks, return_exceptions=True)
+    _outbox_tasks.clear()
@@ -45,6 +45,19 @@ def send_single_email(to_email: str, subject: str, body_html: str) -> bool:
         return False
     try:
         client = _get_ses_client()
+    except Exception as e:
+        logger.error(f"Failed to send email to {to_email}: {e}")
+        return False
+    return send_via_ses(client, to_email, subject, body_html)
+
+
+def send_via_ses(client, to_email: str, subject: str, body_html: str) -> bool:
+    """Send one email through an existing SES client.
+
+    boto3 clients are thread-safe and keep their own HTTPS connection pool, so
+    the broadcast engine shares one client instead of building one per email.
+    """
+    try:
         client.send_email(
             Source=f"{SES_FROM_NAME} <{SES_FROM_EMAIL}>",
             Destination={"ToAddresses": [to_email]},
@@ -1,6 +1,5 @@
 import os
 import smtplib
-import dns.resolver
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.utils import formataddr
@@ -27,29 +26,19 @@ print(f"EMAIL_USERNAME: {'Set' if EMAIL_USERNAME else 'Not set'}")
 print(f"EMAIL_PASSWORD: {'Set' if EMAIL_PASSWORD else 'Not set'}")
 print(f"EMAIL_FROM: {EMAIL_FROM}")
 
-def is_valid_email(email: str) -> bool:
-    """
-    Check if an email address is potentially valid by verifying the domain's MX records.
+def build_mime_message(to_email: str, subject: str, html_content: str) -> MIMEMultipart:
+    """The transactional SMTP message (shared with the outbox SMTP transport)."""
+    message = MIMEMultipart("alternative")
+    message["Subject"] = subject
+    sender_addr = EMAIL_FROM or EMAIL_USERNAME
+    # RFC 2047-encode the display name so Vietnamese diacritics don't corrupt the header.
+    message["From"] = formataddr((str(Header(EMAIL_FROM_NAME, "utf-8")), sender_addr)) if EMAIL_FROM_NAME else sender_addr
+    message["To"] = to_email
     
-    Args:
-        email: The email address to validate
-        
-    Returns:
-        bool: True if the email domain has valid MX records, False otherwise
-    """
-    try:
-        # Split the email address to get the domain
-        domain = email.split('@')[1]
-        
-        # Check if MX records exist for the domain
-        dns.resolver.resolve(domain, 'MX')
-        return True
-    except (IndexError, dns.resolver.NoAnswer, dns.resolver.NXDOMAIN, dns.exception.Timeout):
-        return False
-    except Exception as e:
-        print(f"Error validating email domain: {str(e)}")
-        # Return True in case of other errors to avoid blocking registration
-        return True
+    # Attach HTML content
+    html_part = MIMEText(html_content, "html")
+    message.attach(html_part)
+    return message
 
 def send_email(to_email: str, subject: str, html_content: str) -> bool:
     """
@@ -75,17 +64,7 @@ def send_email(to_email: str, subject: str, html_content: str) -> bool:
             detail="Email service is not configured properly"
         )
 
-    # Create message
-    message = MIMEMultipart("alternative")
-    message["Subject"] = subject
-    sender_addr = EMAIL_FROM or EMAIL_USERNAME
-    # RFC 2047-encode the display name so Vietnamese diacritics don't corrupt the header.
-    message["From"] = formataddr((str(Header(EMAIL_FROM_NAME, "utf-8")), sender_addr)) if EMAIL_FROM_NAME else sender_addr
-    message["To"] = to_email
-    
-    # Attach HTML content
-    html_part = MIMEText(html_content, "html")
-    message.attach(html_part)
+    message = build_mime_message(to_email, subject, html_content)
     
     try:
         # Connect to SMTP server
@@ -101,18 +80,17 @@ def send_email(to_email: str, subject: str, html_content: str) -> bool:
         print(f"Failed to send email: {str(e)}")
         return False
 
-def send_password_reset_email(to_email: str, reset_token: str, username: str, frontend_url: str) -> bool:
+def build_password_reset_email(reset_token: str, username: str, frontend_url: str) -> tuple:
     """
-    Send a password reset email with a reset link to the user.
+    Build the password reset email with a reset link for the user.
     
     Args:
-        to_email: Email address of the user
         reset_token: The token to be used for password reset
         username: The username of the user
         frontend_url: The base URL of the frontend application
         
     Returns:
-        bool: True if email was sent successfully, False otherwise
+        tuple: (subject, html_content)
     """
     from app.utils.email_templates import render_email, paragraph, cta_button
 
@@ -128,19 +106,18 @@ def send_password_reset_email(to_email: str, reset_token: str, username: str, fr
         + paragraph("Nếu bạn không yêu cầu đặt lại mật khẩu, vui lòng bỏ qua email này — tài khoản của bạn vẫn an toàn.")
     )
     html_content = render_email("Đặt lại mật khẩu", body, preheader="Yêu cầu đặt lại mật khẩu tài khoản của bạn")
-    return send_email(to_email, subject, html_content)
+    return subject, html_content
 
-def send_account_created_email(to_email: str, username: str, frontend_url: str) -> bool:
+def build_account_created_email(username: str, frontend_url: str) -> tuple:
     """
-    Send an email notifying a user that an account has been created with their email.
+    Build the email notifying a user that an account has been created with their email.
     
     Args:
-        to_email: Email address of the user
         username: The username of the user
         frontend_url: The base URL of the frontend application
         
     Returns:
-        bool: True if email was sent successfully, False otherwise
+        tuple: (subject, html_content)
     """
     from app.utils.email_templates import render_email, paragraph, cta_button
 
@@ -155,4 +132,4 @@ def send_account_created_email(to_email: str, username: str, frontend_url: str)
         + paragraph("Nếu bạn có bất kỳ câu hỏi nào hoặc cần hỗ trợ, đừng ngần ngại liên hệ với chúng tôi.")
     )
     html_content = render_email("Chào mừng bạn! 🎉", body, preheader="Tài khoản của bạn đã sẵn sàng")
-    return send_email(to_email, subject, html_content)
+    return subject, html_content
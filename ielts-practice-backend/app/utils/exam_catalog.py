@@ -0,0 +1,325 @@
+"""Listening/reading test catalog with a question-type facet index.
+
+The student test lists (/student/available-listening-exams,
+/student/reading/reading-tests) send every accessible test, each with the
+union of its sections' question_type_tags built in Python, and the frontend
+filters by question type after downloading all of them. The catalog endpoint
+(/student/catalog/{skill}?types=...&page=) filters and pages on the server
+instead, from an index built once for the whole catalog:
+
+  skills.{skill}.exams    test cards (title, part titles, question types,
+                          access tiers), newest first
+  skills.{skill}.facets   access tier -> question type -> {exams, sections}
+
+A section's question types are its admin-set question_type_tags plus the
+group_type of its question groups. Building the index takes five queries for
+both skills.
+
+The index is cached in Redis (and in each process) together with the catalog
+generation it was built from, a counter in Redis. Admin edits bump the counter
+after their commit: a session hook watches flushes for changed Exam,
+ExamSection, QuestionGroup and ExamAccessType rows (which covers a clone's new
+exam), and mark_exam_content_changed and the exam delete cover the bulk
+statements the hook cannot see; commits in worker threads (sync endpoints)
+bump it with the blocking Redis client. Each read checks the counter and
+rebuilds on a mismatch.
+CATALOG_TTL bounds staleness for anything else, and without Redis each
+process rebuilds at most every CATALOG_LOCAL_TTL seconds.
+
+Env:
+  CATALOG_TTL         Redis copy lifetime in seconds (default 3600)
+  CATALOG_LOCAL_TTL   in-process copy lifetime without Redis (default 60)
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Iterable, List, Optional
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.models.models import Exam, ExamAccessType, ExamSection, QuestionGroup, ReadingPassage
+from app.utils.redis_cache import cache
+
+logger = logging.getLogger(__name__)
+
+SKILLS = ("listening", "reading")
+GENERATION_KEY = "exam_catalog:generation"
+INDEX_KEY = "exam_catalog:index"
+CATALOG_TTL = int(os.getenv("CATALOG_TTL", "3600"))
+CATALOG_LOCAL_TTL = int(os.getenv("CATALOG_LOCAL_TTL", "60"))
+DIRTY_INFO_KEY = "exam_catalog_dirty"
+
+_WATCHED = (Exam, ExamSection, QuestionGroup, ExamAccessType)
+
+
+def allowed_access_types(user) -> List[str]:
+    """Exam access tiers a user may open, as in the test list endpoints."""
+    if user.role == 'student':
+        return ['student']
+    if user.role == 'customer':
+        return ['no vip', 'vip'] if user.is_vip else ['no vip']
+    return []
+
+
+# ── Building ────────────────────────────────────────────────────────────────
+
+def build_index(db) -> dict:
+    sections = (
+        db.query(
+            ExamSection.exam_id, ExamSection.section_id, ExamSection.section_type,
+            ExamSection.order_number, ExamSection.part_title, ExamSection.duration,
+            ExamSection.total_marks, ExamSection.question_type_tags,
+        )
+        .join(Exam, Exam.exam_id == ExamSection.exam_id)
+        .filter(Exam.is_active == True, ExamSection.section_type.in_(SKILLS))
+        .order_by(ExamSection.exam_id, ExamSection.order_number, ExamSection.section_id)
+        .all()
+    )
+    exam_ids = {s.exam_id for s in sections}
+    section_ids = [s.section_id for s in sections]
+    exams = {
+        e.exam_id: e
+        for e in db.query(Exam.exam_id, Exam.title, Exam.created_at).filter(Exam.exam_id.in_(exam_ids))
+    } if exam_ids else {}
+    access = defaultdict(list)
+    if exam_ids:
+        for exam_id, access_type in db.query(ExamAccessType.exam_id, ExamAccessType.access_type).filter(
+            ExamAccessType.exam_id.in_(exam_ids)
+        ):
+            access[exam_id].append(access_type)
+    group_types = defaultdict(set)
+    passage_titles = {}
+    if section_ids:
+        for section_id, group_type in db.query(QuestionGroup.section_id, QuestionGroup.group_type).filter(
+            QuestionGroup.section_id.in_(section_ids), QuestionGroup.group_type.isnot(None)
+        ).distinct():
+            group_types[section_id].add(group_type)
+        reading_ids = [s.section_id for s in sections if s.section_type == "reading"]
+        if reading_ids:
+            passage_titles = dict(db.query(ReadingPassage.section_id, ReadingPassage.title).filter(
+                ReadingPassage.section_id.in_(reading_ids)
+            ))
+
+    cards = {skill: {} for skill in SKILLS}
+    facets = {skill: defaultdict(lambda: defaultdict(lambda: {"exams": set(), "sections": []})) for skill in SKILLS}
+    for s in sections:
+        skill = s.section_type
+        card = cards[skill].get(s.exam_id)
+        if card is None:
+            exam = exams[s.exam_id]
+            card = cards[skill][s.exam_id] = {
+                "exam_id": s.exam_id,
+                "title": exam.title,
+                "created_at": exam.created_at,
+                "duration": s.duration,
+                "total_marks": s.total_marks,
+                "part_titles": {},
+                "section_ids": [],
+                "question_types": set(),
+                "access": sorted(access[s.exam_id]),
+            }
+        # Reading parts fall back to the passage title, like /reading-tests
+        title = s.part_title or (passage_titles.get(s.section_id) if skill == "reading" else None)
+        if title:
+            card["part_titles"][s.order_number] = title
+        card["section_ids"].append(s.section_id)
+        types = set(s.question_type_tags or []) | group_types[s.section_id]
+        card["question_types"] |= types
+        for tier in card["access"]:
+            for question_type in types:
+                facet = facets[skill][tier][question_type]
+                facet["exams"].add(s.exam_id)
+                facet["sections"].append(s.section_id)
+
+    index = {"skills": {}}
+    for skill in SKILLS:
+        ordered = sorted(cards[skill].values(), key=lambda c: c["exam_id"], reverse=True)
+        for card in ordered:
+            card["question_types"] = sorted(card["question_types"])
+        index["skills"][skill] = {
+            "exams": ordered,
+            "facets": {
+                tier: {
+                    question_type: {"exams": sorted(facet["exams"]), "sections": facet["sections"]}
+                    for question_type, facet in by_type.items()
+                }
+                for tier, by_type in facets[skill].items()
+            },
+        }
+    return jsonable_encoder(index)
+
+
+# ── Reading ─────────────────────────────────────────────────────────────────
+
+_local: Optional[dict] = None
+_local_expires = 0.0
+
+
+def _prepare(index: dict, generation: int) -> dict:
+    """Index as stored -> lookup form: cards by id, facet exam ids as sets."""
+    return {
+        "generation": generation,
+        "skills": {
+            skill: {
+                "order": [card["exam_id"] for card in data["exams"]],
+                "cards": {card["exam_id"]: card for card in data["exams"]},
+                "facets": {
+                    tier: {question_type: set(facet["exams"]) for question_type, facet in by_type.items()}
+                    for tier, by_type in data["facets"].items()
+                },
+                "sections": {
+                    tier: {question_type: set(facet["sections"]) for question_type, facet in by_type.items()}
+                    for tier, by_type in data["facets"].items()
+                },
+            }
+            for skill, data in index["skills"].items()
+        },
+    }
+
+
+async def _generation() -> Optional[int]:
+    if not cache.redis_client:
+        return None
+    try:
+        return int(await cache.redis_client.get(GENERATION_KEY) or 0)
+    except Exception as e:
+        logger.error(f"Catalog generation read failed: {e}")
+        return None
+
+
+async def get_catalog(db) -> dict:
+    """The prepared index, from this process, then Redis, then the database."""
+    global _local, _local_expires
+    generation = await _generation()
+    if _local is not None:
+        if generation is not None and _local["generation"] == generation and time.time() < _local_expires:
+            return _local
+        if generation is None and time.time() < _local_expires:
+            return _local
+
+    if generation is not None:
+        stored = await cache.get(INDEX_KEY)
+        if stored and stored.get("generation") == generation:
+            _local, _local_expires = _prepare(stored["index"], generation), time.time() + CATALOG_TTL
+            return _local
+
+    index = build_index(db)
+    if generation is not None:
+        await cache.set(INDEX_KEY, {"generation": generation, "index": index}, CATALOG_TTL)
+        _local_expires = time.time() + CATALOG_TTL
+    else:
+        _local_expires = time.time() + CATALOG_LOCAL_TTL
+    _local = _prepare(index, generation if generation is not None else -1)
+    return _local
+
+
+def filter_catalog(catalog: dict, skill: str, access_types: Iterable[str],
+                   types: List[str], match: str = "any") -> dict:
+    """Exam ids (newest first) the tiers can open that have any/all of `types`,
+    plus per question type counts over everything those tiers can open."""
+    data = catalog["skills"].get(skill)
+    if not data:
+        return {"exam_ids": [], "facet_counts": {}}
+    tiers = [tier for tier in access_types if tier in data["facets"]]
+
+    by_type = defaultdict(set)
+    for tier in tiers:
+        for question_type, exam_ids in data["facets"][tier].items():
+            by_type[question_type] |= exam_ids
+    accessible = {
+        exam_id for exam_id, card in data["cards"].items()
+        if any(tier in card["access"] for tier in access_types)
+    }
+
+    if types:
+        matches = [by_type.get(question_type, set()) for question_type in types]
+        selected = set.union(*matches) if match == "any" else set.intersection(*matches)
+    else:
+        selected = accessible
+    return {
+        "exam_ids": [exam_id for exam_id in data["order"] if exam_id in selected],
+        "facet_counts": {question_type: len(exam_ids) for question_type, exam_ids in sorted(by_type.items())},
+    }
+
+
+def catalog_cards(catalog: dict, skill: str, exam_ids: List[int], access_types: Iterable[str],
+                  types: List[str]) -> List[dict]:
+    """Test cards for `exam_ids`; with `types`, each names the sections
+    (parts) that have one of them."""
+    data = catalog["skills"][skill]
+    matching = set()
+    for tier in access_types:
+        for question_type in types:
+            matching |= data["sections"].get(tier, {}).get(question_type, set())
+    cards = []
+    for exam_id in exam_ids:
+        card = {key: value for key, value in data["cards"][exam_id].items() if key != "access"}
+        if types:
+            card["matching_section_ids"] = [sid for sid in card["section_ids"] if sid in matching]
+        cards.append(card)
+    return cards
+
+
+# ── Invalidation ────────────────────────────────────────────────────────────
+
+async def invalidate_catalog():
+    """Make every process rebuild the index on its next read."""
+    global _local
+    _local = None
+    if cache.redis_client:
+        try:
+            await cache.redis_client.incr(GENERATION_KEY)
+        except Exception as e:
+            logger.error(f"Catalog invalidation failed: {e}")
+
+
+def _invalidate_blocking():
+    if cache.sync_client:
+        try:
+            cache.sync_client.incr(GENERATION_KEY)
+        except Exception as e:
+            logger.error(f"Catalog invalidation failed: {e}")
+
+
+def mark_catalog_changed(db):
+    """Flag a change the session hook cannot see (bulk UPDATE/INSERT ... SELECT);
+    the catalog is invalidated when the session commits."""
+    db.info[DIRTY_INFO_KEY] = True
+
+
+@event.listens_for(Session, "after_flush")
+def _watch_flush(session, flush_context):
+    if session.info.get(DIRTY_INFO_KEY):
+        return
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, _WATCHED):
+            session.info[DIRTY_INFO_KEY] = True
+            return
+
+
+_invalidate_tasks = set()
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session):
+    global _local
+    if not session.info.pop(DIRTY_INFO_KEY, None):
+        return
+    _local = None
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _invalidate_blocking()  # worker thread: no loop to run the async client on
+        return
+    task = loop.create_task(invalidate_catalog())
+    _invalidate_tasks.add(task)
+    task.add_done_callback(_invalidate_tasks.discard)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_dirty(session):
+    session.info.pop(DIRTY_INFO_KEY, None)
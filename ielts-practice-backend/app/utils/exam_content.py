@@ -0,0 +1,22 @@
+"""Exam content versioning.
+
+Exam.content_version is bumped whenever an admin rewrites an exam's questions,
+answer key, titles or descriptions. Anything derived from exam content that
+outlives a request (result review snapshots, the exam metadata index,
+pre-encoded student payloads) records the version it was built from and treats
+a mismatch as stale, so admin edits never have to hunt down derived copies.
+"""
+from sqlalchemy import func
+
+from app.models.models import Exam
+from app.utils.exam_catalog import mark_catalog_changed
+
+
+def mark_exam_content_changed(db, exam_id: int):
+    """Bump the exam's content version. Does not commit — call before the
+    admin endpoint's own db.commit() so the bump lands with the edit."""
+    db.query(Exam).filter(Exam.exam_id == exam_id).update(
+        {Exam.content_version: func.coalesce(Exam.content_version, 1) + 1},
+        synchronize_session=False,
+    )
+    mark_catalog_changed(db)
@@ -0,0 +1,308 @@
+"""Deleting and cloning whole exams with set-based statements.
+
+Deleting an exam used to walk results, sections and questions and issue one
+DELETE per result and per question, all in the request's transaction, and it
+left listening_answers (and writing_answers) pointing at the exam, so a popular
+test could not be deleted at all, or took minutes while holding its locks.
+
+delete_exam runs DELETE_STEPS, children first. Each step deletes the rows
+matching a subquery on the exam (WHERE x IN (SELECT ... WHERE exam_id = :id))
+in batches of DELETE_BATCH primary keys, one short transaction per batch. The
+exam is deactivated before the first batch, so students stop seeing it while
+it is half deleted, and a failed or interrupted run can simply be started
+again: every step only matches what is left. Progress (step, rows deleted) is
+published under exam_delete:{exam_id} in Redis, or in this process without
+Redis, and read by the status endpoint. spawn_exam_delete runs the same
+coroutine as a background task.
+
+clone_exam copies an exam's content (sections, question groups, questions,
+options, passages, listening media, writing tasks, access types) with one
+INSERT ... SELECT per table inside one transaction. New ids are matched to old
+ones by copying rows in primary-key order and reading the new ids back in the
+same order; child rows are re-pointed with a CASE over that mapping. Results
+and answers are not copied. A subset of sections can be cloned, which is how
+forecast variants of a full test are built.
+
+Env:
+  EXAM_DELETE_BATCH   rows per delete transaction (default 2000)
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import case, delete, insert, literal, select, update
+
+from app.database import SessionLocal
+from app.models.models import (
+    Exam, ExamAccessType, ExamProgress, ExamResult, ExamResultSnapshot, ExamSection,
+    ListeningAnswer, ListeningMedia, Question, QuestionGroup, QuestionOption, ReadingPassage,
+    StudentAnswer, WritingAnswer, WritingTask,
+)
+from app.utils.datetime_utils import get_vietnam_time
+from app.utils.exam_catalog import invalidate_catalog
+from app.utils.redis_cache import cache
+
+logger = logging.getLogger(__name__)
+
+DELETE_BATCH = int(os.getenv("EXAM_DELETE_BATCH", "2000"))
+PROGRESS_TTL = 24 * 3600
+
+
+def _results(exam_id):
+    return select(ExamResult.result_id).where(ExamResult.exam_id == exam_id)
+
+
+def _sections(exam_id):
+    return select(ExamSection.section_id).where(ExamSection.exam_id == exam_id)
+
+
+def _questions(exam_id):
+    return select(Question.question_id).where(Question.section_id.in_(_sections(exam_id)))
+
+
+def _tasks(exam_id):
+    return select(WritingTask.task_id).where(WritingTask.test_id == exam_id)
+
+
+class DeleteStep(NamedTuple):
+    name: str
+    pk: object
+    condition: Callable  # exam_id -> WHERE clause
+
+
+# Children before parents, so every batch satisfies the foreign keys
+DELETE_STEPS = [
+    DeleteStep("exam_result_snapshots", ExamResultSnapshot.result_id,
+               lambda exam_id: ExamResultSnapshot.result_id.in_(_results(exam_id))),
+    DeleteStep("student_answers", StudentAnswer.answer_id,
+               lambda exam_id: StudentAnswer.result_id.in_(_results(exam_id))),
+    DeleteStep("student_answers_by_question", StudentAnswer.answer_id,
+               lambda exam_id: StudentAnswer.question_id.in_(_questions(exam_id))),
+    DeleteStep("listening_answers", ListeningAnswer.answer_id,
+               lambda exam_id: ListeningAnswer.exam_id == exam_id),
+    DeleteStep("listening_answers_by_result", ListeningAnswer.answer_id,
+               lambda exam_id: ListeningAnswer.result_id.in_(_results(exam_id))),
+    DeleteStep("listening_answers_by_question", ListeningAnswer.answer_id,
+               lambda exam_id: ListeningAnswer.question_id.in_(_questions(exam_id))),
+    DeleteStep("exam_results", ExamResult.result_id,
+               lambda exam_id: ExamResult.exam_id == exam_id),
+    DeleteStep("writing_answers", WritingAnswer.answer_id,
+               lambda exam_id: WritingAnswer.task_id.in_(_tasks(exam_id))),
+    DeleteStep("writing_tasks", WritingTask.task_id,
+               lambda exam_id: WritingTask.test_id == exam_id),
+    DeleteStep("question_options", QuestionOption.option_id,
+               lambda exam_id: QuestionOption.question_id.in_(_questions(exam_id))),
+    DeleteStep("questions", Question.question_id,
+               lambda exam_id: Question.section_id.in_(_sections(exam_id))),
+    DeleteStep("question_groups", QuestionGroup.group_id,
+               lambda exam_id: QuestionGroup.section_id.in_(_sections(exam_id))),
+    DeleteStep("listening_media", ListeningMedia.media_id,
+               lambda exam_id: ListeningMedia.section_id.in_(_sections(exam_id))),
+    DeleteStep("reading_passages", ReadingPassage.passage_id,
+               lambda exam_id: ReadingPassage.section_id.in_(_sections(exam_id))),
+    DeleteStep("exam_sections", ExamSection.section_id,
+               lambda exam_id: ExamSection.exam_id == exam_id),
+    DeleteStep("exam_access_types", ExamAccessType.exam_id,
+               lambda exam_id: ExamAccessType.exam_id == exam_id),
+    DeleteStep("exam_progress", ExamProgress.progress_id,
+               lambda exam_id: ExamProgress.exam_id == exam_id),
+    DeleteStep("exams", Exam.exam_id,
+               lambda exam_id: Exam.exam_id == exam_id),
+]
+
+
+# ── Progress ────────────────────────────────────────────────────────────────
+
+def _progress_key(exam_id: int) -> str:
+    return f"exam_delete:{exam_id}"
+
+
+_local_progress: Dict[int, dict] = {}
+
+
+async def _publish(exam_id: int, progress: dict):
+    _local_progress[exam_id] = progress
+    await cache.set(_progress_key(exam_id), progress, PROGRESS_TTL)
+
+
+async def get_delete_progress(exam_id: int) -> Optional[dict]:
+    return await cache.get(_progress_key(exam_id)) or _local_progress.get(exam_id)
+
+
+# ── Delete ──────────────────────────────────────────────────────────────────
+
+def _deactivate(exam_id: int):
+    db = SessionLocal()
+    try:
+        db.execute(update(Exam).where(Exam.exam_id == exam_id).values(is_active=False))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _delete_batch(step: DeleteStep, exam_id: int) -> int:
+    """Delete up to DELETE_BATCH rows of one step; returns how many."""
+    db = SessionLocal()
+    try:
+        ids = db.execute(select(step.pk).where(step.condition(exam_id)).limit(DELETE_BATCH)).scalars().all()
+        if ids:
+            db.execute(delete(step.pk.class_).where(step.pk.in_(ids)))
+            db.commit()
+        return len(ids)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def delete_exam(exam_id: int) -> dict:
+    """Delete the exam and everything that references it; returns the final progress."""
+    started = time.time()
+    progress = {
+        "exam_id": exam_id,
+        "status": "running",
+        "step": None,
+        "steps_done": 0,
+        "steps_total": len(DELETE_STEPS),
+        "deleted": {},
+        "started_at": get_vietnam_time().isoformat(),
+    }
+    await _publish(exam_id, progress)
+    try:
+        await asyncio.to_thread(_deactivate, exam_id)
+        await invalidate_catalog()
+        for step in DELETE_STEPS:
+            progress["step"] = step.name
+            while True:
+                count = await asyncio.to_thread(_delete_batch, step, exam_id)
+                if count:
+                    progress["deleted"][step.name] = progress["deleted"].get(step.name, 0) + count
+                    await _publish(exam_id, progress)
+                if count < DELETE_BATCH:
+                    break
+            progress["steps_done"] += 1
+        progress.update(status="done", step=None, seconds=round(time.time() - started, 1))
+        logger.info(f"EXAM DELETE - exam {exam_id} deleted in {progress['seconds']}s: {progress['deleted']}")
+    except Exception as e:
+        progress.update(status="failed", error=str(e))
+        logger.error(f"EXAM DELETE - exam {exam_id} failed at {progress['step']}: {e}")
+    await _publish(exam_id, progress)
+    return progress
+
+
+_delete_tasks = set()
+
+
+def spawn_exam_delete(exam_id: int):
+    task = asyncio.get_running_loop().create_task(delete_exam(exam_id))
+    _delete_tasks.add(task)
+    task.add_done_callback(_delete_tasks.discard)
+
+
+# ── Clone ───────────────────────────────────────────────────────────────────
+
+def _copy(db, model, pk, condition, columns, overrides, copied) -> Dict[int, int]:
+    """INSERT ... SELECT the rows matching `condition`, with `overrides`
+    replacing some columns; `copied` matches the new rows. Returns old pk -> new pk."""
+    old_ids = db.execute(select(pk).where(condition).order_by(pk)).scalars().all()
+    if not old_ids:
+        return {}
+    names = [column.key for column in columns]
+    values = [overrides.get(name, column) for name, column in zip(names, columns)]
+    high_water = db.execute(select(pk).order_by(pk.desc()).limit(1)).scalar() or 0
+    db.execute(insert(model).from_select(names, select(*values).where(pk.in_(old_ids)).order_by(pk)))
+    # Auto-increment ids of one INSERT ... SELECT follow its ORDER BY
+    new_ids = db.execute(select(pk).where(pk > high_water, copied).order_by(pk)).scalars().all()
+    if len(new_ids) != len(old_ids):
+        raise RuntimeError(f"clone of {model.name} copied {len(new_ids)} of {len(old_ids)} rows")
+    return dict(zip(old_ids, new_ids))
+
+
+def _remap(column, mapping: Dict[int, int]):
+    return case(mapping, value=column, else_=None) if mapping else literal(None)
+
+
+def _columns(model, *exclude):
+    return [column for column in model.__table__.columns if column.key not in exclude]
+
+
+def clone_exam(db, exam_id: int, title: str, created_by: int,
+               section_ids: Optional[List[int]] = None, is_active: bool = False) -> dict:
+    """Copy the exam's content into a new exam (only `section_ids` if given).
+    Does not commit."""
+    source = db.get(Exam, exam_id)
+    exam = Exam(
+        title=title,
+        description=source.description,
+        created_at=get_vietnam_time().replace(tzinfo=None),
+        created_by=created_by,
+        is_active=is_active,
+        content_version=1,
+    )
+    db.add(exam)
+    db.flush()
+    new_exam_id = exam.exam_id
+
+    section_filter = ExamSection.exam_id == exam_id
+    if section_ids:
+        section_filter = section_filter & ExamSection.section_id.in_(section_ids)
+    sections = _copy(db, ExamSection.__table__, ExamSection.section_id, section_filter,
+                     _columns(ExamSection, "section_id"), {"exam_id": literal(new_exam_id)},
+                     ExamSection.exam_id == new_exam_id)
+    old_sections, new_sections = list(sections), list(sections.values())
+
+    groups = _copy(db, QuestionGroup.__table__, QuestionGroup.group_id,
+                   QuestionGroup.section_id.in_(old_sections),
+                   _columns(QuestionGroup, "group_id"),
+                   {"section_id": _remap(QuestionGroup.section_id, sections)},
+                   QuestionGroup.section_id.in_(new_sections))
+    questions = _copy(db, Question.__table__, Question.question_id,
+                      Question.section_id.in_(old_sections),
+                      _columns(Question, "question_id"),
+                      {"section_id": _remap(Question.section_id, sections),
+                       "group_id": _remap(Question.group_id, groups)},
+                      Question.section_id.in_(new_sections))
+    options = _copy(db, QuestionOption.__table__, QuestionOption.option_id,
+                    QuestionOption.question_id.in_(list(questions)),
+                    _columns(QuestionOption, "option_id"),
+                    {"question_id": _remap(QuestionOption.question_id, questions)},
+                    QuestionOption.question_id.in_(list(questions.values())))
+    passages = _copy(db, ReadingPassage.__table__, ReadingPassage.passage_id,
+                     ReadingPassage.section_id.in_(old_sections),
+                     _columns(ReadingPassage, "passage_id"),
+                     {"section_id": _remap(ReadingPassage.section_id, sections)},
+                     ReadingPassage.section_id.in_(new_sections))
+    # The audio blob is copied inside MySQL, never through the app
+    media = _copy(db, ListeningMedia.__table__, ListeningMedia.media_id,
+                  ListeningMedia.section_id.in_(old_sections),
+                  _columns(ListeningMedia, "media_id"),
+                  {"section_id": _remap(ListeningMedia.section_id, sections)},
+                  ListeningMedia.section_id.in_(new_sections))
+
+    tasks = {}
+    if not section_ids:
+        tasks = _copy(db, WritingTask.__table__, WritingTask.task_id, WritingTask.test_id == exam_id,
+                      _columns(WritingTask, "task_id"), {"test_id": literal(new_exam_id)},
+                      WritingTask.test_id == new_exam_id)
+    db.execute(insert(ExamAccessType).from_select(
+        ["exam_id", "access_type"],
+        select(literal(new_exam_id), ExamAccessType.access_type).where(ExamAccessType.exam_id == exam_id),
+    ))
+
+    return {
+        "exam_id": new_exam_id,
+        "source_exam_id": exam_id,
+        "title": title,
+        "copied": {
+            "sections": len(sections),
+            "question_groups": len(groups),
+            "questions": len(questions),
+            "question_options": len(options),
+            "reading_passages": len(passages),
+            "listening_media": len(media),
+            "writing_tasks": len(tasks),
+        },
+    }
@@ -0,0 +1,87 @@
+"""Exam metadata index for list pages (exam history, ...).
+
+Rendering one history row needs the exam's skill (type of its first section)
+and, for forecast attempts, how many real questions the attempted part has.
+Those used to be two or three queries per row. They only change when an admin
+rewrites the exam, which bumps Exam.content_version (app/utils/exam_content),
+so we keep them in a small per-process dict backed by Redis, each entry tagged
+with the version it was built from. Callers pass the versions they already
+joined in, so a warm page costs no extra queries and an edited exam is simply
+rebuilt on its next use.
+"""
+import logging
+from typing import Dict, Optional
+
+from sqlalchemy import func
+
+from app.models.models import ExamSection, Question
+from app.utils.redis_cache import cache, get_exam_metadata_cache_key
+
+logger = logging.getLogger(__name__)
+
+EXAM_METADATA_TTL = 24 * 3600
+DEFAULT_PART_QUESTIONS = 40
+
+# exam_id -> {"version", "exam_type", "part_questions": {"<order_number>": count}}
+_local_index: Dict[int, dict] = {}
+
+
+def _load_from_db(db, exam_versions: Dict[int, int]) -> Dict[int, dict]:
+    """Build entries for several exams with two queries in total."""
+    exam_ids = list(exam_versions)
+    sections = db.query(
+        ExamSection.exam_id, ExamSection.section_id, ExamSection.section_type, ExamSection.order_number
+    ).filter(ExamSection.exam_id.in_(exam_ids)).order_by(ExamSection.section_id).all()
+    counts = dict(db.query(Question.section_id, func.count(Question.question_id)).filter(
+        Question.section_id.in_([s.section_id for s in sections]),
+        Question.question_type != 'main_text'
+    ).group_by(Question.section_id).all()) if sections else {}
+
+    entries = {
+        exam_id: {"version": version, "exam_type": None, "part_questions": {}}
+        for exam_id, version in exam_versions.items()
+    }
+    for section in sections:
+        entry = entries[section.exam_id]
+        if entry["exam_type"] is None:
+            entry["exam_type"] = section.section_type
+        # JSON keys are strings; first section wins for a duplicated order_number
+        entry["part_questions"].setdefault(str(section.order_number), counts.get(section.section_id, 0))
+    for entry in entries.values():
+        entry["exam_type"] = entry["exam_type"] or "reading"  # Default to reading
+    return entries
+
+
+async def get_exam_metadata(db, exam_versions: Dict[int, int]) -> Dict[int, dict]:
+    """Metadata for each exam in {exam_id: content_version}, from the local
+    index, then Redis, then the database."""
+    result = {}
+    missing = {}
+    for exam_id, version in exam_versions.items():
+        version = version or 1
+        entry = _local_index.get(exam_id)
+        if entry and entry["version"] == version:
+            result[exam_id] = entry
+        else:
+            missing[exam_id] = version
+    if not missing:
+        return result
+
+    keys = [get_exam_metadata_cache_key(exam_id) for exam_id in missing]
+    for exam_id, entry in zip(list(missing), await cache.get_many(keys)):
+        if entry and entry.get("version") == missing[exam_id]:
+            _local_index[exam_id] = result[exam_id] = entry
+            del missing[exam_id]
+    if not missing:
+        return result
+
+    for exam_id, entry in _load_from_db(db, missing).items():
+        _local_index[exam_id] = result[exam_id] = entry
+        await cache.set(get_exam_metadata_cache_key(exam_id), entry, EXAM_METADATA_TTL)
+    return result
+
+
+def part_question_count(entry: dict, part: Optional[int]) -> int:
+    """Real questions in one part, falling back to a full test's 40."""
+    count = entry["part_questions"].get(str(part), 0) if part else 0
+    return count if count > 0 else DEFAULT_PART_QUESTIONS
@@ -0,0 +1,202 @@
+"""Pre-encoded student exam payloads.
+
+The exam payloads (reading test, exam start tree, writing task) are the largest
+responses we serve and nearly all of their bytes only change when an admin
+edits the exam. They used to be rebuilt per request with one query per
+question for options, then encoded again by FastAPI (and once more by the
+Redis cache layer). Instead each payload is built once per Exam.content_version
+from a fixed number of queries, encoded to compact JSON bytes (orjson when
+installed), gzipped once, and kept in a per-worker LRU. Requests then return
+the stored bytes as a raw Response with an ETag, so a revalidating client gets
+a 304 without a body.
+
+Admin edits bump the content version (app/utils/exam_content), which makes the
+old entry unreachable; it ages out of the LRU. Entries are also rebuilt after
+EXAM_PAYLOAD_MAX_AGE seconds, which bounds staleness for an edit path that
+does not bump the version (as the Redis TTL used to). Per-user fields (start time,
+the student's previous answer) are appended to the shared bytes with
+with_fields() rather than rebuilding the payload.
+
+Env:
+  EXAM_PAYLOAD_CACHE_MB   per-worker store size (default 64)
+  EXAM_PAYLOAD_MAX_AGE    seconds before an entry is rebuilt (default 7200)
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+from sqlalchemy.orm import defer, selectinload
+
+from app.models.models import ExamSection, ListeningMedia, Question, QuestionGroup, ReadingPassage
+
+try:
+    import orjson
+except ImportError:  # optional speed-up, same output shape as json.dumps below
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+EXAM_PAYLOAD_CACHE_BYTES = int(os.getenv("EXAM_PAYLOAD_CACHE_MB", "64")) * 1024 * 1024
+EXAM_PAYLOAD_MAX_AGE = int(os.getenv("EXAM_PAYLOAD_MAX_AGE", "7200"))
+
+
+class EncodedPayload(NamedTuple):
+    body: bytes
+    gzip_body: bytes
+    etag: str
+
+
+_store: "OrderedDict[Tuple, Tuple[EncodedPayload, float]]" = OrderedDict()  # -> (payload, built at)
+_store_bytes = 0
+_store_lock = threading.Lock()
+
+
+def dumps(data) -> bytes:
+    """Compact JSON bytes, encoded the way FastAPI would encode `data`."""
+    if orjson is not None:
+        return orjson.dumps(data, default=lambda value: jsonable_encoder(value))
+    return json.dumps(jsonable_encoder(data), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def encode_payload(data) -> EncodedPayload:
+    body = dumps(data)
+    return EncodedPayload(
+        body=body,
+        gzip_body=gzip.compress(body, compresslevel=6, mtime=0),
+        etag='"' + hashlib.sha1(body).hexdigest()[:20] + '"',
+    )
+
+
+def get_or_build(kind: str, key: int, version: int, build: Callable[[], dict]) -> EncodedPayload:
+    """Stored payload for (kind, key) at `version`, building it on a miss."""
+    global _store_bytes
+    store_key = (kind, key, version or 1)
+    with _store_lock:
+        entry = _store.get(store_key)
+        if entry is not None:
+            if time.monotonic() - entry[1] < EXAM_PAYLOAD_MAX_AGE:
+                _store.move_to_end(store_key)
+                return entry[0]
+            del _store[store_key]
+            _store_bytes -= len(entry[0].body) + len(entry[0].gzip_body)
+
+    payload = encode_payload(build())
+    size = len(payload.body) + len(payload.gzip_body)
+    with _store_lock:
+        if store_key not in _store:
+            _store[store_key] = (payload, time.monotonic())
+            _store_bytes += size
+            while _store_bytes > EXAM_PAYLOAD_CACHE_BYTES and len(_store) > 1:
+                _, (evicted, _built_at) = _store.popitem(last=False)
+                _store_bytes -= len(evicted.body) + len(evicted.gzip_body)
+    logger.info(f"Built {kind} payload {key} v{version} ({len(payload.body)} bytes, {len(payload.gzip_body)} gzipped)")
+    return payload
+
+
+def with_fields(body: bytes, fields: Dict) -> bytes:
+    """Append per-request keys to an encoded JSON object without re-encoding it."""
+    extra = dumps(fields)
+    if extra == b"{}":
+        return body
+    return body[:-1] + b"," + extra[1:]
+
+
+def _not_modified(request, *etags: str) -> bool:
+    """If-None-Match names one of `etags` (weak comparison, as RFC 9110 asks)."""
+    if_none_match = request.headers.get("if-none-match", "")
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return any(etag in tags for etag in etags)
+
+
+def payload_response(request, payload: EncodedPayload) -> Response:
+    """Serve a stored payload: 304 on a matching ETag, gzip bytes when accepted.
+    The gzip bytes carry their own tag (suffix -gz): a strong ETag names one
+    exact byte sequence."""
+    gzip_etag = payload.etag[:-1] + '-gz"'
+    gzipped = "gzip" in request.headers.get("accept-encoding", "").lower()
+    headers = {"ETag": gzip_etag if gzipped else payload.etag, "Vary": "Accept-Encoding", "Cache-Control": "private, no-cache"}
+    if _not_modified(request, payload.etag, gzip_etag):
+        return Response(status_code=304, headers=headers)
+    if gzipped:
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=payload.gzip_body, media_type="application/json", headers=headers)
+    return Response(content=payload.body, media_type="application/json", headers=headers)
+
+
+def json_bytes_response(request, body: bytes, etag: Optional[str] = None) -> Response:
+    """Serve already-encoded JSON (e.g. a payload with per-user fields appended)."""
+    headers = {}
+    if etag:
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if _not_modified(request, etag):
+            return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+class ExamTree(NamedTuple):
+    sections: List[ExamSection]  # ordered by order_number
+    questions: Dict[int, List[Question]]  # section_id -> questions by question_id, .options loaded
+    passages: Dict[int, List[ReadingPassage]]  # section_id -> passages
+    media: Dict[int, ListeningMedia]  # section_id -> first media row, audio blob deferred
+    groups: Dict[int, List[QuestionGroup]]  # section_id -> groups by order_number (with_groups only)
+
+
+def sorted_options(question: Question) -> List:
+    return sorted(question.options, key=lambda option: option.option_id)
+
+
+def group_questions(tree: ExamTree, section_id: int, group_id: int) -> List[Question]:
+    """A group's questions by question_number (unnumbered first, as MySQL sorts NULLs)."""
+    return sorted(
+        (question for question in tree.questions.get(section_id, []) if question.group_id == group_id),
+        key=lambda question: (question.question_number is not None, question.question_number or 0),
+    )
+
+
+def load_exam_tree(db, exam_id: int, section_type: Optional[str] = None,
+                   order_number: Optional[int] = None, with_groups: bool = False) -> ExamTree:
+    """Sections, questions, options, passages and media of one exam in at most
+    five queries (six with_groups), whatever the number of questions. Every
+    endpoint that renders exam content, student or admin, loads it here."""
+    query = db.query(ExamSection).options(
+        selectinload(ExamSection.questions).selectinload(Question.options)
+    ).filter(ExamSection.exam_id == exam_id)
+    if section_type:
+        query = query.filter(ExamSection.section_type == section_type)
+    if order_number is not None:
+        query = query.filter(ExamSection.order_number == order_number)
+    sections = query.order_by(ExamSection.order_number).all()
+    section_ids = [section.section_id for section in sections]
+
+    passages: Dict[int, List[ReadingPassage]] = {}
+    media: Dict[int, ListeningMedia] = {}
+    groups: Dict[int, List[QuestionGroup]] = {}
+    if any(section.section_type == 'reading' for section in sections):
+        for passage in db.query(ReadingPassage).filter(
+            ReadingPassage.section_id.in_(section_ids)
+        ).order_by(ReadingPassage.passage_id).all():
+            passages.setdefault(passage.section_id, []).append(passage)
+    if any(section.section_type == 'listening' for section in sections):
+        for item in db.query(ListeningMedia).options(defer(ListeningMedia.audio_file)).filter(
+            ListeningMedia.section_id.in_(section_ids)
+        ).order_by(ListeningMedia.media_id).all():
+            media.setdefault(item.section_id, item)
+    if with_groups and section_ids:
+        for group in db.query(QuestionGroup).filter(
+            QuestionGroup.section_id.in_(section_ids)
+        ).order_by(QuestionGroup.order_number, QuestionGroup.group_id).all():
+            groups.setdefault(group.section_id, []).append(group)
+
+    questions = {
+        section.section_id: sorted(section.questions, key=lambda question: question.question_id)
+        for section in sections
+    }
+    return ExamTree(sections, questions, passages, media, groups)
@@ -0,0 +1,34 @@
+"""A student's attempts at one forecast part.
+
+The listening and reading forecast-history endpoints both list them. The part
+scores are stored on ExamResult at submit (forecast_score_earned/_total), so
+the list is a single read on ix_exam_results_user_exam_forecast.
+"""
+from typing import List
+
+from app.models.models import ExamResult
+
+
+def get_forecast_attempts(db, user_id: int, exam_id: int, part_number: int) -> List[dict]:
+    """A student's attempts at one forecast part, newest first, with the part
+    scores stored at submit."""
+    rows = db.query(
+        ExamResult.result_id,
+        ExamResult.completion_date,
+        ExamResult.attempt_number,
+        ExamResult.forecast_score_earned,
+        ExamResult.forecast_score_total,
+    ).filter(
+        ExamResult.user_id == user_id,
+        ExamResult.exam_id == exam_id,
+        ExamResult.is_forecast == True,
+        ExamResult.forecast_part == part_number
+    ).order_by(ExamResult.completion_date.desc()).all()
+
+    return [{
+        'result_id': row.result_id,
+        'completion_date': row.completion_date,
+        'attempt_number': row.attempt_number,
+        'score_earned': float(row.forecast_score_earned or 0),
+        'score_total': int(row.forecast_score_total or 0)
+    } for row in rows]
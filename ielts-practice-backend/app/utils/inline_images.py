@@ -0,0 +1,165 @@
+"""Inline image extraction for rich-text content.
+
+The admin editors paste images straight into the HTML as
+`<img src="data:image/png;base64,...">`, so writing task instructions,
+announcements, questions and passages carry hundreds of KB of base64 each.
+That weight lands in every payload, every cached copy and in the writing
+"thumbnails" (which were the first <img> src of the instructions, i.e. often
+the full base64 image).
+
+Before an admin edit is committed, externalize_inline_images(db) moves every
+embedded image in the pending rows into a content-addressed store under
+static/content_images/ (file name = sha256 of the bytes, so re-saving the same
+image costs nothing) and rewrites the src to its /static URL. Writing tasks
+also get a small WebP thumbnail of their first image, stored on
+WritingTask.thumbnail_url so list pages never scan the instructions again.
+
+Existing rows are converted with:
+  python -m scripts.extract_inline_images
+
+Thumbnails need Pillow; without it the thumbnail is the extracted image itself.
+"""
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import os
+import re
+from typing import List, Optional, Tuple
+
+from app.models.models import Announcement, Question, ReadingPassage, WritingTask
+
+logger = logging.getLogger(__name__)
+
+CONTENT_IMAGES_DIR = "static/content_images"
+CONTENT_IMAGES_URL = "/static/content_images"
+THUMBNAIL_WIDTH = 320
+
+# HTML columns that may embed images, per model
+HTML_FIELDS = {
+    WritingTask: ("instructions", "sample_essay"),
+    Announcement: ("content",),
+    Question: ("question_text", "explanation", "locate"),
+    ReadingPassage: ("content",),
+}
+
+_DATA_URI_SRC = re.compile(
+    r'''(<img\b[^>]*?\bsrc\s*=\s*)(["'])data:image/([a-zA-Z0-9.+-]+);base64,([^"']*)\2''',
+    re.IGNORECASE,
+)
+_FIRST_IMG_SRC = re.compile(r'''<img[^>]+src=["']([^"']+)["']''', re.IGNORECASE)
+# Raster types only: the extension sets the Content-Type /static serves, and an
+# SVG (or anything else) from our origin could carry script
+_EXTENSIONS = {"png": "png", "jpeg": "jpg", "jpg": "jpg", "gif": "gif", "webp": "webp"}
+
+
+def _write_once(path: str, data: bytes):
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)  # atomic: readers never see a half-written file
+
+
+def store_image(data: bytes, subtype: str) -> str:
+    """Save image bytes under their content hash; returns the /static URL.
+    Raises ValueError for a subtype outside _EXTENSIONS."""
+    ext = _EXTENSIONS.get(subtype.lower())
+    if ext is None:
+        raise ValueError(f"Unsupported inline image type: image/{subtype}")
+    digest = hashlib.sha256(data).hexdigest()
+    relative = f"{digest[:2]}/{digest}.{ext}"
+    _write_once(os.path.join(CONTENT_IMAGES_DIR, relative), data)
+    return f"{CONTENT_IMAGES_URL}/{relative}"
+
+
+def extract_inline_images(html: Optional[str]) -> Tuple[Optional[str], List[str]]:
+    """Replace every base64 <img> src in `html` with a stored URL.
+    Returns (new_html, stored_urls); html without data URIs is returned as is,
+    and data URIs of other than PNG/JPEG/GIF/WebP images are left in place."""
+    if not html or "data:image/" not in html:
+        return html, []
+    urls = []
+
+    def _replace(match):
+        prefix, quote, subtype, encoded = match.groups()
+        try:
+            data = base64.b64decode(re.sub(r"\s+", "", encoded), validate=True)
+        except (binascii.Error, ValueError):
+            data = b""
+        if not data or subtype.lower() not in _EXTENSIONS:
+            return match.group(0)  # leave malformed and non-raster data URIs alone
+        url = store_image(data, subtype)
+        urls.append(url)
+        return f"{prefix}{quote}{url}{quote}"
+
+    return _DATA_URI_SRC.sub(_replace, html), urls
+
+
+def make_thumbnail(image_url: str) -> str:
+    """WebP thumbnail for an image in the content store; falls back to the image
+    itself when it is not local, not readable by Pillow or Pillow is missing."""
+    if not image_url.startswith(CONTENT_IMAGES_URL + "/"):
+        return image_url
+    source = os.path.join(CONTENT_IMAGES_DIR, image_url[len(CONTENT_IMAGES_URL) + 1:])
+    digest = os.path.splitext(os.path.basename(source))[0]
+    relative = f"thumbs/{digest}_w{THUMBNAIL_WIDTH}.webp"
+    target = os.path.join(CONTENT_IMAGES_DIR, relative)
+    if os.path.exists(target):
+        return f"{CONTENT_IMAGES_URL}/{relative}"
+    try:
+        from PIL import Image  # imported lazily; optional dependency
+
+        with Image.open(source) as image:
+            image.thumbnail((THUMBNAIL_WIDTH, THUMBNAIL_WIDTH * 4))
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA")
+            buffer = io.BytesIO()
+            image.save(buffer, "WEBP", quality=75, method=4)
+        _write_once(target, buffer.getvalue())
+        return f"{CONTENT_IMAGES_URL}/{relative}"
+    except ImportError:
+        return image_url
+    except Exception as e:
+        logger.warning(f"Thumbnail generation failed for {image_url}: {e}")
+        return image_url
+
+
+def thumbnail_for_html(html: Optional[str]) -> Optional[str]:
+    """Thumbnail URL for the first image in already-extracted HTML."""
+    match = _FIRST_IMG_SRC.search(html or "")
+    if not match or match.group(1).startswith("data:"):
+        return None
+    return make_thumbnail(match.group(1))
+
+
+def externalize_row(row) -> bool:
+    """Extract images from one row's HTML fields (and refresh a writing task's
+    thumbnail). Returns True if anything changed."""
+    changed = False
+    for field in HTML_FIELDS.get(type(row), ()):
+        html, urls = extract_inline_images(getattr(row, field))
+        if urls:
+            setattr(row, field, html)
+            changed = True
+    if isinstance(row, WritingTask):
+        thumbnail_url = thumbnail_for_html(row.instructions)
+        if thumbnail_url != row.thumbnail_url:
+            row.thumbnail_url = thumbnail_url
+            changed = True
+    return changed
+
+
+def externalize_inline_images(db):
+    """Run externalize_row over every content row in the session (new or
+    loaded, flushed or not). Call before the admin endpoint's db.commit()."""
+    for row in list(db.new) + list(db.identity_map.values()):
+        if type(row) in HTML_FIELDS and row not in db.deleted:
+            try:
+                externalize_row(row)
+            except OSError as e:
+                # Disk trouble must not lose the admin's edit; the backfill retries it
+                logger.error(f"Could not externalize images for {type(row).__name__}: {e}")
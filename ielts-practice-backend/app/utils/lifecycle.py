@@ -0,0 +1,146 @@
+"""Time-based account and session state, swept in bulk by the scheduler.
+
+These transitions used to happen lazily inside request handling: the student
+auth dependency converted expired center-course students to customers and
+committed, every login deleted expired cooldowns, and nothing ever cleared
+is_vip, retired dead sessions or stale exam progress. Now the scheduler leader
+(app/utils/scheduler.py) runs one set-based sweep per transition, in batches
+of SWEEP_BATCH rows so no statement holds locks on a large range for long:
+
+  vip_expiry        is_vip -> False once vip_expiry has passed
+  student_courses   role student -> customer STUDENT_COURSE_DAYS after
+                    activation (account_activated_at, else created_at)
+  login_cooldowns   delete expired cooldowns
+  user_sessions     deactivate sessions idle for SESSION_IDLE_HOURS, delete
+                    inactive ones older than SESSION_RETENTION_DAYS
+  exam_progress     mark heartbeats older than PROGRESS_STALE_MINUTES inactive
+
+Request paths only read: student_course_expired() lets the auth dependency
+treat a student as a customer between sweeps without writing.
+
+Env:
+  SESSION_RETENTION_DAYS  how long logged-out session rows are kept (default 90)
+"""
+import logging
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, func, select, update
+
+from app.models.models import ExamProgress, LoginCooldown, User, UserSession
+from app.utils.datetime_utils import get_vietnam_time
+from app.utils.scheduler import register_job
+
+logger = logging.getLogger(__name__)
+
+STUDENT_COURSE_DAYS = 90
+SESSION_IDLE_HOURS = 24
+SESSION_RETENTION_DAYS = int(os.getenv("SESSION_RETENTION_DAYS", "90"))
+PROGRESS_STALE_MINUTES = 60
+SWEEP_BATCH = 1000
+
+
+def _now() -> datetime:
+    return get_vietnam_time().replace(tzinfo=None)
+
+
+def student_course_expired(user: User, now: datetime) -> bool:
+    """Whether a student's course window is over. It is anchored on
+    account_activated_at, else created_at: students activated by an admin
+    toggling is_active_student never get account_activated_at."""
+    course_start = user.account_activated_at or user.created_at
+    return course_start is not None and now > course_start + timedelta(days=STUDENT_COURSE_DAYS)
+
+
+def _in_batches(db, pk, condition, apply) -> int:
+    """Run apply(ids) on SWEEP_BATCH primary keys matching condition at a
+    time, committing each batch. Returns the number of rows handled."""
+    total = 0
+    while True:
+        ids = db.execute(select(pk).where(condition).limit(SWEEP_BATCH)).scalars().all()
+        if not ids:
+            return total
+        apply(ids)
+        db.commit()
+        total += len(ids)
+        if len(ids) < SWEEP_BATCH:
+            return total
+
+
+def expire_vip(db) -> int:
+    now = _now()
+    count = _in_batches(
+        db, User.user_id,
+        and_(User.is_vip == True, User.vip_expiry != None, User.vip_expiry <= now),
+        lambda ids: db.execute(update(User).where(User.user_id.in_(ids)).values(is_vip=False)),
+    )
+    if count:
+        logger.info(f"LIFECYCLE - {count} VIP memberships expired")
+    return count
+
+
+def expire_student_courses(db) -> int:
+    cutoff = _now() - timedelta(days=STUDENT_COURSE_DAYS)
+    count = _in_batches(
+        db, User.user_id,
+        and_(User.role == 'student', func.coalesce(User.account_activated_at, User.created_at) < cutoff),
+        # Expired students continue as (active) customers with VIP restrictions
+        lambda ids: db.execute(
+            update(User).where(User.user_id.in_(ids)).values(role='customer', is_active=True)
+        ),
+    )
+    if count:
+        logger.info(f"LIFECYCLE - {count} students converted to customers")
+    return count
+
+
+def prune_login_cooldowns(db) -> int:
+    now = _now()
+    count = _in_batches(
+        db, LoginCooldown.cooldown_id, LoginCooldown.cooldown_end <= now,
+        lambda ids: db.execute(delete(LoginCooldown).where(LoginCooldown.cooldown_id.in_(ids))),
+    )
+    if count:
+        logger.info(f"LIFECYCLE - {count} expired login cooldowns removed")
+    return count
+
+
+def prune_sessions(db) -> int:
+    now = _now()
+    expired = _in_batches(
+        db, UserSession.session_id,
+        and_(UserSession.is_active == True, UserSession.last_activity < now - timedelta(hours=SESSION_IDLE_HOURS)),
+        lambda ids: db.execute(
+            update(UserSession).where(UserSession.session_id.in_(ids)).values(is_active=False, logout_time=now)
+        ),
+    )
+    removed = _in_batches(
+        db, UserSession.session_id,
+        and_(UserSession.is_active == False, UserSession.login_time < now - timedelta(days=SESSION_RETENTION_DAYS)),
+        lambda ids: db.execute(delete(UserSession).where(UserSession.session_id.in_(ids))),
+    )
+    if expired or removed:
+        logger.info(f"LIFECYCLE - {expired} idle sessions expired, {removed} old sessions removed")
+    return expired + removed
+
+
+def sweep_exam_progress(db) -> int:
+    cutoff = _now() - timedelta(minutes=PROGRESS_STALE_MINUTES)
+    count = _in_batches(
+        db, ExamProgress.progress_id,
+        and_(ExamProgress.is_active == True, ExamProgress.updated_at < cutoff),
+        lambda ids: db.execute(
+            update(ExamProgress).where(ExamProgress.progress_id.in_(ids)).values(is_active=False)
+        ),
+    )
+    if count:
+        logger.info(f"LIFECYCLE - {count} stale exam progress rows closed")
+    return count
+
+
+def register_lifecycle_jobs():
+    register_job("vip_expiry", 300, expire_vip)
+    register_job("student_courses", 600, expire_student_courses)
+    register_job("login_cooldowns", 300, prune_login_cooldowns)
+    register_job("user_sessions", 900, prune_sessions)
+    register_job("exam_progress", 600, sweep_exam_progress)
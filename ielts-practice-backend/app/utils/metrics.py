@@ -0,0 +1,239 @@
+"""Prometheus metrics, aggregated across the uvicorn worker processes.
+
+With PROMETHEUS_MULTIPROC_DIR set (the Dockerfile does), every worker writes
+its samples to mmap files in that directory and GET /internal/metrics merges
+all of them, so one scrape sees the whole container no matter which worker
+answers it. Without it (local dev) the endpoint shows the answering process.
+
+What is measured:
+  http_request_duration_seconds{method,route,status}  per route template
+  http_requests_in_progress{method}
+  db_pool_checkouts_total, db_pool_checked_out, db_pool_wait_seconds,
+  db_pool_timeouts_total                              (TimedQueuePool)
+  cache_operations_total{op,prefix,result}            RedisCache, per key prefix
+  groq_request_duration_seconds{operation,model,outcome},
+  groq_tokens_total{operation,model,kind}             (timed_groq_call)
+  audio_processing_seconds{tool,operation}            ffmpeg / mutagen
+
+prometheus_client is optional: without it every metric is a no-op and the
+endpoint returns 503.
+
+Env:
+  PROMETHEUS_MULTIPROC_DIR  shared directory for the workers' sample files;
+                            must be emptied before the workers start
+  METRICS_TOKEN             required: /internal/metrics answers 403 without it
+                            and needs "Authorization: Bearer <token>"
+"""
+import os
+import time
+from collections import Counter as _Tally
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:  # optional dependency
+    prometheus_client = None
+    multiprocess = None
+
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SLOW_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value):
+        pass
+
+
+def _counter(name, doc, labels=()):
+    if prometheus_client is None:
+        return _NoopMetric()
+    return prometheus_client.Counter(name, doc, labels)
+
+
+def _gauge(name, doc, labels=()):
+    if prometheus_client is None:
+        return _NoopMetric()
+    # livesum: add up the live workers' values, drop those of dead workers
+    return prometheus_client.Gauge(name, doc, labels, multiprocess_mode="livesum")
+
+
+def _histogram(name, doc, labels=(), buckets=LATENCY_BUCKETS):
+    if prometheus_client is None:
+        return _NoopMetric()
+    return prometheus_client.Histogram(name, doc, labels, buckets=buckets)
+
+
+REQUEST_LATENCY = _histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ("method", "route", "status"),
+)
+REQUESTS_IN_PROGRESS = _gauge("http_requests_in_progress", "HTTP requests being handled", ("method",))
+
+DB_POOL_CHECKOUTS = _counter("db_pool_checkouts_total", "Connections checked out of the SQLAlchemy pool")
+DB_POOL_CHECKED_OUT = _gauge("db_pool_checked_out", "Connections currently checked out")
+DB_POOL_WAIT = _histogram(
+    "db_pool_wait_seconds", "Time spent waiting for a pooled connection",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30),
+)
+DB_POOL_TIMEOUTS = _counter("db_pool_timeouts_total", "Checkouts that gave up after pool_timeout")
+
+CACHE_OPERATIONS = _counter(
+    "cache_operations_total", "RedisCache operations by key prefix and result",
+    ("op", "prefix", "result"),
+)
+
+GROQ_LATENCY = _histogram(
+    "groq_request_duration_seconds", "Groq chat completion latency",
+    ("operation", "model", "outcome"), buckets=SLOW_BUCKETS,
+)
+GROQ_TOKENS = _counter("groq_tokens_total", "Groq tokens used", ("operation", "model", "kind"))
+
+AUDIO_PROCESSING = _histogram(
+    "audio_processing_seconds", "ffmpeg / mutagen processing time",
+    ("tool", "operation"),
+)
+
+
+def route_label(scope) -> str:
+    """Route template ("/student/exam/{exam_id}/start") so ids don't explode the label set."""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency and in-flight requests."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or prometheus_client is None:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_progress.dec()
+            REQUEST_LATENCY.labels(method, route_label(scope), str(status)).observe(
+                time.perf_counter() - started
+            )
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that also reports how long checkouts wait for a connection
+    (there is no pool event for that; checkouts/checkins use the events below)."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            DB_POOL_TIMEOUTS.inc()
+            raise
+        DB_POOL_WAIT.observe(time.perf_counter() - started)
+        return connection
+
+
+@event.listens_for(TimedQueuePool, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    DB_POOL_CHECKOUTS.inc()
+    DB_POOL_CHECKED_OUT.inc()
+
+
+@event.listens_for(TimedQueuePool, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    DB_POOL_CHECKED_OUT.dec()
+
+
+def key_prefix(key: str) -> str:
+    """"exam_meta:12" -> "exam_meta" (the part before the first ':' or '*')."""
+    return key.split(":", 1)[0].split("*", 1)[0] or "other"
+
+
+def count_cache_op(op: str, key: str, result: str):
+    CACHE_OPERATIONS.labels(op, key_prefix(key), result).inc()
+
+
+def count_cache_reads(op: str, keys, values):
+    """Hit/miss tallies for a multi-key read, one increment per (prefix, result)."""
+    tally = _Tally((key_prefix(key), "miss" if value is None else "hit") for key, value in zip(keys, values))
+    for (prefix, result), times in tally.items():
+        CACHE_OPERATIONS.labels(op, prefix, result).inc(times)
+
+
+def timed_groq_call(operation: str, create, **kwargs):
+    """Run client.chat.completions.create(**kwargs) (passed as `create`),
+    recording its latency and token usage."""
+    model = kwargs.get("model", "unknown")
+    started = time.perf_counter()
+    try:
+        completion = create(**kwargs)
+    except Exception:
+        GROQ_LATENCY.labels(operation, model, "error").observe(time.perf_counter() - started)
+        raise
+    GROQ_LATENCY.labels(operation, model, "ok").observe(time.perf_counter() - started)
+    usage = getattr(completion, "usage", None)
+    if usage is not None:
+        GROQ_TOKENS.labels(operation, model, "prompt").inc(getattr(usage, "prompt_tokens", 0) or 0)
+        GROQ_TOKENS.labels(operation, model, "completion").inc(getattr(usage, "completion_tokens", 0) or 0)
+    return completion
+
+
+@contextmanager
+def time_audio(tool: str, operation: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        AUDIO_PROCESSING.labels(tool, operation).observe(time.perf_counter() - started)
+
+
+def render_metrics():
+    """(body, content_type) for the exposition, merged across workers when
+    running in multiprocess mode. None when prometheus_client is missing."""
+    if prometheus_client is None:
+        return None
+    if MULTIPROC_DIR:
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
+
+def mark_worker_dead():
+    """Drop this worker's live gauge files on shutdown (multiprocess mode)."""
+    if prometheus_client is not None and MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
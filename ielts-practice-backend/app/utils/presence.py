@@ -0,0 +1,230 @@
+"""Who is online, and how many users are active, kept in Redis.
+
+The student app toggles online/offline through PUT /student/status/update, and
+each call used to commit users.status and users.last_active, which are hot rows
+that every auth lookup also reads. The admin student list then worked out
+"online" by comparing last_active to a 15-minute threshold for every user.
+
+Presence now lives in Redis:
+  presence:online              ZSET user_id -> last seen (epoch seconds);
+                               online = seen within ONLINE_WINDOW
+  presence:last_active         HASH user_id -> last seen, not yet written to MySQL
+  presence:day:{YYYYMMDD}      bitmap, bit user_id set when active that day (DAU)
+  presence:minute:{...HHMM}    HyperLogLog of users active in that minute
+  presence:month:{YYYYMM}      HyperLogLog of users active that month (MAU)
+
+online_count() and online_users(page) are ZCOUNT/ZREVRANGEBYSCORE reads, and
+last_seen(ids) is one ZMSCORE. users.last_active is still maintained, but by
+flush_last_active, a scheduler job that writes all pending timestamps in
+batched UPDATEs once a minute. users.status is no longer written per toggle.
+
+Without Redis, touch()/mark_offline() return False and the caller falls back
+to writing the users row as before.
+
+Env:
+  PRESENCE_ONLINE_MINUTES   how recent "online" is (default 15)
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pytz
+from redis.exceptions import ResponseError
+from sqlalchemy import case, update
+
+from app.database import SessionLocal
+from app.models.models import User
+from app.utils.redis_cache import cache
+from app.utils.scheduler import register_job
+
+logger = logging.getLogger(__name__)
+
+ONLINE_WINDOW = int(os.getenv("PRESENCE_ONLINE_MINUTES", "15")) * 60
+ONLINE_KEY = "presence:online"
+LAST_ACTIVE_KEY = "presence:last_active"
+DAY_TTL = 40 * 86400
+MINUTE_TTL = 2 * 86400
+MONTH_TTL = 400 * 86400
+FLUSH_BATCH = 500
+
+VIETNAM_TZ = pytz.timezone('Asia/Ho_Chi_Minh')
+
+
+def _local(ts: float) -> datetime:
+    return datetime.fromtimestamp(ts, VIETNAM_TZ)
+
+
+def day_key(ts: float) -> str:
+    return f"presence:day:{_local(ts):%Y%m%d}"
+
+
+def minute_key(ts: float) -> str:
+    return f"presence:minute:{_local(ts):%Y%m%d%H%M}"
+
+
+def month_key(ts: float) -> str:
+    return f"presence:month:{_local(ts):%Y%m}"
+
+
+def to_db_time(ts: float) -> datetime:
+    """Epoch seconds -> naive Vietnam time, as stored in users.last_active."""
+    return _local(ts).replace(tzinfo=None)
+
+
+async def touch(user_id: int) -> bool:
+    """Record activity: online now, counted for this minute/day/month."""
+    if not cache.redis_client:
+        return False
+    now = time.time()
+    try:
+        async with cache.redis_client.pipeline(transaction=False) as pipe:
+            pipe.zadd(ONLINE_KEY, {user_id: now})
+            pipe.hset(LAST_ACTIVE_KEY, user_id, now)
+            pipe.setbit(day_key(now), user_id, 1)
+            pipe.expire(day_key(now), DAY_TTL)
+            pipe.pfadd(minute_key(now), user_id)
+            pipe.expire(minute_key(now), MINUTE_TTL)
+            pipe.pfadd(month_key(now), user_id)
+            pipe.expire(month_key(now), MONTH_TTL)
+            await pipe.execute()
+        return True
+    except Exception as e:
+        logger.error(f"Presence touch failed for user {user_id}: {e}")
+        return False
+
+
+async def mark_offline(user_id: int) -> bool:
+    if not cache.redis_client:
+        return False
+    try:
+        async with cache.redis_client.pipeline(transaction=False) as pipe:
+            pipe.zrem(ONLINE_KEY, user_id)
+            pipe.hset(LAST_ACTIVE_KEY, user_id, time.time())
+            await pipe.execute()
+        return True
+    except Exception as e:
+        logger.error(f"Presence offline failed for user {user_id}: {e}")
+        return False
+
+
+async def online_count() -> Optional[int]:
+    """Users seen within ONLINE_WINDOW, or None without Redis."""
+    if not cache.redis_client:
+        return None
+    try:
+        return await cache.redis_client.zcount(ONLINE_KEY, time.time() - ONLINE_WINDOW, "+inf")
+    except Exception as e:
+        logger.error(f"Presence count failed: {e}")
+        return None
+
+
+async def online_users(page: int = 1, page_size: int = 50) -> Optional[List[Tuple[int, float]]]:
+    """(user_id, last seen) of online users, most recent first, or None without Redis."""
+    if not cache.redis_client:
+        return None
+    try:
+        rows = await cache.redis_client.zrevrangebyscore(
+            ONLINE_KEY, "+inf", time.time() - ONLINE_WINDOW,
+            start=(page - 1) * page_size, num=page_size, withscores=True,
+        )
+        return [(int(member), score) for member, score in rows]
+    except Exception as e:
+        logger.error(f"Presence listing failed: {e}")
+        return None
+
+
+async def last_seen(user_ids: Iterable[int]) -> Optional[Dict[int, float]]:
+    """user_id -> last seen for the given users that are in the presence set."""
+    user_ids = list(user_ids)
+    if not cache.redis_client:
+        return None
+    if not user_ids:
+        return {}
+    try:
+        scores = await cache.redis_client.zmscore(ONLINE_KEY, user_ids)
+        return {user_id: score for user_id, score in zip(user_ids, scores) if score is not None}
+    except Exception as e:
+        logger.error(f"Presence lookup failed: {e}")
+        return None
+
+
+def is_online(seen: Optional[float]) -> bool:
+    return seen is not None and seen >= time.time() - ONLINE_WINDOW
+
+
+async def activity(minutes: int = 60, days: int = 30) -> Optional[dict]:
+    """Active users per minute (last `minutes`), per day (last `days`) and this month."""
+    if not cache.redis_client:
+        return None
+    now = time.time()
+    minute_stamps = [now - 60 * i for i in range(minutes - 1, -1, -1)]
+    day_stamps = [now - 86400 * i for i in range(days - 1, -1, -1)]
+    try:
+        async with cache.redis_client.pipeline(transaction=False) as pipe:
+            for ts in minute_stamps:
+                pipe.pfcount(minute_key(ts))
+            for ts in day_stamps:
+                pipe.bitcount(day_key(ts))
+            pipe.pfcount(month_key(now))
+            counts = await pipe.execute()
+    except Exception as e:
+        logger.error(f"Presence activity read failed: {e}")
+        return None
+    per_minute, per_day = counts[:minutes], counts[minutes:minutes + days]
+    return {
+        "per_minute": [{"minute": f"{_local(ts):%Y-%m-%d %H:%M}", "active": n} for ts, n in zip(minute_stamps, per_minute)],
+        "per_day": [{"date": f"{_local(ts):%Y-%m-%d}", "active": n} for ts, n in zip(day_stamps, per_day)],
+        "month_active": counts[-1],
+    }
+
+
+def _write_last_active(pending: Dict[int, float]):
+    db = SessionLocal()
+    try:
+        items = list(pending.items())
+        for start in range(0, len(items), FLUSH_BATCH):
+            batch = dict(items[start:start + FLUSH_BATCH])
+            db.execute(
+                update(User)
+                .where(User.user_id.in_(batch))
+                .values(last_active=case(
+                    {user_id: to_db_time(ts) for user_id, ts in batch.items()},
+                    value=User.user_id,
+                ))
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def flush_last_active():
+    """Scheduler job: write pending last-seen times to users.last_active and
+    drop expired members from the online set."""
+    if not cache.redis_client:
+        return
+    redis_client = cache.redis_client
+    await redis_client.zremrangebyscore(ONLINE_KEY, "-inf", time.time() - ONLINE_WINDOW)
+
+    # Take the pending hash atomically; touches after this start a new one
+    flushing_key = f"{LAST_ACTIVE_KEY}:flushing"
+    if not await redis_client.exists(flushing_key):  # else: a failed earlier flush, retry it
+        try:
+            await redis_client.rename(LAST_ACTIVE_KEY, flushing_key)
+        except ResponseError:
+            return  # no such key: nothing pending
+    pending = {int(user_id): float(ts) for user_id, ts in (await redis_client.hgetall(flushing_key)).items()}
+    if pending:
+        await asyncio.to_thread(_write_last_active, pending)
+        logger.info(f"PRESENCE - last_active written for {len(pending)} users")
+    await redis_client.delete(flushing_key)
+
+
+def register_presence_jobs():
+    register_job("presence_last_active", 60, flush_last_active)
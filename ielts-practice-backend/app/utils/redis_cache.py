@@ -1,16 +1,20 @@
 import json
 import os
-from typing import Any, Optional, Union
+from typing import Any, List, Optional, Union
 import redis.asyncio as redis
+from redis import Redis as SyncRedis
 from redis.asyncio import Redis
 import logging
 
+from app.utils.metrics import count_cache_op, count_cache_reads
+
 logger = logging.getLogger(__name__)
 
 class RedisCache:
     def __init__(self):
         self.redis_url = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
         self.redis_client: Optional[Redis] = None
+        self._sync_client: Optional[SyncRedis] = None
         self.default_ttl = 3600  # 1 hour default TTL
         
     async def connect(self):
@@ -32,8 +36,28 @@ class RedisCache:
             logger.error(f"Failed to connect to Redis: {e}")
             self.redis_client = None
             
+    @property
+    def sync_client(self) -> Optional[SyncRedis]:
+        """Blocking client for code running in worker threads (threadpool
+        endpoints, asyncio.to_thread), where no event loop drives redis_client.
+        None while Redis is not connected."""
+        if not self.redis_client:
+            return None
+        if self._sync_client is None:
+            self._sync_client = SyncRedis.from_url(
+                self.redis_url,
+                encoding="utf-8",
+                decode_responses=True,
+                socket_connect_timeout=5,
+                socket_timeout=5,
+            )
+        return self._sync_client
+
     async def disconnect(self):
         """Close Redis connection"""
+        if self._sync_client:
+            self._sync_client.close()
+            self._sync_client = None
         if self.redis_client:
             await self.redis_client.close()
             logger.info("Redis connection closed")
@@ -41,52 +65,81 @@ class RedisCache:
     async def get(self, key: str) -> Optional[Any]:
         """Get value from cache"""
         if not self.redis_client:
+            count_cache_op("get", key, "unavailable")
             return None
             
         try:
             value = await self.redis_client.get(key)
+            count_cache_op("get", key, "hit" if value else "miss")
             if value:
                 return json.loads(value)
             return None
         except Exception as e:
+            count_cache_op("get", key, "error")
             logger.error(f"Redis GET error for key {key}: {e}")
             return None
             
+    async def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        """Get several values in one round trip (None for misses)"""
+        if not self.redis_client or not keys:
+            for key in keys:
+                count_cache_op("get_many", key, "unavailable")
+            return [None] * len(keys)
+            
+        try:
+            values = await self.redis_client.mget(keys)
+            count_cache_reads("get_many", keys, values)
+            return [json.loads(value) if value else None for value in values]
+        except Exception as e:
+            for key in keys:
+                count_cache_op("get_many", key, "error")
+            logger.error(f"Redis MGET error for {len(keys)} keys: {e}")
+            return [None] * len(keys)
+            
     async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
         """Set value in cache with TTL"""
         if not self.redis_client:
+            count_cache_op("set", key, "unavailable")
             return False
             
         try:
             ttl = ttl or self.default_ttl
             serialized_value = json.dumps(value, default=str)
             await self.redis_client.setex(key, ttl, serialized_value)
+            count_cache_op("set", key, "ok")
             return True
         except Exception as e:
+            count_cache_op("set", key, "error")
             logger.error(f"Redis SET error for key {key}: {e}")
             return False
             
     async def delete(self, key: str) -> bool:
         """Delete key from cache"""
         if not self.redis_client:
+            count_cache_op("delete", key, "unavailable")
             return False
             
         try:
             result = await self.redis_client.delete(key)
+            count_cache_op("delete", key, "ok")
             return result > 0
         except Exception as e:
+            count_cache_op("delete", key, "error")
             logger.error(f"Redis DELETE error for key {key}: {e}")
             return False
             
     async def exists(self, key: str) -> bool:
         """Check if key exists in cache"""
         if not self.redis_client:
+            count_cache_op("exists", key, "unavailable")
             return False
             
         try:
             result = await self.redis_client.exists(key)
+            count_cache_op("exists", key, "hit" if result else "miss")
             return result > 0
         except Exception as e:
+            count_cache_op("exists", key, "error")
             logger.error(f"Redis EXISTS error for key {key}: {e}")
             return False
             
@@ -107,6 +160,7 @@ class RedisCache:
     async def increment(self, key: str, amount: int = 1, ttl: Optional[int] = None) -> Optional[int]:
         """Increment counter with optional TTL"""
         if not self.redis_client:
+            count_cache_op("increment", key, "unavailable")
             return None
             
         try:
@@ -115,8 +169,10 @@ class RedisCache:
             if ttl:
                 pipe.expire(key, ttl)
             results = await pipe.execute()
+            count_cache_op("increment", key, "ok")
             return results[0]
         except Exception as e:
+            count_cache_op("increment", key, "error")
             logger.error(f"Redis INCREMENT error for key {key}: {e}")
             return None
 
@@ -136,12 +192,24 @@ def get_listening_test_cache_key(test_id: int) -> str:
 def get_audio_metadata_cache_key(audio_id: int) -> str:
     return f"audio_metadata:{audio_id}"
     
+def get_exam_metadata_cache_key(exam_id: int) -> str:
+    return f"exam_meta:{exam_id}"
+    
+def get_email_domain_cache_key(domain: str) -> str:
+    return f"email_domain:{domain}"
+    
 def get_user_session_cache_key(user_id: int) -> str:
     return f"user_session:{user_id}"
     
 def get_exam_results_cache_key(user_id: int, exam_id: int) -> str:
     return f"exam_results:{user_id}:{exam_id}"
 
+def get_writing_draft_cache_key(user_id: int, task_id: int) -> str:
+    return f"writing_draft:{user_id}:{task_id}"
+
+def get_center_members_cache_key(center_id: int, member_type: str) -> str:
+    return f"center_members:{center_id}:{member_type}"
+
 # Cache decorators
 def cache_result(key_func, ttl: int = 3600):
     """Decorator to cache function results"""
@@ -12,6 +12,8 @@ Env:
   RESEND_API_KEY          re_...  (enables Resend for both paths)
   RESEND_FROM             transactional From, e.g. "Thi IELTS Trên Máy <noreply@thiieltstrenmay.com>"
   RESEND_MARKETING_FROM   marketing From,      e.g. "Thi IELTS Trên Máy <news@thiieltstrenmay.com>"
+  RESEND_API_BASE         API origin (default https://api.resend.com); point it at
+                          scripts/fake_resend_server.py for local load tests
 """
 import os
 import logging
@@ -19,7 +21,11 @@ import requests
 
 logger = logging.getLogger(__name__)
 
-RESEND_API_URL = "https://api.resend.com/emails"
+RESEND_API_BASE = os.getenv("RESEND_API_BASE", "https://api.resend.com").rstrip("/")
+RESEND_API_URL = f"{RESEND_API_BASE}/emails"
+# Batch endpoint: up to 100 independent messages per request, one rate-limit token.
+RESEND_BATCH_URL = f"{RESEND_API_BASE}/emails/batch"
+RESEND_BATCH_MAX = 100
 
 DEFAULT_FROM = "Thi IELTS Trên Máy <noreply@thiieltstrenmay.com>"
 DEFAULT_MARKETING_FROM = "Thi IELTS Trên Máy <news@thiieltstrenmay.com>"
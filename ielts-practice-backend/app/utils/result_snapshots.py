@@ -0,0 +1,52 @@
+"""Immutable exam-result review snapshots.
+
+A submitted ExamResult never changes, so the review page payload (every
+question, the student's answer, the key and explanation) is built once, stored
+zlib-compressed in exam_result_snapshots and served as raw bytes afterwards.
+Each snapshot records the Exam.content_version it was built from; when an admin
+edits the answer key the version moves on and the next view rebuilds it.
+"""
+import json
+import zlib
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+from app.models.models import ExamResultSnapshot
+from app.utils.datetime_utils import get_vietnam_time
+
+
+def encode_snapshot(data: dict) -> bytes:
+    """Compact JSON (same encoding FastAPI would apply), zlib-compressed."""
+    raw = json.dumps(jsonable_encoder(data), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return zlib.compress(raw, 6)
+
+
+def save_snapshot(db, result_id: int, content_version: int, payload: bytes):
+    """Upsert the snapshot (two first views can race). Does not commit."""
+    stmt = mysql_insert(ExamResultSnapshot).values(
+        result_id=result_id,
+        content_version=content_version,
+        payload=payload,
+        created_at=get_vietnam_time().replace(tzinfo=None),
+    )
+    stmt = stmt.on_duplicate_key_update(
+        content_version=stmt.inserted.content_version,
+        payload=stmt.inserted.payload,
+        created_at=stmt.inserted.created_at,
+    )
+    db.execute(stmt)
+
+
+def snapshot_response(payload: bytes, accept_encoding: str = "") -> Response:
+    """Serve a stored snapshot. zlib data is exactly HTTP `deflate`, so clients
+    that accept it get the stored bytes untouched."""
+    if "deflate" in (accept_encoding or "").lower():
+        return Response(
+            content=payload,
+            media_type="application/json",
+            headers={"Content-Encoding": "deflate", "Vary": "Accept-Encoding"},
+        )
+    return Response(content=zlib.decompress(payload), media_type="application/json",
+                    headers={"Vary": "Accept-Encoding"})
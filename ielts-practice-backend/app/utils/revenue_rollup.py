@@ -0,0 +1,132 @@
+"""Daily revenue rollup behind the admin revenue dashboards.
+
+The dashboards used to run a full aggregate scan over package_transactions for
+every figure (today / month / year / weekly / monthly / yearly / quarterly),
+with func.date / func.extract on created_at so no index could help. Instead we
+keep one row per (day, source) in revenue_daily and have the dashboards load
+those few hundred rows and roll them up in Python.
+
+Rows are maintained incrementally, in the same DB transaction that changes the
+money, whenever a transaction ENTERS or LEAVES the 'completed' state:
+  - package              PackageTransaction (PayOS webhook + admin confirm)
+  - center_deposit       CenterWalletTransaction type='deposit' (PayOS webhook)
+  - center_vip_purchase  CenterWalletTransaction type='vip_purchase' (wallet spend,
+                         already paid for by a deposit, so it is NOT revenue)
+The day is the transaction's created_at date, matching the old queries.
+
+If the table ever drifts (manual SQL edits, a failed best-effort write) rebuild
+it from the source tables:
+  python -m scripts.rebuild_revenue_rollup
+Like app/utils/affiliate.py, nothing here commits and the incremental hooks
+never raise into the payment flow.
+"""
+import logging
+from collections import defaultdict
+from datetime import date
+from typing import Dict, Iterable
+
+from sqlalchemy import func
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+from app.models.models import RevenueDaily, PackageTransaction, CenterWalletTransaction
+from app.utils.datetime_utils import get_vietnam_time
+
+logger = logging.getLogger(__name__)
+
+
+def record_revenue(db, source: str, created_at, amount: float, count: int = 1):
+    """Add one completed transaction to its day row (negative values remove it).
+    Uses INSERT ... ON DUPLICATE KEY UPDATE so concurrent writers can't lose updates."""
+    day = (created_at or get_vietnam_time().replace(tzinfo=None)).date()
+    stmt = mysql_insert(RevenueDaily).values(
+        day=day, source=source, amount=int(round(amount or 0)), txn_count=count,
+    )
+    stmt = stmt.on_duplicate_key_update(
+        amount=RevenueDaily.amount + stmt.inserted.amount,
+        txn_count=RevenueDaily.txn_count + stmt.inserted.txn_count,
+    )
+    db.execute(stmt)
+
+
+def _apply_transition(db, source: str, txn, old_status: str):
+    if old_status != "completed" and txn.status == "completed":
+        sign = 1
+    elif old_status == "completed" and txn.status != "completed":
+        sign = -1
+    else:
+        return
+    try:
+        # Savepoint: a failed rollup write must not poison the caller's transaction.
+        with db.begin_nested():
+            record_revenue(db, source, txn.created_at, sign * (txn.amount or 0), sign)
+    except Exception as e:
+        logger.error(f"Revenue rollup update failed for {source} txn {txn.transaction_id}: {e}")
+
+
+def on_package_transaction_status(db, transaction: PackageTransaction, old_status: str):
+    """Call after changing PackageTransaction.status, before the caller commits."""
+    _apply_transition(db, "package", transaction, old_status)
+
+
+def on_center_transaction_status(db, txn: CenterWalletTransaction, old_status: str):
+    """Call after changing (or creating with) CenterWalletTransaction.status."""
+    source = "center_deposit" if txn.type == "deposit" else "center_vip_purchase"
+    _apply_transition(db, source, txn, old_status)
+
+
+def on_center_vip_purchases(db, created_at, amount: float, count: int):
+    """Bulk form of on_center_transaction_status for `count` vip_purchase rows
+    inserted as completed: one rollup write for the whole batch."""
+    try:
+        with db.begin_nested():
+            record_revenue(db, "center_vip_purchase", created_at, amount, count)
+    except Exception as e:
+        logger.error(f"Revenue rollup update failed for {count} center VIP purchases: {e}")
+
+
+def load_daily_revenue(db, sources: Iterable[str] = ("package",)) -> Dict[date, float]:
+    """{day: amount} summed over `sources`, skipping days with no completed transaction."""
+    rows = db.query(RevenueDaily.day, RevenueDaily.amount).filter(
+        RevenueDaily.source.in_(tuple(sources)),
+        RevenueDaily.txn_count > 0,
+    ).all()
+    daily = defaultdict(float)
+    for day, amount in rows:
+        daily[day] += float(amount)
+    return dict(daily)
+
+
+def sum_between(daily: Dict[date, float], start: date = None, end: date = None) -> float:
+    """Sum of day rows with start <= day < end (either bound optional)."""
+    return float(sum(
+        amount for day, amount in daily.items()
+        if (start is None or day >= start) and (end is None or day < end)
+    ))
+
+
+def rebuild_revenue_rollup(db) -> int:
+    """Recompute every revenue_daily row from the source tables. Does not commit.
+    Returns the number of rows written."""
+    package_day = func.date(PackageTransaction.created_at)
+    center_day = func.date(CenterWalletTransaction.created_at)
+    package_rows = db.query(
+        package_day, func.sum(PackageTransaction.amount), func.count(PackageTransaction.transaction_id)
+    ).filter(PackageTransaction.status == "completed").group_by(package_day).all()
+    center_rows = db.query(
+        center_day, CenterWalletTransaction.type,
+        func.sum(CenterWalletTransaction.amount), func.count(CenterWalletTransaction.transaction_id)
+    ).filter(CenterWalletTransaction.status == "completed").group_by(center_day, CenterWalletTransaction.type).all()
+
+    values = [
+        {"day": day, "source": "package", "amount": int(round(amount or 0)), "txn_count": count}
+        for day, amount, count in package_rows
+    ] + [
+        {"day": day, "source": "center_deposit" if txn_type == "deposit" else "center_vip_purchase",
+         "amount": int(round(amount or 0)), "txn_count": count}
+        for day, txn_type, amount, count in center_rows
+    ]
+
+    db.query(RevenueDaily).delete(synchronize_session=False)
+    if values:
+        db.execute(RevenueDaily.__table__.insert(), values)
+    return len(values)
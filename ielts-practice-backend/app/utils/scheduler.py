@@ -0,0 +1,217 @@
+"""Periodic background jobs, run by exactly one of the uvicorn workers.
+
+Every worker starts the scheduler loop, but only the current leader runs jobs.
+Leadership is a Redis key (scheduler:leader) set with NX and a TTL and renewed
+on every tick by its holder, so when the leader dies another worker takes over
+within SCHEDULER_LOCK_TTL seconds. Without Redis the stand-in is an flock on
+SCHEDULER_LOCK_FILE, which elects one worker per host (per container).
+
+Jobs are registered with register_job(name, interval, func). func(db) is a
+plain sync function run in a thread with its own session; a coroutine function
+is awaited instead, without arguments (it opens sessions itself if it needs
+any). Jobs must be idempotent and set-based, because a leader change can run a
+job again early. The last run time of each job is kept in Redis
+(scheduler:last_run) so a new leader does not re-run everything at once.
+
+Env:
+  SCHEDULER_ENABLED       0 disables the loop in this process (default 1)
+  SCHEDULER_TICK_SECONDS  how often the leader checks for due jobs (default 30)
+  SCHEDULER_LOCK_FILE     flock path used when Redis is down
+                          (default /tmp/ielts_scheduler.lock)
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+from uuid import uuid4
+
+from app.database import SessionLocal
+from app.utils.redis_cache import cache
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: the stand-in makes every process leader
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1") != "0"
+SCHEDULER_TICK_SECONDS = int(os.getenv("SCHEDULER_TICK_SECONDS", "30"))
+SCHEDULER_LOCK_TTL = SCHEDULER_TICK_SECONDS * 3
+SCHEDULER_LOCK_FILE = os.getenv("SCHEDULER_LOCK_FILE", "/tmp/ielts_scheduler.lock")
+LEADER_KEY = "scheduler:leader"
+LAST_RUN_KEY = "scheduler:last_run"
+
+# Extend the TTL only while we still hold the key
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class Job(NamedTuple):
+    name: str
+    interval: int  # seconds
+    func: Callable
+
+
+_jobs: List[Job] = []
+
+
+def register_job(name: str, interval: int, func: Callable):
+    """Run func(db) (or await func() for a coroutine function) every
+    `interval` seconds on the leader."""
+    _jobs.append(Job(name, interval, func))
+
+
+class LeaderElection:
+    """Redis lease shared by all workers, or a host-local flock without Redis."""
+
+    def __init__(self):
+        self.token = f"{os.getpid()}:{uuid4().hex[:8]}"
+        self._lock_fd = None
+
+    async def is_leader(self) -> bool:
+        if cache.redis_client:
+            try:
+                return await self._redis_lease()
+            except Exception as e:
+                logger.error(f"Scheduler leader check failed: {e}")
+                return False
+        return self._file_lock()
+
+    async def _redis_lease(self) -> bool:
+        ttl_ms = SCHEDULER_LOCK_TTL * 1000
+        if await cache.redis_client.set(LEADER_KEY, self.token, nx=True, px=ttl_ms):
+            logger.info(f"Scheduler leadership acquired by {self.token}")
+            return True
+        return bool(await cache.redis_client.eval(_RENEW_SCRIPT, 1, LEADER_KEY, self.token, ttl_ms))
+
+    def _file_lock(self) -> bool:
+        if fcntl is None:
+            return True
+        if self._lock_fd is not None:
+            return True
+        fd = os.open(SCHEDULER_LOCK_FILE, os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd  # held until this process exits
+        logger.info(f"Scheduler leadership acquired by {self.token} (local lock)")
+        return True
+
+    async def release(self):
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+        if cache.redis_client:
+            try:
+                await cache.redis_client.eval(_RELEASE_SCRIPT, 1, LEADER_KEY, self.token)
+            except Exception as e:
+                logger.error(f"Scheduler leadership release failed: {e}")
+
+
+class _LastRuns:
+    """When each job last ran: Redis hash when available, else this process."""
+
+    def __init__(self):
+        self._local: Dict[str, float] = {}
+
+    async def get_all(self) -> Dict[str, float]:
+        if cache.redis_client:
+            try:
+                stored = await cache.redis_client.hgetall(LAST_RUN_KEY)
+                return {name: float(value) for name, value in stored.items()}
+            except Exception as e:
+                logger.error(f"Scheduler last-run read failed: {e}")
+        return dict(self._local)
+
+    async def mark(self, name: str, when: float):
+        self._local[name] = when
+        if cache.redis_client:
+            try:
+                await cache.redis_client.hset(LAST_RUN_KEY, name, when)
+            except Exception as e:
+                logger.error(f"Scheduler last-run write failed: {e}")
+
+
+_last_runs = _LastRuns()
+
+
+def _run_job(job: Job):
+    db = SessionLocal()
+    try:
+        job.func(db)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def run_due_jobs(election: LeaderElection):
+    last_runs = await _last_runs.get_all()
+    for job in _jobs:
+        if time.time() - last_runs.get(job.name, 0) < job.interval:
+            continue
+        # Jobs can take a while: re-check the lease before each one
+        if not await election.is_leader():
+            return
+        started = time.time()
+        try:
+            if asyncio.iscoroutinefunction(job.func):
+                await job.func()
+            else:
+                await asyncio.to_thread(_run_job, job)
+        except Exception as e:
+            logger.error(f"Scheduled job {job.name} failed: {e}")
+        else:
+            logger.info(f"Scheduled job {job.name} finished in {time.time() - started:.1f}s")
+        # Failed runs also wait for the next interval instead of retrying every tick
+        await _last_runs.mark(job.name, started)
+
+
+async def _scheduler_loop(election: LeaderElection):
+    while True:
+        try:
+            if await election.is_leader():
+                await run_due_jobs(election)
+        except Exception as e:
+            logger.error(f"Scheduler tick error: {e}")
+        await asyncio.sleep(SCHEDULER_TICK_SECONDS)
+
+
+_scheduler_task: Optional[asyncio.Task] = None
+_election: Optional[LeaderElection] = None
+
+
+def start_scheduler():
+    """Start this process's scheduler loop (called at app startup)."""
+    global _scheduler_task, _election
+    if not SCHEDULER_ENABLED:
+        return
+    _election = LeaderElection()
+    _scheduler_task = asyncio.get_running_loop().create_task(_scheduler_loop(_election))
+
+
+async def stop_scheduler():
+    """Stop the loop and hand leadership over right away."""
+    global _scheduler_task, _election
+    if _scheduler_task is None:
+        return
+    _scheduler_task.cancel()
+    await asyncio.gather(_scheduler_task, return_exceptions=True)
+    await _election.release()
+    _scheduler_task = None
+    _election = None
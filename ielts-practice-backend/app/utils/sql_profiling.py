@@ -0,0 +1,203 @@
+"""Per-request SQL instrumentation.
+
+SqlProfilingMiddleware samples a fraction of requests (SQL_PROFILE_SAMPLE_RATE)
+and, for each sampled request, counts the queries it runs, their total time
+and how often each statement shape ("fingerprint": the SQL with literals and
+IN-lists collapsed) repeats. The result goes out as
+
+  Server-Timing: db;dur=12.4;desc="17 queries", db-max-repeat;desc="12x SELECT ..."
+
+(visible in the browser devtools) and as one JSON log line per request. When a
+single shape runs more than SQL_PROFILE_N_PLUS_ONE times the request is logged
+as a warning: that is the N+1 signature (a query inside a loop).
+
+The two cursor hooks are registered on the engine once, never per request:
+SQLAlchemy iterates the listener collection on every query, so adding and
+removing listeners while other requests run queries fails them ("deque
+mutated during iteration"). They are registered when the middleware is created
+with sampling on, or on the first track_queries() (tests, benchmarks), and
+return straight away outside a tracked context. With sampling off (the
+default) there is no per-query overhead at all, and unsampled requests only
+pay one random() call.
+
+For tests and benchmarks:
+
+  with assert_max_queries(5):
+      client.get("/student/exam/12/start")
+
+Env:
+  SQL_PROFILE_SAMPLE_RATE   0..1, fraction of requests to profile (default 0)
+  SQL_PROFILE_N_PLUS_ONE    repeats of one statement shape that flag N+1 (default 10)
+"""
+import contextvars
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import List, Optional
+
+from sqlalchemy import event
+
+from app.database import engine
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = float(os.getenv("SQL_PROFILE_SAMPLE_RATE", "0"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_PROFILE_N_PLUS_ONE", "10"))
+TOP_FINGERPRINTS = 3
+
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM = re.compile(r"%\([^)]+\)s|%s|\?|:\w+")
+_SPACE = re.compile(r"\s+")
+
+
+def fingerprint(statement: str) -> str:
+    """Statement shape: literals and parameters become ?, IN-lists become IN (...)."""
+    shape = _STRING.sub("?", statement)
+    shape = _PARAM.sub("?", shape)
+    shape = _NUMBER.sub("?", shape)
+    shape = _IN_LIST.sub("IN (...)", shape)
+    return _SPACE.sub(" ", shape).strip()
+
+
+class QueryStats:
+    """What one tracked block of work did against the database."""
+
+    def __init__(self, keep_statements: bool = False):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        self.statements: Optional[List[str]] = [] if keep_statements else None
+
+    def record(self, statement: str, duration: float):
+        self.count += 1
+        self.duration += duration
+        self.fingerprints[fingerprint(statement)] += 1
+        if self.statements is not None:
+            self.statements.append(statement)
+
+    def top_repeated(self, n: int = TOP_FINGERPRINTS):
+        return [(shape, times) for shape, times in self.fingerprints.most_common(n) if times > 1]
+
+    @property
+    def max_repeat(self) -> int:
+        return max(self.fingerprints.values(), default=0)
+
+    def server_timing(self) -> str:
+        value = f'db;dur={self.duration * 1000:.1f};desc="{self.count} queries"'
+        top = self.top_repeated(1)
+        if top:
+            shape, times = top[0]
+            desc = f"{times}x {shape[:80]}".replace('"', "'")
+            value += f', db-max-repeat;desc="{desc}"'
+        return value
+
+
+# Stats of whatever is being tracked in the current context (None = not tracked).
+# The object is shared, so queries run in threadpool endpoints and
+# asyncio.to_thread helpers (which copy the context) are counted too.
+_current: contextvars.ContextVar[Optional[QueryStats]] = contextvars.ContextVar("sql_query_stats", default=None)
+
+_hooks_lock = threading.Lock()
+_hooks_installed = False
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _current.get() is not None:
+        context._sql_profile_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    started = getattr(context, "_sql_profile_start", None)
+    if stats is not None and started is not None:
+        stats.record(statement, time.perf_counter() - started)
+
+
+def install_hooks():
+    """Register the cursor hooks on the engine (once; they stay registered)."""
+    global _hooks_installed
+    with _hooks_lock:
+        if not _hooks_installed:
+            event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+            _hooks_installed = True
+
+
+@contextmanager
+def track_queries(keep_statements: bool = False):
+    """Count the queries run inside the block; yields the QueryStats."""
+    stats = QueryStats(keep_statements)
+    install_hooks()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def assert_max_queries(limit: int):
+    """Fail (AssertionError) if the block runs more than `limit` queries."""
+    with track_queries(keep_statements=True) as stats:
+        yield stats
+    if stats.count > limit:
+        listing = "\n".join(f"  {i + 1}. {s}" for i, s in enumerate(stats.statements))
+        raise AssertionError(f"Expected at most {limit} queries, ran {stats.count}:\n{listing}")
+
+
+def log_request_stats(method: str, path: str, status: Optional[int], stats: QueryStats, elapsed: float):
+    record = {
+        "method": method,
+        "path": path,
+        "status": status,
+        "queries": stats.count,
+        "db_ms": round(stats.duration * 1000, 1),
+        "total_ms": round(elapsed * 1000, 1),
+        "top_repeated": [{"count": times, "sql": shape[:200]} for shape, times in stats.top_repeated()],
+    }
+    if stats.max_repeat > N_PLUS_ONE_THRESHOLD:
+        record["n_plus_one"] = True
+        logger.warning(f"sql_profile {json.dumps(record)}")
+    else:
+        logger.info(f"sql_profile {json.dumps(record)}")
+
+
+class SqlProfilingMiddleware:
+    """ASGI middleware: profiles a sample of HTTP requests (see module docstring)."""
+
+    def __init__(self, app, sample_rate: float = SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+        if sample_rate > 0:
+            install_hooks()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = None
+        with track_queries() as stats:
+            async def send_with_timing(message):
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", stats.server_timing().encode("latin-1", "replace")))
+                    headers.append((b"timing-allow-origin", b"*"))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                log_request_stats(scope["method"], scope["path"], status, stats, time.perf_counter() - started)
@@ -0,0 +1,161 @@
+"""Streaming ingestion of uploads into content-addressed files.
+
+The admin upload endpoints did `await upload.read()` of the whole file into
+worker memory (listening audio of 10-30 MB, images) and the listening part
+editors wrote the audio into a LONGBLOB inside the transaction that also
+rewrites every question of the part, so the transaction carried the blob and
+held its locks for as long as the write took.
+
+ingest_upload(upload, policy) instead copies the upload to disk CHUNK_SIZE
+bytes at a time while hashing it, and checks it on the way:
+  - the type is sniffed from the first bytes (the client's content type and
+    file name are not trusted) and must be one of policy.types
+  - the size must stay within policy.max_bytes; reading stops at the first
+    chunk over it
+The file is stored as {policy.directory}/{sha[:2]}/{sha}.{ext}; an upload
+identical to one already stored is dropped and the existing file reused. The
+temporary file lives in the same directory and is renamed into place, so a
+stored path never points at a partial file. The caller gets a StoredUpload
+(path, public URL, hash, size, type) and puts only that reference in the
+database.
+
+Problems raise UploadRejected with the HTTP status to answer with.
+
+Listening part audio is stored privately under LISTENING_AUDIO_DIR and
+referenced by ListeningMedia.audio_path; rows uploaded before keep their
+audio in ListeningMedia.audio_file (listening_audio_bytes reads either).
+
+Env:
+  UPLOAD_MAX_IMAGE_MB   image size limit (default 10)
+  UPLOAD_MAX_AUDIO_MB   listening audio size limit (default 100)
+  UPLOAD_MAX_PDF_MB     PDF size limit (default 50)
+  LISTENING_AUDIO_DIR   listening audio storage root (default media/listening_audio)
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+from typing import Dict, NamedTuple, Optional
+
+CHUNK_SIZE = 1024 * 1024
+MB = 1024 * 1024
+
+IMAGE_TYPES = {"image/jpeg": "jpg", "image/png": "png", "image/gif": "gif", "image/webp": "webp"}
+MP3_TYPES = {"audio/mpeg": "mp3"}
+PDF_TYPES = {"application/pdf": "pdf"}
+MAX_IMAGE_BYTES = int(os.getenv("UPLOAD_MAX_IMAGE_MB", "10")) * MB
+MAX_AUDIO_BYTES = int(os.getenv("UPLOAD_MAX_AUDIO_MB", "100")) * MB
+MAX_PDF_BYTES = int(os.getenv("UPLOAD_MAX_PDF_MB", "50")) * MB
+LISTENING_AUDIO_DIR = os.getenv("LISTENING_AUDIO_DIR", "media/listening_audio")
+
+
+class UploadPolicy(NamedTuple):
+    directory: str              # storage root for this kind of upload
+    url_prefix: Optional[str]   # public URL of `directory`; None for private files
+    max_bytes: int
+    types: Dict[str, str]       # accepted sniffed MIME type -> file extension
+
+
+class StoredUpload(NamedTuple):
+    path: str                   # file path, relative to the working directory
+    url: Optional[str]
+    sha256: str
+    size: int
+    content_type: str
+    deduplicated: bool          # an identical file was already stored
+
+
+class UploadRejected(ValueError):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+
+
+def sniff(head: bytes) -> Optional[str]:
+    """MIME type from a file's leading bytes, for the types we accept."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head.startswith(b"%PDF-"):
+        return "application/pdf"
+    # ID3v2 tag, or an MPEG audio frame sync (11 set bits, layer != reserved)
+    if head.startswith(b"ID3") or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0 and head[1] & 0x06):
+        return "audio/mpeg"
+    return None
+
+
+def _reject_type(policy: UploadPolicy, content_type: Optional[str]):
+    allowed = ", ".join(ext.upper() for ext in policy.types.values())
+    raise UploadRejected(415, f"Unsupported file type{f' ({content_type})' if content_type else ''}; allowed: {allowed}")
+
+
+async def ingest_upload(upload, policy: UploadPolicy) -> StoredUpload:
+    """Stream a Starlette/FastAPI UploadFile into the policy's store."""
+    if getattr(upload, "size", None) and upload.size > policy.max_bytes:
+        raise UploadRejected(413, f"File too large (max {policy.max_bytes // MB} MB)")
+
+    os.makedirs(policy.directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".upload.", dir=policy.directory)
+    digest = hashlib.sha256()
+    size = 0
+    content_type = None
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await upload.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if content_type is None:
+                    content_type = sniff(chunk)
+                    if content_type not in policy.types:
+                        _reject_type(policy, content_type)
+                size += len(chunk)
+                if size > policy.max_bytes:
+                    raise UploadRejected(413, f"File too large (max {policy.max_bytes // MB} MB)")
+                digest.update(chunk)
+                await asyncio.to_thread(out.write, chunk)
+        if not size:
+            raise UploadRejected(400, "Empty file")
+
+        sha = digest.hexdigest()
+        relative = f"{sha[:2]}/{sha}.{policy.types[content_type]}"
+        path = os.path.join(policy.directory, relative)
+        deduplicated = os.path.exists(path)
+        if not deduplicated:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        return StoredUpload(
+            path=path,
+            url=f"{policy.url_prefix}/{relative}" if policy.url_prefix else None,
+            sha256=sha,
+            size=size,
+            content_type=content_type,
+            deduplicated=deduplicated,
+        )
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def image_policy(directory: str, url_prefix: str) -> UploadPolicy:
+    return UploadPolicy(directory, url_prefix, MAX_IMAGE_BYTES, IMAGE_TYPES)
+
+
+def pdf_policy(directory: str, url_prefix: str) -> UploadPolicy:
+    return UploadPolicy(directory, url_prefix, MAX_PDF_BYTES, PDF_TYPES)
+
+
+LISTENING_AUDIO = UploadPolicy(LISTENING_AUDIO_DIR, None, MAX_AUDIO_BYTES, MP3_TYPES)
+
+
+def listening_audio_bytes(media) -> Optional[bytes]:
+    """A ListeningMedia row's audio: the stored file, else the legacy blob."""
+    if media.audio_path:
+        with open(media.audio_path, "rb") as f:
+            return f.read()
+    return media.audio_file
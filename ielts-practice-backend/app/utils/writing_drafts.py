@@ -0,0 +1,343 @@
+"""Write-behind autosave for writing test drafts.
+
+The writing editor used to POST the whole essay to save-draft every few
+seconds, and every call rewrote WritingAnswer.answer_text (LONGTEXT) and
+committed. Now the editor sends only what changed since the version it last
+saw:
+
+  PATCH /student/writing/tasks/{task_id}/draft
+  {"base_version": 7, "client_id": "<tab id>",
+   "ops": [{"at": 120, "delete": 0, "insert": "however, "}], "length": 845}
+
+The ops are applied, in order, to the draft held in Redis
+(writing_draft:{user_id}:{task_id}: text, version, client_id, ...) and the
+version goes up by one. Positions and lengths count UTF-16 code units, like
+JavaScript string indices. "length" is optional: the length the client's text
+has after the edit, checked to catch a client that drifted. A full "text"
+may be sent instead of ops (first save, resync).
+
+Two tabs editing the same task cannot silently overwrite each other: an update
+whose base_version is not the current version is rejected (DraftConflict ->
+409 with the current text and version) and the tab has to rebase or reload.
+The version check and the write happen under WATCH, so concurrent updates are
+serialized even across workers.
+
+Changed drafts are added to the writing_drafts:dirty set. A flusher in every
+worker pops batches from it each WRITING_DRAFT_FLUSH_SECONDS and writes them to
+writing_answers in one transaction per batch, so a student typing for an hour
+costs a few hundred small Redis writes and one MySQL write per interval
+instead of one LONGTEXT rewrite per keystroke pause. Submitting the test (and
+AI evaluation, reset, the legacy full-text save-draft) writes the final text
+directly and discards the draft. A flush can still be holding a draft it read
+just before that: it upserts on the unique (task_id, user_id), stamps the row
+with the draft's own updated_at and only overwrites a row last written before
+the draft (microsecond writing_answers.updated_at), so a direct write that
+committed in between wins, even one that inserted the row.
+Check with: python -m scripts.check_writing_draft_flush
+
+Without Redis the delta endpoint answers 503 and the editor falls back to the
+full-text save-draft endpoint.
+
+Env:
+  WRITING_DRAFT_FLUSH_SECONDS   how often drafts are written to MySQL (default 15)
+  WRITING_DRAFT_TTL             seconds a draft is kept in Redis (default 2 days)
+  WRITING_DRAFT_MAX_CHARS       largest draft accepted (default 100000)
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from redis.exceptions import WatchError
+from sqlalchemy import and_, case, or_
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.database import SessionLocal
+from app.models.models import WritingAnswer
+from app.utils.datetime_utils import get_vietnam_time
+from app.utils.redis_cache import cache, get_writing_draft_cache_key
+
+logger = logging.getLogger(__name__)
+
+WRITING_DRAFT_FLUSH_SECONDS = int(os.getenv("WRITING_DRAFT_FLUSH_SECONDS", "15"))
+WRITING_DRAFT_TTL = int(os.getenv("WRITING_DRAFT_TTL", str(2 * 24 * 3600)))
+WRITING_DRAFT_MAX_CHARS = int(os.getenv("WRITING_DRAFT_MAX_CHARS", "100000"))
+DIRTY_KEY = "writing_drafts:dirty"
+FLUSH_BATCH = 200
+MAX_RETRIES = 5
+
+
+class DraftUnavailable(Exception):
+    """Redis is not connected; the caller should fall back to full-text saves."""
+
+
+class DraftConflict(Exception):
+    """The update was made against an older version of the draft."""
+
+    def __init__(self, version: int, text: str, client_id: Optional[str]):
+        super().__init__(f"draft is at version {version}")
+        self.version = version
+        self.text = text
+        self.client_id = client_id
+
+
+class InvalidDelta(Exception):
+    """The ops do not apply to the current text."""
+
+
+def _now():
+    return get_vietnam_time().replace(tzinfo=None)
+
+
+def apply_ops(text: str, ops: List[dict]) -> str:
+    """Apply [{"at", "delete", "insert"}, ...] in order, counting UTF-16 code units."""
+    units = text.encode("utf-16-le")
+    for op in ops:
+        at, delete = op.get("at", 0), op.get("delete", 0)
+        insert = (op.get("insert") or "").encode("utf-16-le")
+        if at < 0 or delete < 0 or at * 2 + delete * 2 > len(units):
+            raise InvalidDelta(f"op at={at} delete={delete} is outside the text")
+        units = units[:at * 2] + insert + units[at * 2 + delete * 2:]
+    try:
+        return units.decode("utf-16-le")
+    except UnicodeDecodeError:
+        raise InvalidDelta("op splits a surrogate pair")
+
+
+def utf16_length(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _member(user_id: int, task_id: int) -> str:
+    return f"{user_id}:{task_id}"
+
+
+def _as_draft(raw: Dict[str, str]) -> Optional[dict]:
+    if not raw or "version" not in raw:
+        return None
+    return {
+        "text": raw.get("text", ""),
+        "version": int(raw["version"]),
+        "client_id": raw.get("client_id") or None,
+        "updated_at": raw.get("updated_at"),
+    }
+
+
+async def get_draft(user_id: int, task_id: int) -> Optional[dict]:
+    """The Redis draft ({text, version, client_id, updated_at}) or None."""
+    if not cache.redis_client:
+        return None
+    try:
+        return _as_draft(await cache.redis_client.hgetall(get_writing_draft_cache_key(user_id, task_id)))
+    except Exception as e:
+        logger.error(f"Writing draft read failed for {user_id}:{task_id}: {e}")
+        return None
+
+
+async def apply_update(
+    user_id: int,
+    task_id: int,
+    base_version: int,
+    client_id: Optional[str],
+    saved_text: Callable[[], str],
+    ops: Optional[List[dict]] = None,
+    text: Optional[str] = None,
+    length: Optional[int] = None,
+) -> dict:
+    """Apply ops (or a full text) made against base_version; returns the new draft.
+
+    saved_text() supplies the text stored in MySQL (version 0) when there is no
+    draft in Redis yet. Raises DraftConflict, InvalidDelta or DraftUnavailable.
+    """
+    if not cache.redis_client:
+        raise DraftUnavailable()
+    key = get_writing_draft_cache_key(user_id, task_id)
+    for _ in range(MAX_RETRIES):
+        try:
+            async with cache.redis_client.pipeline(transaction=True) as pipe:
+                await pipe.watch(key)
+                current = _as_draft(await pipe.hgetall(key))
+                if current is None:
+                    current = {"text": saved_text() or "", "version": 0, "client_id": None}
+                if base_version != current["version"]:
+                    raise DraftConflict(current["version"], current["text"], current["client_id"])
+
+                new_text = text if text is not None else apply_ops(current["text"], ops or [])
+                if len(new_text) > WRITING_DRAFT_MAX_CHARS:
+                    raise InvalidDelta(f"draft is longer than {WRITING_DRAFT_MAX_CHARS} characters")
+                if length is not None and utf16_length(new_text) != length:
+                    # The client's copy is not what we have: make it resync
+                    raise DraftConflict(current["version"], current["text"], current["client_id"])
+
+                draft = {
+                    "text": new_text,
+                    "version": current["version"] + 1,
+                    "client_id": client_id or "",
+                    "updated_at": _now().isoformat(),
+                }
+                pipe.multi()
+                pipe.hset(key, mapping=draft)
+                pipe.expire(key, WRITING_DRAFT_TTL)
+                pipe.sadd(DIRTY_KEY, _member(user_id, task_id))
+                await pipe.execute()
+                return {**draft, "client_id": client_id}
+        except WatchError:
+            continue  # another tab wrote in between: re-read and re-check the version
+        except (DraftConflict, InvalidDelta):
+            raise
+        except Exception as e:
+            logger.error(f"Writing draft update failed for {user_id}:{task_id}: {e}")
+            raise DraftUnavailable() from e
+    current = await get_draft(user_id, task_id)
+    if current is None:
+        raise DraftUnavailable()
+    raise DraftConflict(current["version"], current["text"], current["client_id"])
+
+
+async def discard_drafts(user_id: int, task_ids: List[int]):
+    """Drop drafts superseded by a direct write (submit, evaluation, reset)."""
+    if not cache.redis_client or not task_ids:
+        return
+    try:
+        await cache.redis_client.delete(*[get_writing_draft_cache_key(user_id, task_id) for task_id in task_ids])
+        await cache.redis_client.srem(DIRTY_KEY, *[_member(user_id, task_id) for task_id in task_ids])
+    except Exception as e:
+        logger.error(f"Discarding writing drafts failed for user {user_id}: {e}")
+
+
+# ── Write-behind flush ───────────────────────────────────────────────────────
+
+def _upsert_statement(dialect: str, rows: List[Dict]):
+    """INSERT ... ON DUPLICATE KEY UPDATE of `rows` that only replaces an
+    answer that is not AI-evaluated and was last written before the draft.
+    SQLite (scratch databases of the check scripts) gets the ON CONFLICT form."""
+    if dialect == "sqlite":
+        stmt = sqlite_insert(WritingAnswer).values(rows)
+        replace = and_(
+            or_(WritingAnswer.is_ai_evaluated.is_(None), WritingAnswer.is_ai_evaluated == False),
+            or_(WritingAnswer.updated_at.is_(None), WritingAnswer.updated_at < stmt.excluded.updated_at),
+        )
+        return stmt.on_conflict_do_update(
+            index_elements=[WritingAnswer.task_id, WritingAnswer.user_id],
+            set_={"answer_text": stmt.excluded.answer_text, "updated_at": stmt.excluded.updated_at},
+            where=replace,
+        )
+    stmt = mysql_insert(WritingAnswer).values(rows)
+    # An evaluated essay is final, and a row written after the draft was read
+    # (a submit) is newer: neither is replaced
+    replace = and_(
+        or_(WritingAnswer.is_ai_evaluated.is_(None), WritingAnswer.is_ai_evaluated == False),
+        or_(WritingAnswer.updated_at.is_(None), WritingAnswer.updated_at < stmt.inserted.updated_at),
+    )
+    # MySQL assigns left to right and later expressions see earlier assignments:
+    # updated_at goes last so both conditions compare against the stored value
+    return stmt.on_duplicate_key_update([
+        ("answer_text", case((replace, stmt.inserted.answer_text), else_=WritingAnswer.answer_text)),
+        ("updated_at", case((replace, stmt.inserted.updated_at), else_=WritingAnswer.updated_at)),
+    ])
+
+
+def _write_answers(drafts: List[Tuple[int, int, str, datetime]]):
+    """Upsert (user_id, task_id, text, drafted_at) rows into writing_answers in
+    one statement, keyed on the unique (task_id, user_id). Existing rows are
+    only overwritten if they were last written before the draft, in the upsert
+    itself, so a submit that commits after the draft was read keeps its text,
+    whether it updated the row or inserted it."""
+    db = SessionLocal()
+    try:
+        now = _now()
+        rows = [
+            {
+                "task_id": task_id,
+                "user_id": user_id,
+                "answer_text": text,
+                "score": 0,
+                "is_ai_evaluated": False,
+                "created_at": now,
+                "updated_at": drafted_at,
+            }
+            for user_id, task_id, text, drafted_at in drafts
+        ]
+        db.execute(_upsert_statement(db.get_bind().dialect.name, rows))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _drafted_at(updated_at: Optional[str]) -> datetime:
+    try:
+        return datetime.fromisoformat(updated_at)
+    except (TypeError, ValueError):
+        return _now()
+
+
+async def flush_dirty(limit: int = FLUSH_BATCH) -> int:
+    """Write up to `limit` changed drafts to MySQL; returns how many were taken
+    off the dirty set (== limit means there may be more)."""
+    if not cache.redis_client:
+        return 0
+    redis_client = cache.redis_client
+    members = await redis_client.spop(DIRTY_KEY, limit)
+    if not members:
+        return 0
+    keys = []
+    for member in members:
+        user_id, task_id = (int(part) for part in member.split(":"))
+        keys.append((user_id, task_id))
+
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for user_id, task_id in keys:
+            pipe.hmget(get_writing_draft_cache_key(user_id, task_id), "text", "version", "updated_at")
+        rows = await pipe.execute()
+    drafts = [
+        (user_id, task_id, text, _drafted_at(updated_at))
+        for (user_id, task_id), (text, version, updated_at) in zip(keys, rows)
+        if version is not None  # discarded (submitted) or expired meanwhile
+    ]
+    if drafts:
+        try:
+            await asyncio.to_thread(_write_answers, drafts)
+        except Exception:
+            # Keep them dirty for the next round
+            await redis_client.sadd(DIRTY_KEY, *members)
+            raise
+    return len(members)
+
+
+async def _flusher():
+    while True:
+        await asyncio.sleep(WRITING_DRAFT_FLUSH_SECONDS)
+        try:
+            while await flush_dirty() == FLUSH_BATCH:
+                pass
+        except Exception as e:
+            logger.error(f"Writing draft flush error: {e}")
+
+
+_flush_task: Optional[asyncio.Task] = None
+
+
+def start_draft_flusher():
+    """Start this process's draft flusher (called at app startup)."""
+    global _flush_task
+    _flush_task = asyncio.get_running_loop().create_task(_flusher())
+
+
+async def stop_draft_flusher():
+    """Stop the flusher and write out what is pending."""
+    global _flush_task
+    if _flush_task is None:
+        return
+    _flush_task.cancel()
+    await asyncio.gather(_flush_task, return_exceptions=True)
+    _flush_task = None
+    try:
+        while await flush_dirty() == FLUSH_BATCH:
+            pass
+    except Exception as e:
+        logger.error(f"Writing draft flush on shutdown failed: {e}")
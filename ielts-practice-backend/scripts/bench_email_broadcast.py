@@ -0,0 +1,77 @@
+"""Throughput benchmark: broadcast engine vs. the old one-request-per-email loop.
+
+Runs both against scripts/fake_resend_server.py (started in-process), so no
+real email is sent and no database is needed.
+
+Usage (from ielts-practice-backend/):
+  python -m scripts.bench_email_broadcast --recipients 2000 --rate 2 --latency-ms 80
+"""
+import argparse
+import asyncio
+import time
+
+import requests
+
+from app.utils.broadcast_sender import BroadcastSender, ResendBatchTransport
+from scripts.fake_resend_server import start_server
+
+SUBJECT = "Benchmark"
+HTML = "<p>" + "Lorem ipsum dolor sit amet. " * 100 + "</p>"
+
+
+def run_legacy(base_url: str, emails, sample: int) -> float:
+    """Old path: one requests.post (new connection) per recipient. Returns emails/s."""
+    start = time.perf_counter()
+    for email in emails[:sample]:
+        requests.post(
+            f"{base_url}/emails",
+            headers={"Authorization": "Bearer test"},
+            json={"from": "bench@example.com", "to": [email], "subject": SUBJECT, "html": HTML},
+            timeout=15,
+        )
+    return sample / (time.perf_counter() - start)
+
+
+async def run_engine(base_url: str, emails, concurrency: int, rate: float) -> tuple:
+    transport = ResendBatchTransport("test", "bench@example.com", batch_url=f"{base_url}/emails/batch",
+                                     concurrency=concurrency)
+    sender = BroadcastSender(transport, concurrency=concurrency, rate=rate)
+    start = time.perf_counter()
+    try:
+        sent, failed = await sender.send(emails, SUBJECT, HTML)
+    finally:
+        await sender.aclose()
+    return sent, failed, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recipients", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=2, help="provider request rate limit (req/s)")
+    parser.add_argument("--latency-ms", type=int, default=80)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--legacy-sample", type=int, default=20,
+                        help="emails to time on the legacy path (it is rate limited per email)")
+    args = parser.parse_args()
+
+    emails = [f"user{i}@example.com" for i in range(args.recipients)]
+
+    server, state, url = start_server(rate=0, latency_ms=args.latency_ms)
+    legacy_eps = run_legacy(url, emails, args.legacy_sample)
+    server.shutdown()
+
+    server, state, url = start_server(rate=args.rate, latency_ms=args.latency_ms)
+    sent, failed, elapsed = asyncio.run(run_engine(url, emails, args.concurrency, args.rate))
+    stats = state.snapshot()
+    server.shutdown()
+
+    # The legacy loop would also have hit the provider limit at one email per request.
+    legacy_capped = min(legacy_eps, args.rate)
+    print(f"legacy loop : {legacy_eps:8.1f} emails/s unthrottled, {legacy_capped:.1f} emails/s under a "
+          f"{args.rate:g} req/s limit -> {args.recipients / legacy_capped / 60:.1f} min for {args.recipients}")
+    print(f"engine      : {sent / elapsed:8.1f} emails/s ({sent} sent, {failed} failed, {elapsed:.1f}s, "
+          f"{stats['requests']} requests, {stats['rate_limited']} throttled)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Throughput benchmark: outbox SMTP workers vs. the old connection-per-email send.
+
+Both run against scripts/fake_smtp_server.py (started in-process), so no real
+email is sent. The outbox side uses the real OutboxQueue (its in-memory
+stand-in, since Redis is not connected here) and SmtpTransport; only the
+database claim/record steps are left out, so no database is needed.
+
+Usage (from ielts-practice-backend/):
+  python -m scripts.bench_email_outbox --emails 500 --workers 4 --handshake-ms 150 --latency-ms 20
+"""
+import argparse
+import asyncio
+import smtplib
+import time
+
+from app.utils.email_outbox import OutboxQueue, SmtpTransport
+from app.utils.email_utils import build_mime_message
+from scripts.fake_smtp_server import start_server
+
+SUBJECT = "Benchmark"
+HTML = "<p>" + "Mã xác thực của bạn là 123456. " * 20 + "</p>"
+
+
+def run_legacy(host: str, port: int, emails) -> float:
+    """Old send_email: connect, login, send, quit for every message. Returns emails/s."""
+    start = time.perf_counter()
+    for email in emails:
+        server = smtplib.SMTP(host, port)
+        server.login("test", "test")
+        server.sendmail("test", email, build_mime_message(email, SUBJECT, HTML).as_string())
+        server.quit()
+    return len(emails) / (time.perf_counter() - start)
+
+
+async def run_outbox(host: str, port: int, emails, workers: int, batch_size: int) -> tuple:
+    queue = OutboxQueue()
+    await queue.push(list(range(len(emails))))
+    sent = failed = 0
+
+    async def worker():
+        nonlocal sent, failed
+        transport = SmtpTransport(host, port, "test", "test")
+        try:
+            while True:
+                ids = await queue.pop_batch(batch_size, timeout=0.2)
+                if not ids:
+                    return
+                errors = await transport.send_batch([(emails[i], SUBJECT, HTML) for i in ids])
+                sent += errors.count(None)
+                failed += len(errors) - errors.count(None)
+        finally:
+            await transport.aclose()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    # The idle pop timeout that ends each worker is not send time
+    return sent, failed, time.perf_counter() - start - 0.2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--handshake-ms", type=int, default=150)
+    parser.add_argument("--latency-ms", type=int, default=20)
+    parser.add_argument("--legacy-sample", type=int, default=30,
+                        help="emails to time on the legacy path (it pays the handshake per email)")
+    args = parser.parse_args()
+
+    emails = [f"user{i}@example.com" for i in range(args.emails)]
+    server, state, host, port = start_server(handshake_ms=args.handshake_ms, latency_ms=args.latency_ms)
+    try:
+        legacy_eps = run_legacy(host, port, emails[:args.legacy_sample])
+        legacy_stats = state.snapshot()
+        sent, failed, elapsed = asyncio.run(run_outbox(host, port, emails, args.workers, args.batch_size))
+        stats = state.snapshot()
+    finally:
+        server.shutdown()
+
+    print(f"legacy send_email : {legacy_eps:8.1f} emails/s, {1000 / legacy_eps:.0f} ms in the request handler per email "
+          f"({legacy_stats['connections']} connections for {args.legacy_sample} emails)")
+    print(f"outbox workers    : {sent / elapsed:8.1f} emails/s ({sent} sent, {failed} failed, {elapsed:.1f}s, "
+          f"{stats['connections'] - legacy_stats['connections']} connections, {args.workers} workers); "
+          f"handlers only pay the outbox INSERT")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Check that the admin exam views run a fixed number of queries.
+
+The admin exam editors load their exam through
+app/utils/exam_payloads.load_exam_tree, which reads sections, questions,
+options, passages, media and groups in a few queries whatever the size of the
+exam. This builds a listening and a reading exam with --small questions and
+again with --large questions (options and question groups included) in a
+scratch database, calls each view under sql_profiling.assert_max_queries, and
+fails when a view runs more statements on the large exam than on the small
+one: that is a query per question (or per section) creeping back in.
+
+  GET /admin/listening-test/{id}
+  GET /admin/listening-test/{id}/part/{n}
+  GET /admin/ielts-exam/{id}
+  GET /admin/reading/reading-test/{id}
+  GET /admin/reading/reading-test/{id}/part/{n}
+
+Usage (from ielts-practice-backend/):
+  python -m scripts.check_exam_tree_queries [--small 4] [--large 40] \\
+      [--database-url sqlite:///check_exam_tree.db] [--verbose]
+"""
+import argparse
+import asyncio
+import os
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import scripts.generate_load_dataset  # noqa: F401  SQLite type shims
+from app.database import Base
+from app.models.models import (
+    Exam, ExamSection, ListeningMedia, Question, QuestionGroup, QuestionOption, ReadingPassage,
+)
+from app.routes.admin.admin_actions import get_ielts_exam_detail, get_listening_part, get_listening_test_details
+from app.routes.admin.reading_admin import get_reading_test, get_reading_test_part
+from app.utils import sql_profiling
+
+# Far above the loader's budget; the check is that both sizes run the same number.
+QUERY_LIMIT = 20
+
+VIEWS = {
+    "listening test": ("listening", lambda exam_id, db: get_listening_test_details(exam_id, None, db)),
+    "listening part": ("listening", lambda exam_id, db: get_listening_part(exam_id, 1, None, db)),
+    "ielts exam detail": ("listening", lambda exam_id, db: get_ielts_exam_detail(exam_id, None, db)),
+    "reading test": ("reading", lambda exam_id, db: get_reading_test(exam_id, None, db)),
+    "reading part": ("reading", lambda exam_id, db: get_reading_test_part(exam_id, 1, None, db)),
+}
+PARTS = {"listening": 4, "reading": 3}
+
+
+def build_exam(db, section_type: str, question_count: int) -> int:
+    """An exam of `section_type` with `question_count` questions spread over
+    its parts, two groups per part and four options per question."""
+    exam = Exam(title=f"{section_type} x{question_count}", is_active=True)
+    db.add(exam)
+    db.flush()
+    parts = PARTS[section_type]
+    number = 0
+    for order in range(1, parts + 1):
+        section = ExamSection(exam_id=exam.exam_id, section_type=section_type, order_number=order, duration=20)
+        db.add(section)
+        db.flush()
+        if section_type == "reading":
+            db.add(ReadingPassage(section_id=section.section_id, title=f"Passage {order}", content="Text.", word_count=1))
+        else:
+            db.add(ListeningMedia(section_id=section.section_id, audio_filename=f"part{order}.mp3", transcript="..."))
+        groups = [QuestionGroup(section_id=section.section_id, instruction="Choose.", group_type="multiple_choice",
+                                order_number=g) for g in (1, 2)]
+        db.add_all(groups)
+        db.flush()
+        in_part = question_count // parts + (1 if order <= question_count % parts else 0)
+        for i in range(in_part):
+            number += 1
+            question = Question(section_id=section.section_id, group_id=groups[i % 2].group_id,
+                                question_type="multiple_choice", question_text=f"Question {number}",
+                                correct_answer="A", question_number=number, additional_data={})
+            db.add(question)
+            db.flush()
+            db.add_all(QuestionOption(question_id=question.question_id, option_text=letter, is_correct=letter == "A")
+                       for letter in "ABCD")
+    db.commit()
+    return exam.exam_id
+
+
+def count_queries(Session, view, exam_id: int, verbose: bool) -> int:
+    db = Session()
+    try:
+        try:
+            with sql_profiling.assert_max_queries(QUERY_LIMIT) as stats:
+                asyncio.run(view(exam_id, db))
+        except AssertionError:
+            pass  # over the limit; the count still goes into the comparison
+        if verbose:
+            for statement in stats.statements:
+                print(f"      {sql_profiling.fingerprint(statement)[:120]}")
+        return stats.count
+    finally:
+        db.close()
+
+
+def run_checks(Session, small: int, large: int, verbose: bool) -> bool:
+    db = Session()
+    try:
+        exams = {
+            (section_type, size): build_exam(db, section_type, size)
+            for section_type in PARTS for size in (small, large)
+        }
+    finally:
+        db.close()
+
+    ok = True
+    for label, (section_type, view) in VIEWS.items():
+        counts = [count_queries(Session, view, exams[section_type, size], verbose) for size in (small, large)]
+        passed = counts[0] == counts[1]
+        ok = ok and passed
+        print(f"{'ok  ' if passed else 'FAIL'} {label:<18} {small} questions: {counts[0]} queries, "
+              f"{large} questions: {counts[1]} queries")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--small", type=int, default=4)
+    parser.add_argument("--large", type=int, default=40)
+    parser.add_argument("--database-url", default="sqlite:///check_exam_tree.db")
+    parser.add_argument("--verbose", action="store_true", help="print each view's statements")
+    args = parser.parse_args()
+
+    sqlite = args.database_url.startswith("sqlite")
+    engine = create_engine(args.database_url)
+    Base.metadata.create_all(engine)
+    # The profiling hooks go on app.database.engine; count this one instead.
+    sql_profiling.engine = engine
+    try:
+        ok = run_checks(sessionmaker(bind=engine), args.small, args.large, args.verbose)
+    finally:
+        engine.dispose()
+        if sqlite:
+            os.remove(args.database_url[len("sqlite:///"):])
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
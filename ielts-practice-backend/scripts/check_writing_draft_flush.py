@@ -0,0 +1,190 @@
+"""Check that the writing draft flusher never overwrites a submitted essay.
+
+Drives app/utils/writing_drafts.py against a real Redis and a scratch
+database, with the race from the write-behind design forced to happen: the
+flusher has popped a draft and read its text from Redis, then the student
+submits (the final text is committed directly) before the flusher's own
+MySQL write runs. Checked:
+
+  first flush       a draft with no saved answer is inserted
+  first submit      a submit that inserts the answer mid-flush keeps its text,
+                    in the only row for that task
+  later flush       a newer draft replaces the one flushed before it
+  submit mid-flush  the submitted text survives the stale draft's write
+  evaluated         an AI-evaluated essay is never replaced by a draft
+
+flush_dirty pops from the shared writing_drafts:dirty set, so point
+--redis-url at a database nothing else uses (the default is db 15).
+
+Usage (from ielts-practice-backend/):
+  python -m scripts.check_writing_draft_flush [--redis-url redis://localhost:6379/15] \\
+      [--database-url sqlite:///check_drafts.db]
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import scripts.generate_load_dataset  # noqa: F401  SQLite type shims
+from app.database import Base
+from app.models.models import User, WritingAnswer, WritingTask
+from app.utils import writing_drafts
+from app.utils.redis_cache import cache
+
+
+def setup(Session):
+    """A student and two tasks; returns (user_id, task_id, other_task_id)."""
+    db = Session()
+    try:
+        stamp = time.time_ns()
+        user = User(username=f"draft_check_{stamp}", email=f"d{stamp}@check.local", role="student")
+        tasks = [WritingTask(part_number=part, task_type="essay", instructions="Discuss.", word_limit=250)
+                 for part in (1, 2)]
+        db.add_all([user, *tasks])
+        db.commit()
+        return user.user_id, tasks[0].task_id, tasks[1].task_id
+    finally:
+        db.close()
+
+
+def saved_answer(Session, user_id: int, task_id: int) -> WritingAnswer:
+    db = Session()
+    try:
+        return db.query(WritingAnswer).filter(
+            WritingAnswer.user_id == user_id, WritingAnswer.task_id == task_id
+        ).one_or_none()
+    finally:
+        db.close()
+
+
+def answer_rows(Session, user_id: int, task_id: int) -> int:
+    db = Session()
+    try:
+        return db.query(WritingAnswer).filter(
+            WritingAnswer.user_id == user_id, WritingAnswer.task_id == task_id
+        ).count()
+    finally:
+        db.close()
+
+
+def direct_insert(Session, user_id: int, task_id: int, text: str):
+    """What a first submit does when there is no saved answer yet."""
+    db = Session()
+    try:
+        now = writing_drafts._now()
+        db.add(WritingAnswer(task_id=task_id, user_id=user_id, answer_text=text, score=0,
+                             created_at=now, updated_at=now))
+        db.commit()
+    finally:
+        db.close()
+
+
+def direct_write(Session, user_id: int, task_id: int, text: str, evaluated: bool = False):
+    """What submit (or AI evaluation) does: write the final text and commit."""
+    db = Session()
+    try:
+        answer = db.query(WritingAnswer).filter(
+            WritingAnswer.user_id == user_id, WritingAnswer.task_id == task_id
+        ).one()
+        answer.answer_text = text
+        answer.is_ai_evaluated = evaluated
+        answer.updated_at = writing_drafts._now()
+        db.commit()
+    finally:
+        db.close()
+
+
+async def save_draft(user_id: int, task_id: int, text: str):
+    current = await writing_drafts.get_draft(user_id, task_id)
+    await writing_drafts.apply_update(
+        user_id, task_id, current["version"] if current else 0, "check", lambda: "", text=text,
+    )
+
+
+async def flush_with_write_before(before=None):
+    """flush_dirty, running `before` after the drafts were read from Redis and
+    before the flusher writes them (the window a submit can fall into)."""
+    write_answers = writing_drafts._write_answers
+
+    def interleaved(drafts):
+        if before:
+            before()
+        write_answers(drafts)
+
+    writing_drafts._write_answers = interleaved
+    try:
+        while await writing_drafts.flush_dirty() == writing_drafts.FLUSH_BATCH:
+            pass
+    finally:
+        writing_drafts._write_answers = write_answers
+
+
+async def run_checks(Session) -> bool:
+    user_id, task_id, other_task_id = setup(Session)
+    checks = {}
+
+    await save_draft(user_id, task_id, "first draft")
+    await flush_with_write_before()
+    answer = saved_answer(Session, user_id, task_id)
+    checks["first flush inserts the draft"] = answer is not None and answer.answer_text == "first draft"
+
+    await save_draft(user_id, task_id, "second draft")
+    await flush_with_write_before()
+    checks["later flush replaces the earlier one"] = saved_answer(Session, user_id, task_id).answer_text == "second draft"
+
+    await save_draft(user_id, task_id, "stale draft")
+    await flush_with_write_before(lambda: direct_write(Session, user_id, task_id, "submitted essay"))
+    await writing_drafts.discard_drafts(user_id, [task_id])
+    checks["submit during a flush keeps the submitted text"] = \
+        saved_answer(Session, user_id, task_id).answer_text == "submitted essay"
+
+    await save_draft(user_id, other_task_id, "stale first draft")
+    await flush_with_write_before(lambda: direct_insert(Session, user_id, other_task_id, "first submitted essay"))
+    await writing_drafts.discard_drafts(user_id, [other_task_id])
+    checks["first submit during a flush keeps its text in one row"] = \
+        answer_rows(Session, user_id, other_task_id) == 1 and \
+        saved_answer(Session, user_id, other_task_id).answer_text == "first submitted essay"
+
+    direct_write(Session, user_id, task_id, "evaluated essay", evaluated=True)
+    await save_draft(user_id, task_id, "draft after evaluation")
+    await flush_with_write_before()
+    checks["an evaluated essay is not replaced"] = saved_answer(Session, user_id, task_id).answer_text == "evaluated essay"
+
+    await writing_drafts.discard_drafts(user_id, [task_id])
+    for label, ok in checks.items():
+        print(f"{'ok  ' if ok else 'FAIL'} {label}")
+    return all(checks.values())
+
+
+async def run(args) -> bool:
+    cache.redis_url = args.redis_url
+    await cache.connect()
+    if not cache.redis_client:
+        raise SystemExit(f"Redis is not reachable at {args.redis_url}")
+    sqlite = args.database_url.startswith("sqlite")
+    engine = create_engine(args.database_url)
+    Base.metadata.create_all(engine)
+    writing_drafts.SessionLocal = sessionmaker(bind=engine)
+    try:
+        return await run_checks(writing_drafts.SessionLocal)
+    finally:
+        await cache.disconnect()
+        engine.dispose()
+        if sqlite:
+            os.remove(args.database_url[len("sqlite:///"):])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15")
+    parser.add_argument("--database-url", default="sqlite:///check_drafts.db")
+    args = parser.parse_args()
+    if not asyncio.run(run(args)):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Backfill for app/utils/inline_images.py: move base64 images already stored
+in writing tasks, announcements, questions and reading passages into the
+static content store, and compute every writing task's thumbnail_url.
+
+Idempotent: rows without data URIs are left untouched (writing tasks still get
+their thumbnail checked), and the store is content-addressed. Each batch is
+committed on its own, together with a content-version bump for the exams it
+touched so cached student payloads pick up the lighter HTML.
+
+Run from ielts-practice-backend/ (static/ is resolved relative to it):
+  python -m scripts.extract_inline_images [--batch-size 100]
+"""
+import argparse
+
+from app.database import SessionLocal
+from app.models.models import Announcement, ExamSection, Question, ReadingPassage, WritingTask
+from app.utils.exam_content import mark_exam_content_changed
+from app.utils.inline_images import externalize_row
+
+# model -> (primary key column, how to find the exam a row belongs to)
+TARGETS = [
+    (WritingTask, WritingTask.task_id, lambda db, rows: {row.test_id for row in rows}),
+    (Announcement, Announcement.announcement_id, None),
+    (Question, Question.question_id, lambda db, rows: _exams_of_sections(db, rows)),
+    (ReadingPassage, ReadingPassage.passage_id, lambda db, rows: _exams_of_sections(db, rows)),
+]
+
+
+def _exams_of_sections(db, rows):
+    section_ids = {row.section_id for row in rows}
+    return {exam_id for (exam_id,) in db.query(ExamSection.exam_id).filter(
+        ExamSection.section_id.in_(section_ids)
+    ).all()}
+
+
+def backfill(db, model, pk, exams_of, batch_size: int) -> int:
+    changed_total = 0
+    last_id = 0
+    while True:
+        rows = db.query(model).filter(pk > last_id).order_by(pk).limit(batch_size).all()
+        if not rows:
+            return changed_total
+        last_id = getattr(rows[-1], pk.key)
+        changed = [row for row in rows if externalize_row(row)]
+        if changed and exams_of:
+            for exam_id in exams_of(db, changed):
+                if exam_id:
+                    mark_exam_content_changed(db, exam_id)
+        db.commit()
+        db.expunge_all()  # batches carry large HTML; don't keep them around
+        changed_total += len(changed)
+        print(f"  {model.__tablename__}: up to id {last_id}, {changed_total} rows updated")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        for model, pk, exams_of in TARGETS:
+            updated = backfill(db, model, pk, exams_of, args.batch_size)
+            print(f"{model.__tablename__}: {updated} rows updated")
+    except Exception as e:
+        db.rollback()
+        print(f"Error extracting inline images: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
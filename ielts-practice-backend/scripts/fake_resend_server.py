@@ -0,0 +1,141 @@
+"""Local stand-in for the Resend API, for broadcast/transactional load tests.
+
+Accepts POST /emails and POST /emails/batch like Resend, enforces a request
+rate limit (429 + Retry-After, as Resend does), adds configurable latency and
+random failures, and exposes counters on GET /stats.
+
+Usage (from ielts-practice-backend/):
+  python -m scripts.fake_resend_server --port 8025 --rate 2 --latency-ms 80
+
+Then point the backend at it:
+  RESEND_API_BASE=http://127.0.0.1:8025 RESEND_API_KEY=test RESEND_MARKETING=1
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from uuid import uuid4
+
+
+class FakeResendState:
+    def __init__(self, rate: float, latency_ms: int, fail_rate: float):
+        self.rate = rate
+        self.latency = latency_ms / 1000.0
+        self.fail_rate = fail_rate
+        self.lock = threading.Lock()
+        self.window_start = time.monotonic()
+        self.window_count = 0
+        self.requests = 0
+        self.emails = 0
+        self.rate_limited = 0
+        self.failed = 0
+        self.started = time.monotonic()
+
+    def admit(self) -> bool:
+        """Fixed 1-second window limiter (rate <= 0 disables it)."""
+        if self.rate <= 0:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= 1.0:
+                self.window_start = now
+                self.window_count = 0
+            if self.window_count >= self.rate:
+                self.rate_limited += 1
+                return False
+            self.window_count += 1
+            return True
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            return {
+                "requests": self.requests,
+                "emails": self.emails,
+                "rate_limited": self.rate_limited,
+                "failed": self.failed,
+                "elapsed_seconds": round(elapsed, 3),
+                "emails_per_second": round(self.emails / elapsed, 2) if elapsed else 0,
+            }
+
+
+def make_handler(state: FakeResendState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, code: int, body, headers=None):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                return self._reply(200, state.snapshot())
+            self._reply(404, {"message": "not found"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"null")
+            if self.path not in ("/emails", "/emails/batch"):
+                return self._reply(404, {"message": "not found"})
+            if not self.headers.get("Authorization", "").startswith("Bearer "):
+                return self._reply(401, {"message": "missing api key"})
+            if not state.admit():
+                return self._reply(429, {"message": "rate limit exceeded"}, {"Retry-After": "1"})
+            if state.latency:
+                time.sleep(state.latency)
+            messages = payload if self.path == "/emails/batch" else [payload]
+            with state.lock:
+                state.requests += 1
+                if random.random() < state.fail_rate:
+                    state.failed += 1
+                    failed = True
+                else:
+                    state.emails += len(messages)
+                    failed = False
+            if failed:
+                return self._reply(500, {"message": "injected failure"})
+            if self.path == "/emails":
+                return self._reply(200, {"id": uuid4().hex})
+            self._reply(200, {"data": [{"id": uuid4().hex} for _ in messages]})
+
+    return Handler
+
+
+def start_server(port: int = 0, rate: float = 2, latency_ms: int = 80, fail_rate: float = 0.0):
+    """Start the fake API in a daemon thread; returns (server, state, base_url)."""
+    state = FakeResendState(rate, latency_ms, fail_rate)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--rate", type=float, default=2, help="requests/second before 429 (0 = unlimited)")
+    parser.add_argument("--latency-ms", type=int, default=80)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    args = parser.parse_args()
+
+    server, _, url = start_server(args.port, args.rate, args.latency_ms, args.fail_rate)
+    print(f"Fake Resend API listening on {url} (stats at {url}/stats)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Local SMTP sink for outbox tests and benchmarks (nothing is delivered).
+
+Speaks enough SMTP for smtplib (EHLO/HELO, AUTH, MAIL, RCPT, DATA, RSET,
+NOOP, QUIT), accepts any credentials, and counts connections and messages.
+--handshake-ms delays the greeting and AUTH to stand in for the TCP + TLS +
+login cost of a real provider; --latency-ms delays each accepted message.
+
+Usage (from ielts-practice-backend/):
+  python -m scripts.fake_smtp_server --port 8026 --handshake-ms 150 --latency-ms 20
+
+Then point the backend at it (and leave RESEND_API_KEY unset):
+  EMAIL_HOST=127.0.0.1 EMAIL_PORT=8026 EMAIL_USERNAME=test EMAIL_PASSWORD=test
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+
+class FakeSmtpState:
+    def __init__(self, handshake_ms: int, latency_ms: int):
+        self.handshake = handshake_ms / 1000.0
+        self.latency = latency_ms / 1000.0
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = 0
+        self.recipients = []
+        self.started = time.monotonic()
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            return {
+                "connections": self.connections,
+                "messages": self.messages,
+                "elapsed_seconds": round(elapsed, 3),
+            }
+
+
+def make_handler(state: FakeSmtpState):
+    class Handler(socketserver.StreamRequestHandler):
+        def _reply(self, line: str):
+            self.wfile.write(f"{line}\r\n".encode())
+            self.wfile.flush()
+
+        def handle(self):
+            with state.lock:
+                state.connections += 1
+            if state.handshake:
+                time.sleep(state.handshake)
+            self._reply("220 fake-smtp ready")
+            rcpts = []
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return
+                command = line.decode(errors="replace").strip()
+                verb = command.split(" ", 1)[0].upper()
+                if verb == "EHLO":
+                    self.wfile.write(b"250-fake-smtp\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n")
+                    self.wfile.flush()
+                elif verb == "HELO":
+                    self._reply("250 fake-smtp")
+                elif verb == "AUTH":
+                    if state.handshake:
+                        time.sleep(state.handshake)
+                    if command.upper().startswith("AUTH LOGIN") and len(command.split()) == 2:
+                        self._reply("334 VXNlcm5hbWU6")
+                        self.rfile.readline()
+                        self._reply("334 UGFzc3dvcmQ6")
+                        self.rfile.readline()
+                    self._reply("235 2.7.0 Authentication successful")
+                elif verb == "MAIL":
+                    rcpts = []
+                    self._reply("250 OK")
+                elif verb == "RCPT":
+                    rcpts.append(command.split(":", 1)[-1].strip(" <>"))
+                    self._reply("250 OK")
+                elif verb == "DATA":
+                    self._reply("354 End data with <CR><LF>.<CR><LF>")
+                    while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                        pass
+                    if state.latency:
+                        time.sleep(state.latency)
+                    with state.lock:
+                        state.messages += 1
+                        state.recipients.extend(rcpts)
+                    self._reply("250 OK queued")
+                elif verb in ("RSET", "NOOP"):
+                    self._reply("250 OK")
+                elif verb == "QUIT":
+                    self._reply("221 Bye")
+                    return
+                else:
+                    self._reply("502 Command not implemented")
+
+    return Handler
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start_server(port: int = 0, handshake_ms: int = 150, latency_ms: int = 20):
+    """Start the sink in a daemon thread; returns (server, state, host, port)."""
+    state = FakeSmtpState(handshake_ms, latency_ms)
+    server = _Server(("127.0.0.1", port), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state, "127.0.0.1", server.server_address[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8026)
+    parser.add_argument("--handshake-ms", type=int, default=150, help="greeting/AUTH delay per connection")
+    parser.add_argument("--latency-ms", type=int, default=20, help="delay per accepted message")
+    args = parser.parse_args()
+
+    server, state, host, port = start_server(args.port, args.handshake_ms, args.latency_ms)
+    print(f"Fake SMTP sink listening on {host}:{port}")
+    try:
+        while True:
+            time.sleep(10)
+            print(state.snapshot())
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+"""Scripted load test against a running API, seeded by generate_load_dataset.
+
+Virtual users (--concurrency) loop over weighted scenarios until --duration
+runs out:
+
+  exam_flow          start a listening exam, send heartbeats, submit answers
+  forecast_browsing  listening/writing forecast lists and a forecast history
+  writing_autosave   open the writing tasks, autosave a growing draft as deltas
+  teacher_board      a teacher polling the realtime board and class list
+  login_burst        --burst-size simultaneous logins (bcrypt + session rows)
+
+Every request is recorded under its route template ("GET /student/exam/{id}/start").
+The report has throughput, p50/p90/p99/max and errors per endpoint and is
+written as JSON (--output) together with the git commit, so runs on different
+commits can be compared:
+
+  python -m scripts.load_test --compare results-main.json --output results-branch.json
+
+--compare prints the per-endpoint p50/p99/throughput change against the
+baseline and exits non-zero if any p99 got more than --max-regression percent
+slower.
+
+Tokens: with --secret-key (or SECRET_KEY in the environment) tokens are
+minted locally for the manifest users, as the API does, so only login_burst
+pays for bcrypt; otherwise each virtual user logs in once.
+
+Usage (from ielts-practice-backend/):
+  python -m scripts.load_test --base-url http://127.0.0.1:8000 --manifest loadtest_manifest.json \\
+      --duration 60 --concurrency 50 [--scenarios exam_flow=3,login_burst=1]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+
+DEFAULT_WEIGHTS = {
+    "exam_flow": 30,
+    "forecast_browsing": 25,
+    "writing_autosave": 20,
+    "teacher_board": 15,
+    "login_burst": 10,
+}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.iterations = defaultdict(int)
+        self.failed_iterations = defaultdict(int)
+
+    async def request(self, client, name, method, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            response, status = None, type(e).__name__
+        self.latencies[name].append((time.perf_counter() - started) * 1000)
+        self.statuses[name][str(status)] += 1
+        if response is None or response.status_code >= 400:
+            self.errors[name] += 1
+        return response
+
+    def report(self, elapsed):
+        endpoints = {}
+        for name, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            endpoints[name] = {
+                "requests": len(values),
+                "errors": self.errors[name],
+                "throughput_rps": round(len(values) / elapsed, 2),
+                "mean_ms": round(sum(values) / len(values), 2),
+                "p50_ms": round(percentile(values, 0.50), 2),
+                "p90_ms": round(percentile(values, 0.90), 2),
+                "p99_ms": round(percentile(values, 0.99), 2),
+                "max_ms": round(values[-1], 2),
+                "statuses": dict(self.statuses[name]),
+            }
+        scenarios = {
+            name: {"iterations": count, "failed": self.failed_iterations[name]}
+            for name, count in sorted(self.iterations.items())
+        }
+        return endpoints, scenarios
+
+
+class LoadTest:
+    def __init__(self, args, manifest):
+        self.args = args
+        self.manifest = manifest
+        self.recorder = Recorder()
+        self.rng = random.Random(args.seed)
+        self.tokens = {}
+        self.secret_key = args.secret_key
+        self.login_users = list(manifest["login_users"])
+
+    # ── auth ─────────────────────────────────────────────────────────────
+
+    async def login(self, client, username, name="POST /login"):
+        response = await self.recorder.request(
+            client, name, "POST", "/login",
+            data={"username": username, "password": self.manifest["password"]},
+        )
+        if response is not None and response.status_code == 200:
+            return response.json().get("access_token")
+        return None
+
+    async def token_for(self, client, username):
+        if username not in self.tokens:
+            if self.secret_key:
+                from jose import jwt  # same library and claims as the API
+
+                self.tokens[username] = jwt.encode(
+                    {"sub": username, "exp": int(time.time()) + 12 * 3600}, self.secret_key, algorithm="HS256"
+                )
+            else:
+                self.tokens[username] = await self.login(client, username, name="POST /login (setup)")
+        return self.tokens[username]
+
+    async def auth(self, client, pool_name):
+        username = self.rng.choice(self.manifest[pool_name])
+        token = await self.token_for(client, username)
+        return {"Authorization": f"Bearer {token}"} if token else None
+
+    async def think(self):
+        if self.args.think_ms:
+            await asyncio.sleep(self.rng.uniform(0.5, 1.5) * self.args.think_ms / 1000)
+
+    # ── scenarios ────────────────────────────────────────────────────────
+
+    async def exam_flow(self, client):
+        pool = "center_students" if self.manifest["center_students"] and self.rng.random() < 0.5 else "users"
+        headers = await self.auth(client, pool)
+        exam_id = self.rng.choice(self.manifest["listening_exams"])
+        record = self.recorder.request
+        response = await record(client, "GET /student/exam/{id}/start", "GET", f"/student/exam/{exam_id}/start", headers=headers)
+        if response is None or response.status_code != 200:
+            return False
+        question_ids = [q["question_id"] for s in response.json().get("sections", []) for q in s.get("questions", [])]
+        for done in range(0, len(question_ids), max(1, len(question_ids) // self.args.heartbeats)):
+            await self.think()
+            await record(client, "POST /student/exam/heartbeat", "POST", "/student/exam/heartbeat", headers=headers, json={
+                "exam_id": exam_id, "skill": "listening", "title": f"Exam {exam_id}",
+                "questions_done": done, "total_questions": len(question_ids), "last_question": done,
+            })
+        answers = {str(qid): self.rng.choice("abcd") for qid in question_ids}
+        response = await record(client, "POST /student/exam/{id}/submit", "POST", f"/student/exam/{exam_id}/submit",
+                                headers=headers, json=answers)
+        await record(client, "POST /student/exam/heartbeat/stop", "POST", "/student/exam/heartbeat/stop", headers=headers)
+        return response is not None and response.status_code == 200
+
+    async def forecast_browsing(self, client):
+        headers = await self.auth(client, "users")
+        record = self.recorder.request
+        ok = True
+        for name, url in (
+            ("GET /student/listening/forecasts", "/student/listening/forecasts"),
+            ("GET /student/writing/forecasts", "/student/writing/forecasts"),
+        ):
+            response = await record(client, name, "GET", url, headers=headers)
+            ok = ok and response is not None and response.status_code == 200
+            await self.think()
+        exam_id = self.rng.choice(self.manifest["listening_exams"])
+        part = self.rng.randint(1, 4)
+        response = await record(client, "GET /student/listening/forecast-history/{id}/{part}", "GET",
+                                f"/student/listening/forecast-history/{exam_id}/{part}", headers=headers)
+        return ok and response is not None and response.status_code == 200
+
+    async def writing_autosave(self, client):
+        headers = await self.auth(client, "users")
+        record = self.recorder.request
+        await record(client, "GET /student/writing/tasks", "GET", "/student/writing/tasks", headers=headers)
+        task_id = self.rng.choice(self.manifest["writing_tasks"])
+        await record(client, "GET /student/writing/tasks/{id}", "GET", f"/student/writing/tasks/{task_id}", headers=headers)
+        draft = await record(client, "GET /student/writing/tasks/{id}/draft", "GET",
+                             f"/student/writing/tasks/{task_id}/draft", headers=headers)
+        if draft is None or draft.status_code != 200:
+            return False
+        text = draft.json()["answer_text"] or ""
+        version = draft.json()["version"]
+        client_id = f"loadtest-{self.rng.random():.8f}"
+        ok = True
+        for _ in range(self.args.autosaves):
+            await self.think()
+            added = " ".join(self.rng.choice(("ielts", "essay", "argue", "people", "believe", "because")) for _ in range(25)) + ". "
+            response = await record(client, "PATCH /student/writing/tasks/{id}/draft", "PATCH",
+                                    f"/student/writing/tasks/{task_id}/draft", headers=headers,
+                                    json={"base_version": version, "client_id": client_id,
+                                          "ops": [{"at": len(text), "insert": added}],
+                                          "length": len(text) + len(added)})
+            if response is not None and response.status_code == 409:
+                # Another virtual user writes the same task: rebase on its text
+                current = response.json()["detail"]
+                text, version = current["answer_text"], current["version"]
+                continue
+            if response is not None and response.status_code == 503:
+                text += added
+                response = await record(client, "POST /student/writing/tasks/{id}/save-draft", "POST",
+                                        f"/student/writing/tasks/{task_id}/save-draft", headers=headers,
+                                        json={"answer_text": text})
+                ok = ok and response is not None and response.status_code == 200
+                continue
+            ok = ok and response is not None and response.status_code == 200
+            if ok:
+                text += added
+                version = response.json()["version"]
+        return ok
+
+    async def teacher_board(self, client):
+        if not self.manifest["teachers"]:
+            return True
+        headers = await self.auth(client, "teachers")
+        record = self.recorder.request
+        await record(client, "GET /teacher/classes", "GET", "/teacher/classes", headers=headers)
+        ok = True
+        for _ in range(self.args.board_polls):
+            response = await record(client, "GET /teacher/realtime", "GET", "/teacher/realtime", headers=headers)
+            ok = ok and response is not None and response.status_code == 200
+            await self.think()
+        return ok
+
+    async def login_burst(self, client):
+        usernames = self.rng.sample(self.login_users, min(self.args.burst_size, len(self.login_users)))
+        tokens = await asyncio.gather(*(self.login(client, username) for username in usernames))
+        return all(tokens)
+
+    # ── runner ───────────────────────────────────────────────────────────
+
+    async def virtual_user(self, client, deadline, scenarios, weights):
+        while time.monotonic() < deadline:
+            name = self.rng.choices(scenarios, weights)[0]
+            self.recorder.iterations[name] += 1
+            try:
+                ok = await getattr(self, name)(client)
+            except Exception as e:
+                print(f"{name} iteration failed: {type(e).__name__}: {e}", file=sys.stderr)
+                ok = False
+            if not ok:
+                self.recorder.failed_iterations[name] += 1
+
+    async def run(self, weights):
+        limits = httpx.Limits(max_connections=self.args.concurrency * 2, max_keepalive_connections=self.args.concurrency)
+        async with httpx.AsyncClient(base_url=self.args.base_url, limits=limits, timeout=self.args.timeout) as client:
+            started = time.monotonic()
+            deadline = started + self.args.duration
+            scenarios = list(weights)
+            await asyncio.gather(*(
+                self.virtual_user(client, deadline, scenarios, [weights[s] for s in scenarios])
+                for _ in range(self.args.concurrency)
+            ))
+            return time.monotonic() - started
+
+
+def parse_weights(spec):
+    if not spec:
+        return dict(DEFAULT_WEIGHTS)
+    weights = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        if name not in DEFAULT_WEIGHTS:
+            raise SystemExit(f"Unknown scenario {name!r}; choose from {', '.join(DEFAULT_WEIGHTS)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(endpoints, scenarios):
+    print(f"{'endpoint':<58} {'reqs':>7} {'err':>5} {'rps':>8} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}")
+    for name, row in endpoints.items():
+        print(f"{name:<58} {row['requests']:>7} {row['errors']:>5} {row['throughput_rps']:>8.1f} "
+              f"{row['p50_ms']:>8.1f} {row['p90_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['max_ms']:>8.1f}")
+    print("scenarios: " + ", ".join(f"{name} {row['iterations']} ({row['failed']} failed)" for name, row in scenarios.items()))
+
+
+def compare(baseline, endpoints, max_regression):
+    """Print the change per endpoint; returns the endpoints whose p99 regressed too much."""
+    regressions = []
+    print(f"\nvs {baseline['meta'].get('commit') or 'baseline'}:")
+    for name, row in endpoints.items():
+        before = baseline["endpoints"].get(name)
+        if not before:
+            continue
+
+        def change(key):
+            return (row[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+
+        p99_change = change("p99_ms")
+        print(f"  {name:<58} p50 {change('p50_ms'):+6.1f}%  p99 {p99_change:+6.1f}%  rps {change('throughput_rps'):+6.1f}%")
+        if p99_change > max_regression:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--manifest", default="loadtest_manifest.json")
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument("--concurrency", type=int, default=50, help="virtual users")
+    parser.add_argument("--scenarios", help="weights, e.g. exam_flow=3,login_burst=1 (default: all)")
+    parser.add_argument("--think-ms", type=float, default=200, help="mean pause between a user's steps")
+    parser.add_argument("--heartbeats", type=int, default=4, help="heartbeats per exam")
+    parser.add_argument("--autosaves", type=int, default=5, help="draft saves per writing session")
+    parser.add_argument("--board-polls", type=int, default=5, help="realtime polls per teacher session")
+    parser.add_argument("--burst-size", type=int, default=20, help="simultaneous logins per burst")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--secret-key", default=os.getenv("SECRET_KEY"), help="JWT secret to mint tokens locally")
+    parser.add_argument("--output", default="loadtest_results.json")
+    parser.add_argument("--compare", help="results JSON of a previous run")
+    parser.add_argument("--max-regression", type=float, default=20, help="allowed p99 slowdown in percent")
+    args = parser.parse_args()
+
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+    weights = parse_weights(args.scenarios)
+
+    test = LoadTest(args, manifest)
+    elapsed = asyncio.run(test.run(weights))
+    endpoints, scenarios = test.recorder.report(elapsed)
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "base_url": args.base_url,
+            "duration_s": round(elapsed, 2),
+            "concurrency": args.concurrency,
+            "weights": weights,
+            "seed": args.seed,
+        },
+        "endpoints": endpoints,
+        "scenarios": scenarios,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print_report(endpoints, scenarios)
+    print(f"results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, endpoints, args.max_regression)
+        if regressions:
+            print(f"p99 regressed more than {args.max_regression}% on: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
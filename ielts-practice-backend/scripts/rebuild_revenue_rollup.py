@@ -0,0 +1,29 @@
+"""Rebuild the revenue_daily rollup from package_transactions and
+center_wallet_transactions (see app/utils/revenue_rollup.py).
+
+Safe to run at any time; the rebuild happens in one transaction, so the
+dashboards see either the old rows or the new ones.
+
+Usage (from ielts-practice-backend/):
+  python -m scripts.rebuild_revenue_rollup
+"""
+from app.database import SessionLocal
+from app.utils.revenue_rollup import rebuild_revenue_rollup
+
+
+def main():
+    db = SessionLocal()
+    try:
+        rows = rebuild_revenue_rollup(db)
+        db.commit()
+        print(f"revenue_daily rebuilt: {rows} day rows")
+    except Exception as e:
+        db.rollback()
+        print(f"Error rebuilding revenue_daily: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
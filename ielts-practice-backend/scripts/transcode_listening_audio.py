@@ -0,0 +1,62 @@
+"""Backfill for app/utils/audio_renditions.py: build the loudness-normalized
+64/96 kbps MP3 and HLS renditions of listening audio uploaded before them (or
+whose background transcode failed), and record each part's audio_digest.
+
+Idempotent: parts that already have a digest whose files exist are skipped
+(unless --force), and files are content-addressed, so parts sharing the same
+audio (cloned exams) are transcoded once. Each part is committed on its own,
+with at most one audio blob in memory at a time (parts uploaded since
+app/utils/uploads.py are read by ffmpeg from their file). Needs ffmpeg on PATH.
+
+Run from ielts-practice-backend/ (static/ is resolved relative to it):
+  python -m scripts.transcode_listening_audio [--exam-id 12] [--force]
+"""
+import argparse
+import time
+
+from sqlalchemy import func, or_
+
+from app.database import SessionLocal
+from app.models.models import ExamSection, ListeningMedia
+from app.utils.audio_renditions import renditions_exist, transcode_media
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--exam-id", type=int, help="only this exam's parts")
+    parser.add_argument("--force", action="store_true", help="rebuild parts that already have renditions")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        query = db.query(ListeningMedia.media_id, ListeningMedia.audio_digest).filter(
+            or_(ListeningMedia.audio_path.isnot(None), func.length(ListeningMedia.audio_file) > 0)
+        )
+        if args.exam_id:
+            query = query.join(ExamSection).filter(ExamSection.exam_id == args.exam_id)
+        todo = [
+            (media_id, digest) for media_id, digest in query.order_by(ListeningMedia.media_id)
+            if args.force or not (digest and renditions_exist(digest))
+        ]
+        print(f"{len(todo)} listening parts to transcode")
+
+        done = failed = 0
+        rebuilt = set()  # with --force, shared audio is still rebuilt only once
+        started = time.time()
+        for media_id, digest in todo:
+            try:
+                digest = transcode_media(db, media_id, force=args.force and digest not in rebuilt)
+                rebuilt.add(digest)
+                done += 1
+                print(f"  media {media_id}: {digest}")
+            except Exception as e:
+                db.rollback()
+                failed += 1
+                print(f"  media {media_id}: FAILED {e}")
+        print(f"{done} transcoded, {failed} failed in {time.time() - started:.0f}s")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()